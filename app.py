@@ -2,24 +2,25 @@ import streamlit as st
 from openai import OpenAI
 import dotenv
 import os
-from PIL import Image
 from audio_recorder_streamlit import audio_recorder
-import base64
-from io import BytesIO
 import json
 import datetime
 import random
 import hashlib
+import uuid
 import requests
 import time
 
+from database.storage import create_storage_backend
+from database.blob_store import BlobStore
+from database.profiler import QueryProfiler
+from database.scheduler import schedule_backups, schedule_maintenance
+from utils import ConfigManager, DateUtils
+
 dotenv.load_dotenv()
 
-# Đường dẫn file lưu trữ dữ liệu
-FAMILY_DATA_FILE = "family_data.json"
-EVENTS_DATA_FILE = "events_data.json"
-NOTES_DATA_FILE = "notes_data.json"
-CHAT_HISTORY_FILE = "chat_history.json"
+# Đường dẫn lưu ảnh trong tin nhắn (theo hash nội dung); dữ liệu khác do backend lưu trữ quản lý
+BLOB_DIR = "blobs"
 
 
 
@@ -282,38 +283,25 @@ def generate_dynamic_suggested_questions(api_key, member_id=None, max_questions=
     
     # Xác định trạng thái người dùng hiện tại
     member_info = {}
-    if member_id and member_id in family_data:
-        member = family_data[member_id]
+    member = storage.get_family_member(member_id) if member_id else None
+    if member:
         member_info = {
             "name": member.get("name", ""),
             "age": member.get("age", ""),
             "preferences": member.get("preferences", {})
         }
     
-    # Thu thập dữ liệu về các sự kiện sắp tới
-    upcoming_events = []
-    today = datetime.datetime.now().date()
-    
-    for event_id, event in events_data.items():
-        try:
-            event_date = datetime.datetime.strptime(event.get("date", ""), "%Y-%m-%d").date()
-            if event_date >= today:
-                date_diff = (event_date - today).days
-                if date_diff <= 14:  # Chỉ quan tâm sự kiện trong 2 tuần tới
-                    upcoming_events.append({
-                        "title": event.get("title", ""),
-                        "date": event.get("date", ""),
-                        "days_away": date_diff
-                    })
-        except Exception as e:
-            logger.error(f"Lỗi khi xử lý ngày sự kiện: {e}")
-            continue
+    # Thu thập dữ liệu về các sự kiện sắp tới (chỉ truy vấn 2 tuần tới)
+    upcoming_events = [
+        {"title": event["title"], "date": event["date"], "days_away": event["days_away"]}
+        for event in DateUtils.get_upcoming_events(storage, days_ahead=14)
+    ]
     
     # Lấy dữ liệu về chủ đề từ lịch sử trò chuyện gần đây
     recent_topics = []
-    if member_id and member_id in chat_history and chat_history[member_id]:
-        # Lấy tối đa 3 cuộc trò chuyện gần nhất
-        recent_chats = chat_history[member_id][:3]
+    if member_id:
+        # Lấy tối đa 3 cuộc trò chuyện gần nhất (chỉ cần chỉ mục, không cần tin nhắn)
+        recent_chats = storage.get_chat_summaries(member_id, limit=3)
         
         for chat in recent_chats:
             summary = chat.get("summary", "")
@@ -495,8 +483,8 @@ def generate_dynamic_suggested_questions(api_key, member_id=None, max_questions=
         }
         
         # Thay thế các biến bằng thông tin cá nhân nếu có
-        if member_id and member_id in family_data:
-            preferences = family_data[member_id].get("preferences", {})
+        if member:
+            preferences = member.get("preferences", {})
             
             if preferences.get("food"):
                 replacements["food"].insert(0, preferences["food"])
@@ -546,8 +534,8 @@ def generate_dynamic_suggested_questions(api_key, member_id=None, max_questions=
         user_preferences = {}
         
         # Phân tích sở thích người dùng
-        if member_id and member_id in family_data:
-            preferences = family_data[member_id].get("preferences", {})
+        if member:
+            preferences = member.get("preferences", {})
             user_preferences = preferences
             
             # Ưu tiên các chủ đề dựa trên sở thích
@@ -671,87 +659,67 @@ def get_date_from_relative_term(term):
     
     return None
 
-# Tải dữ liệu ban đầu
-def load_data(file_path):
-    if os.path.exists(file_path):
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                # Đảm bảo dữ liệu là một từ điển
-                if not isinstance(data, dict):
-                    print(f"Dữ liệu trong {file_path} không phải từ điển. Khởi tạo lại.")
-                    return {}
-                return data
-        except Exception as e:
-            print(f"Lỗi khi đọc {file_path}: {e}")
-            return {}
-    return {}
-
-def save_data(file_path, data):
+# Backend lưu trữ dùng chung cho mọi phiên (JSON, SQLite hoặc bộ nhớ, chọn qua cấu hình)
+def load_app_secrets():
     try:
-        # Đảm bảo thư mục tồn tại
-        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-        logger.info(f"Đã lưu dữ liệu vào {file_path}: {len(data)} mục")
-        return True
-    except Exception as e:
-        logger.error(f"Lỗi khi lưu dữ liệu vào {file_path}: {e}")
-        st.error(f"Không thể lưu dữ liệu: {e}")
-        return False
-
-# Kiểm tra và đảm bảo cấu trúc dữ liệu đúng
-def verify_data_structure():
-    global family_data, events_data, notes_data, chat_history
-    
-    # Đảm bảo tất cả dữ liệu là từ điển
-    if not isinstance(family_data, dict):
-        print("family_data không phải từ điển. Khởi tạo lại.")
-        family_data = {}
-        
-    if not isinstance(events_data, dict):
-        print("events_data không phải từ điển. Khởi tạo lại.")
-        events_data = {}
-        
-    if not isinstance(notes_data, dict):
-        print("notes_data không phải từ điển. Khởi tạo lại.")
-        notes_data = {}
-        
-    if not isinstance(chat_history, dict):
-        print("chat_history không phải từ điển. Khởi tạo lại.")
-        chat_history = {}
-    
-    # Kiểm tra và sửa các dữ liệu thành viên
-    members_to_fix = []
-    for member_id, member in family_data.items():
-        if not isinstance(member, dict):
-            members_to_fix.append(member_id)
-    
-    # Xóa các mục không hợp lệ
-    for member_id in members_to_fix:
-        del family_data[member_id]
-        
-    # Lưu lại dữ liệu đã sửa
-    save_data(FAMILY_DATA_FILE, family_data)
-    save_data(EVENTS_DATA_FILE, events_data)
-    save_data(NOTES_DATA_FILE, notes_data)
-    save_data(CHAT_HISTORY_FILE, chat_history)
-
-# Tải dữ liệu ban đầu
-family_data = load_data(FAMILY_DATA_FILE)
-events_data = load_data(EVENTS_DATA_FILE)
-notes_data = load_data(NOTES_DATA_FILE)
-chat_history = load_data(CHAT_HISTORY_FILE)  # Tải lịch sử chat
-
-# Kiểm tra và sửa cấu trúc dữ liệu
-verify_data_structure()
-
-# Hàm chuyển đổi hình ảnh sang base64
-def get_image_base64(image_raw):
-    buffered = BytesIO()
-    image_raw.save(buffered, format=image_raw.format)
-    img_byte = buffered.getvalue()
-    return base64.b64encode(img_byte).decode('utf-8')
+        streamlit_secrets = dict(st.secrets)
+    except Exception:
+        streamlit_secrets = None
+    return ConfigManager.load_secrets(streamlit_secrets)
+
+@st.cache_resource
+def get_storage():
+    secrets = load_app_secrets()
+    logger.info(f"Sử dụng backend lưu trữ: {secrets['storage_backend']}")
+    return create_storage_backend(secrets["storage_backend"], secrets["db_path"], secrets["data_dir"],
+                                  synchronous=secrets["db_synchronous"], compression=secrets["db_compression"])
+
+# Bộ đo hiệu năng database, chỉ gắn khi có cấu hình ngưỡng truy vấn chậm (DB_SLOW_QUERY_MS)
+@st.cache_resource
+def get_profiler():
+    slow_ms = load_app_secrets()["db_slow_query_ms"]
+    if not slow_ms:
+        return None
+    return QueryProfiler(slow_ms=float(slow_ms)).attach(get_storage())
+
+# Sao lưu định kỳ (chỉ với backend SQLite, khi có cấu hình DB_BACKUP_DIR)
+@st.cache_resource
+def get_backup_job():
+    secrets = load_app_secrets()
+    backend = get_storage()
+    if not secrets["db_backup_dir"] or not hasattr(backend, "backup"):
+        return None
+    return schedule_backups(backend, secrets["db_backup_dir"],
+                            interval=float(secrets["db_backup_interval_hours"]) * 3600,
+                            keep=int(secrets["db_backup_keep"]))
+
+# Bảo trì định kỳ: xóa dữ liệu hết hạn lưu trữ và trả lại trang trống (chỉ với backend SQLite)
+@st.cache_resource
+def get_maintenance_job():
+    secrets = load_app_secrets()
+    backend = get_storage()
+    interval_hours = float(secrets["db_maintenance_interval_hours"])
+    if interval_hours <= 0 or not hasattr(backend, "run_maintenance"):
+        return None
+    chat_days, event_days = secrets["db_chat_retention_days"], secrets["db_event_retention_days"]
+    return schedule_maintenance(backend, interval=interval_hours * 3600,
+                                chat_retention_days=int(chat_days) if chat_days else None,
+                                event_retention_days=int(event_days) if event_days else None,
+                                changes_retention_days=float(secrets["db_changes_retention_days"]))
+
+storage = get_storage()
+profiler = get_profiler()
+backup_job = get_backup_job()
+maintenance_job = get_maintenance_job()
+
+blob_store = BlobStore.get(BLOB_DIR)
+
+# Hàm lấy URL ảnh để gửi cho mô hình (dựng lại data URL từ kho ảnh khi cần)
+def get_image_request_url(image_url):
+    url = image_url["url"]
+    if BlobStore.is_ref(url):
+        return blob_store.to_data_url(url, image_url.get("mime_type", "image/jpeg"))
+    return url
 
 # Hàm tạo tóm tắt lịch sử chat
 def generate_chat_summary(messages, api_key):
@@ -792,27 +760,11 @@ def generate_chat_summary(messages, api_key):
         return "Không thể tạo tóm tắt vào lúc này."
 
 # Hàm lưu lịch sử trò chuyện cho người dùng hiện tại
-def save_chat_history(member_id, messages, summary=None):
+def save_chat_history(member_id, messages, summary=None, conversation_id=None):
     """Lưu lịch sử chat cho một thành viên cụ thể"""
-    if member_id not in chat_history:
-        chat_history[member_id] = []
-    
-    # Tạo bản ghi mới
-    history_entry = {
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "messages": messages,
-        "summary": summary if summary else ""
-    }
-    
-    # Thêm vào lịch sử và giới hạn số lượng
-    chat_history[member_id].insert(0, history_entry)  # Thêm vào đầu danh sách
-    
-    # Giới hạn lưu tối đa 10 cuộc trò chuyện gần nhất
-    if len(chat_history[member_id]) > 10:
-        chat_history[member_id] = chat_history[member_id][:10]
-    
-    # Lưu vào file
-    save_data(CHAT_HISTORY_FILE, chat_history)
+    # Backend chỉ ghi các tin nhắn mới của cuộc trò chuyện
+    if not storage.save_chat_history(member_id, messages, summary, conversation_id):
+        logger.error(f"Không thể lưu lịch sử chat cho thành viên ID={member_id}")
 
 # Phát hiện câu hỏi cần search thông tin thực tế
 def detect_search_intent(query, api_key):
@@ -916,9 +868,14 @@ def stream_llm_response(api_key, system_prompt="", current_member=None):
             # Thêm hình ảnh và văn bản vào tin nhắn
             message_content = []
             for image in images:
+                try:
+                    image_url = get_image_request_url(image["image_url"])
+                except Exception as e:
+                    logger.error(f"Không thể đọc ảnh {image['image_url'].get('url', '')[:80]}: {e}")
+                    continue
                 message_content.append({
                     "type": "image_url",
-                    "image_url": {"url": image["image_url"]["url"]}
+                    "image_url": {"url": image_url}
                 })
             
             if texts:
@@ -1027,7 +984,8 @@ def stream_llm_response(api_key, system_prompt="", current_member=None):
         # Lưu lịch sử chat (không thay đổi)
         if current_member:
             summary = generate_chat_summary(st.session_state.messages, api_key)
-            save_chat_history(current_member, st.session_state.messages, summary)
+            save_chat_history(current_member, st.session_state.messages, summary,
+                              conversation_id=st.session_state.get("conversation_id"))
 
     except Exception as e:
         logger.error(f"Lỗi khi tạo phản hồi từ OpenAI: {e}", exc_info=True) # Thêm exc_info để debug dễ hơn
@@ -1038,101 +996,110 @@ def stream_llm_response(api_key, system_prompt="", current_member=None):
             "content": [{"type": "text", "text": error_message}]})
         yield error_message # Vẫn yield để UI hiển thị lỗi
 
+def find_commands(response, cmd_type):
+    """Lấy nội dung của mọi lệnh ##CMD_TYPE:...## trong phản hồi"""
+    commands = []
+    cmd_pattern = f"##{cmd_type}:"
+    cmd_start = response.find(cmd_pattern)
+    while cmd_start != -1:
+        cmd_start += len(cmd_pattern)
+        cmd_end = response.find("##", cmd_start)
+        if cmd_end == -1:
+            break
+        commands.append(response[cmd_start:cmd_end].strip())
+        cmd_start = response.find(cmd_pattern, cmd_end + 2)
+    return commands
+
+def parse_command_details(response, cmd_type):
+    """Phân tích JSON của mọi lệnh cmd_type, bỏ qua (và ghi log) các lệnh lỗi"""
+    result = []
+    for cmd in find_commands(response, cmd_type):
+        logger.info(f"Nội dung lệnh {cmd_type}: {cmd}")
+        try:
+            details = json.loads(cmd)
+            if isinstance(details, dict):
+                result.append(details)
+        except json.JSONDecodeError as e:
+            logger.error(f"Lỗi khi phân tích JSON cho {cmd_type}: {e}")
+            logger.error(f"Chuỗi JSON gốc: {cmd}")
+    return result
+
+def normalize_command_date(details):
+    """Chuyển các từ ngữ tương đối về thời gian ("ngày mai"...) thành YYYY-MM-DD"""
+    if details.get('date') and not details['date'][0].isdigit():
+        # Nếu ngày không bắt đầu bằng số, có thể là mô tả tương đối
+        relative_date = get_date_from_relative_term(details['date'].lower())
+        if relative_date:
+            details['date'] = relative_date.strftime("%Y-%m-%d")
+            logger.info(f"Đã chuyển đổi ngày thành: {details['date']}")
+    return details
+
 def process_assistant_response(response, current_member=None):
-    """Hàm xử lý lệnh từ phản hồi của trợ lý"""
+    """
+    Hàm xử lý lệnh từ phản hồi của trợ lý.
+    
+    Mọi lệnh trong một phản hồi được áp dụng trong một giao dịch: chỉ một lần
+    commit, và nếu một lệnh thất bại thì không thay đổi nào được lưu. Lệnh xóa
+    một sự kiện không còn tồn tại chỉ được ghi cảnh báo, không hủy các lệnh khác.
+    """
     try:
         logger.info(f"Xử lý phản hồi của trợ lý, độ dài: {len(response)}")
         
-        # Xử lý lệnh thêm sự kiện
-        if "##ADD_EVENT:" in response:
-            logger.info("Tìm thấy lệnh ADD_EVENT")
-            cmd_start = response.index("##ADD_EVENT:") + len("##ADD_EVENT:")
-            cmd_end = response.index("##", cmd_start)
-            cmd = response[cmd_start:cmd_end].strip()
-            
-            logger.info(f"Nội dung lệnh ADD_EVENT: {cmd}")
-            
-            try:
-                details = json.loads(cmd)
-                if isinstance(details, dict):
-                    # Xử lý các từ ngữ tương đối về thời gian
-                    logger.info(f"Đang xử lý ngày: {details.get('date', '')}")
-                    if details.get('date') and not details['date'][0].isdigit():
-                        # Nếu ngày không bắt đầu bằng số, có thể là mô tả tương đối
-                        relative_date = get_date_from_relative_term(details['date'].lower())
-                        if relative_date:
-                            details['date'] = relative_date.strftime("%Y-%m-%d")
-                            logger.info(f"Đã chuyển đổi ngày thành: {details['date']}")
-                    
-                    # Thêm thông tin về người tạo sự kiện
-                    if current_member:
-                        details['created_by'] = current_member
-                    
-                    logger.info(f"Thêm sự kiện: {details.get('title', 'Không tiêu đề')}")
-                    success = add_event(details)
-                    if success:
-                        st.success(f"Đã thêm sự kiện: {details.get('title', '')}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Lỗi khi phân tích JSON cho ADD_EVENT: {e}")
-                logger.error(f"Chuỗi JSON gốc: {cmd}")
-        
-        # Xử lý lệnh UPDATE_EVENT
-        if "##UPDATE_EVENT:" in response:
-            logger.info("Tìm thấy lệnh UPDATE_EVENT")
-            cmd_start = response.index("##UPDATE_EVENT:") + len("##UPDATE_EVENT:")
-            cmd_end = response.index("##", cmd_start)
-            cmd = response[cmd_start:cmd_end].strip()
-            
-            logger.info(f"Nội dung lệnh UPDATE_EVENT: {cmd}")
-            
-            try:
-                details = json.loads(cmd)
-                if isinstance(details, dict):
-                    # Xử lý các từ ngữ tương đối về thời gian
-                    if details.get('date') and not details['date'][0].isdigit():
-                        # Nếu ngày không bắt đầu bằng số, có thể là mô tả tương đối
-                        relative_date = get_date_from_relative_term(details['date'].lower())
-                        if relative_date:
-                            details['date'] = relative_date.strftime("%Y-%m-%d")
-                    
-                    logger.info(f"Cập nhật sự kiện: {details.get('title', 'Không tiêu đề')}")
-                    success = update_event(details)
-                    if success:
-                        st.success(f"Đã cập nhật sự kiện: {details.get('title', '')}")
-            except json.JSONDecodeError as e:
-                logger.error(f"Lỗi khi phân tích JSON cho UPDATE_EVENT: {e}")
-        
-        # Các lệnh xử lý khác tương tự
-        for cmd_type in ["ADD_FAMILY_MEMBER", "UPDATE_PREFERENCE", "DELETE_EVENT", "ADD_NOTE"]:
-            cmd_pattern = f"##{cmd_type}:"
-            if cmd_pattern in response:
-                logger.info(f"Tìm thấy lệnh {cmd_type}")
-                try:
-                    cmd_start = response.index(cmd_pattern) + len(cmd_pattern)
-                    cmd_end = response.index("##", cmd_start)
-                    cmd = response[cmd_start:cmd_end].strip()
-                    
-                    if cmd_type == "DELETE_EVENT":
-                        event_id = cmd.strip()
-                        delete_event(event_id)
-                        st.success(f"Đã xóa sự kiện!")
+        new_events = [normalize_command_date(details) for details in parse_command_details(response, "ADD_EVENT")]
+        for details in new_events:
+            # Thêm thông tin về người tạo sự kiện
+            if current_member:
+                details['created_by'] = current_member
+        event_updates = [normalize_command_date(details) for details in parse_command_details(response, "UPDATE_EVENT")]
+        new_members = parse_command_details(response, "ADD_FAMILY_MEMBER")
+        preference_updates = parse_command_details(response, "UPDATE_PREFERENCE")
+        deleted_events = [event_id for event_id in find_commands(response, "DELETE_EVENT") if event_id]
+        new_notes = parse_command_details(response, "ADD_NOTE")
+        for details in new_notes:
+            # Thêm thông tin về người tạo ghi chú
+            if current_member:
+                details['created_by'] = current_member
+        
+        if not any([new_events, event_updates, new_members, preference_updates, deleted_events, new_notes]):
+            return
+        
+        try:
+            with storage.transaction():
+                if new_events and not storage.add_events_bulk(new_events):
+                    raise ValueError("Không thể thêm sự kiện")
+                for details in event_updates:
+                    if not update_event(details):
+                        raise ValueError(f"Không thể cập nhật sự kiện ID={details.get('id')}")
+                for details in new_members:
+                    add_family_member(details)
+                if preference_updates and not update_preferences(preference_updates):
+                    raise ValueError("Không thể cập nhật sở thích")
+                deleted_count = 0
+                for event_id in deleted_events:
+                    # Lỗi ghi thật được ném ra trong giao dịch; False nghĩa là ID không tồn tại
+                    if delete_event(event_id):
+                        deleted_count += 1
                     else:
-                        details = json.loads(cmd)
-                        if isinstance(details, dict):
-                            if cmd_type == "ADD_FAMILY_MEMBER":
-                                add_family_member(details)
-                                st.success(f"Đã thêm thành viên: {details.get('name', '')}")
-                            elif cmd_type == "UPDATE_PREFERENCE":
-                                update_preference(details)
-                                st.success(f"Đã cập nhật sở thích!")
-                            elif cmd_type == "ADD_NOTE":
-                                # Thêm thông tin về người tạo ghi chú
-                                if current_member:
-                                    details['created_by'] = current_member
-                                add_note(details)
-                                st.success(f"Đã thêm ghi chú!")
-                except Exception as e:
-                    logger.error(f"Lỗi khi xử lý lệnh {cmd_type}: {e}")
+                        logger.warning(f"Không tìm thấy sự kiện ID={event_id} để xóa, bỏ qua")
+                if new_notes and not storage.add_notes_bulk(new_notes):
+                    raise ValueError("Không thể thêm ghi chú")
+        except Exception as e:
+            logger.error(f"Lỗi khi áp dụng lệnh của trợ lý, đã hủy toàn bộ thay đổi: {e}")
+            st.error("Không thể lưu thay đổi từ phản hồi của trợ lý, không có thay đổi nào được lưu.")
+            return
+        
+        for details in new_events:
+            st.success(f"Đã thêm sự kiện: {details.get('title', '')}")
+        for details in event_updates:
+            st.success(f"Đã cập nhật sự kiện: {details.get('title', '')}")
+        for details in new_members:
+            st.success(f"Đã thêm thành viên: {details.get('name', '')}")
+        if preference_updates:
+            st.success(f"Đã cập nhật sở thích!")
+        if deleted_count:
+            st.success(f"Đã xóa sự kiện!")
+        if new_notes:
+            st.success(f"Đã thêm ghi chú!")
     
     except Exception as e:
         logger.error(f"Lỗi khi xử lý phản hồi của trợ lý: {e}")
@@ -1140,103 +1107,60 @@ def process_assistant_response(response, current_member=None):
 
 # Các hàm quản lý thông tin gia đình
 def add_family_member(details):
-    member_id = details.get("id") or str(len(family_data) + 1)
-    family_data[member_id] = {
-        "name": details.get("name", ""),
-        "age": details.get("age", ""),
-        "preferences": details.get("preferences", {}),
-        "added_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_data(FAMILY_DATA_FILE, family_data)
+    """Thêm thành viên mới qua backend lưu trữ"""
+    return storage.add_family_member(details)
 
 def update_preference(details):
+    """Cập nhật một sở thích của thành viên"""
     member_id = details.get("id")
     preference_key = details.get("key")
     preference_value = details.get("value")
     
-    if member_id in family_data and preference_key:
-        if "preferences" not in family_data[member_id]:
-            family_data[member_id]["preferences"] = {}
-        family_data[member_id]["preferences"][preference_key] = preference_value
-        save_data(FAMILY_DATA_FILE, family_data)
+    if member_id and preference_key:
+        # Backend chỉ ghi thay đổi của một sở thích, không ghi lại toàn bộ dữ liệu gia đình
+        return storage.update_preference(member_id, preference_key, preference_value)
+    return False
+
+def update_preferences(commands):
+    """Cập nhật nhiều sở thích (từ một phản hồi của trợ lý), gộp theo thành viên"""
+    by_member = {}
+    for details in commands:
+        if details.get("id") and details.get("key"):
+            by_member.setdefault(str(details["id"]), {})[details["key"]] = details.get("value")
+    
+    updated = False
+    for member_id, preferences in by_member.items():
+        updated = storage.update_preferences(member_id, preferences) or updated
+    return updated
 
 def add_event(details):
     """Thêm một sự kiện mới vào danh sách sự kiện"""
-    try:
-        event_id = str(len(events_data) + 1)
-        events_data[event_id] = {
-            "title": details.get("title", ""),
-            "date": details.get("date", ""),
-            "time": details.get("time", ""),
-            "description": details.get("description", ""),
-            "participants": details.get("participants", []),
-            "created_by": details.get("created_by", ""),  # Thêm người tạo sự kiện
-            "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        save_data(EVENTS_DATA_FILE, events_data)
-        print(f"Đã thêm sự kiện: {details.get('title', '')} vào {EVENTS_DATA_FILE}")
-        print(f"Tổng số sự kiện hiện tại: {len(events_data)}")
+    event_id = storage.add_event(details)
+    if event_id:
+        logger.info(f"Đã thêm sự kiện: {details.get('title', '')} với ID={event_id}")
         return True
-    except Exception as e:
-        print(f"Lỗi khi thêm sự kiện: {e}")
-        return False
+    return False
 
 def update_event(details):
     """Cập nhật thông tin về một sự kiện"""
-    try:
-        event_id = details.get("id")
-        if event_id in events_data:
-            # Cập nhật các trường được cung cấp
-            for key, value in details.items():
-                if key != "id" and value is not None:
-                    events_data[event_id][key] = value
-            
-            # Đảm bảo trường created_on được giữ nguyên
-            if "created_on" not in events_data[event_id]:
-                events_data[event_id]["created_on"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            save_data(EVENTS_DATA_FILE, events_data)
-            logger.info(f"Đã cập nhật sự kiện ID={event_id}: {details}")
-            return True
-        else:
-            logger.warning(f"Không tìm thấy sự kiện ID={event_id}")
-            return False
-    except Exception as e:
-        logger.error(f"Lỗi khi cập nhật sự kiện: {e}")
-        return False
+    event_id = details.get("id")
+    if storage.update_event(event_id, details):
+        logger.info(f"Đã cập nhật sự kiện ID={event_id}: {details}")
+        return True
+    logger.warning(f"Không tìm thấy hoặc không thể cập nhật sự kiện ID={event_id}")
+    return False
 
 def delete_event(event_id):
-    if event_id in events_data:
-        del events_data[event_id]
-        save_data(EVENTS_DATA_FILE, events_data)
+    return storage.delete_event(event_id)
 
 # Các hàm quản lý ghi chú
 def add_note(details):
-    note_id = str(len(notes_data) + 1)
-    notes_data[note_id] = {
-        "title": details.get("title", ""),
-        "content": details.get("content", ""),
-        "tags": details.get("tags", []),
-        "created_by": details.get("created_by", ""),  # Thêm người tạo ghi chú
-        "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
-    save_data(NOTES_DATA_FILE, notes_data)
+    return storage.add_note(details)
 
 # Lọc sự kiện theo người dùng
 def filter_events_by_member(member_id=None):
     """Lọc sự kiện theo thành viên cụ thể"""
-    if not member_id:
-        return events_data  # Trả về tất cả sự kiện nếu không có ID
-    
-    filtered_events = {}
-    for event_id, event in events_data.items():
-        # Lọc những sự kiện mà thành viên tạo hoặc tham gia
-        if (event.get("created_by") == member_id or 
-            (member_id in family_data and 
-             family_data[member_id].get("name") in event.get("participants", []))):
-            filtered_events[event_id] = event
-    
-    return filtered_events
+    return storage.filter_events_by_member(member_id)
 
 def main():
     # --- Cấu hình trang ---
@@ -1255,6 +1179,8 @@ def main():
         st.session_state.current_member = None  # ID thành viên đang trò chuyện
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "conversation_id" not in st.session_state:
+        st.session_state.conversation_id = uuid.uuid4().hex  # ID ổn định của cuộc trò chuyện hiện tại
     if "suggested_question" not in st.session_state:
         st.session_state.suggested_question = None
     if "process_suggested" not in st.session_state:
@@ -1264,6 +1190,11 @@ def main():
     if "tavily_api_key" not in st.session_state:
         st.session_state.tavily_api_key = ""
 
+    # --- Dữ liệu cho lần chạy này (đọc từ backend lưu trữ) ---
+    family_data = storage.get_all_family_members()
+    events_data = storage.get_all_events()
+    notes_data = storage.get_all_notes()
+
     # --- Thanh bên ---
     with st.sidebar:
         default_openai_api_key = os.getenv("OPENAI_API_KEY", "")
@@ -1303,6 +1234,7 @@ def main():
             st.session_state.current_member = new_member_id
             if "messages" in st.session_state:
                 st.session_state.pop("messages", None)
+                st.session_state.pop("conversation_id", None)
                 st.rerun()
         
         # Hiển thị thông tin người dùng hiện tại
@@ -1311,15 +1243,19 @@ def main():
             st.info(f"Đang trò chuyện với tư cách: **{member.get('name')}**")
             
             # Hiển thị lịch sử trò chuyện trước đó
-            if st.session_state.current_member in chat_history and chat_history[st.session_state.current_member]:
+            history_index = storage.get_chat_summaries(st.session_state.current_member)
+            if history_index:
                 with st.expander("📜 Lịch sử trò chuyện trước đó"):
-                    for idx, history in enumerate(chat_history[st.session_state.current_member]):
+                    for idx, history in enumerate(history_index):
                         st.write(f"**{history.get('timestamp')}**")
                         st.write(f"*{history.get('summary', 'Không có tóm tắt')}*")
                         
-                        # Nút để tải lại cuộc trò chuyện cũ
+                        # Nút để tải lại cuộc trò chuyện cũ (chỉ lúc này mới đọc tin nhắn)
                         if st.button(f"Tải lại cuộc trò chuyện này", key=f"load_chat_{idx}"):
-                            st.session_state.messages = history.get('messages', [])
+                            entry = storage.get_conversation(st.session_state.current_member, history.get('id')) or {}
+                            # Tiếp tục đúng cuộc trò chuyện cũ để các tin nhắn mới được nối vào nó
+                            st.session_state.messages = list(entry.get('messages', []))
+                            st.session_state.conversation_id = history.get('id')
                             st.rerun()
                         st.divider()
         
@@ -1338,18 +1274,16 @@ def main():
                 add_member_submitted = st.form_submit_button("Thêm")
                 
                 if add_member_submitted and member_name:
-                    member_id = str(len(family_data) + 1)
-                    family_data[member_id] = {
+                    add_family_member({
                         "name": member_name,
                         "age": member_age,
                         "preferences": {
                             "food": food_pref,
                             "hobby": hobby_pref,
                             "color": color_pref
-                        },
-                        "added_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    save_data(FAMILY_DATA_FILE, family_data)
+                        }
+                    })
+                    family_data = storage.get_all_family_members()
                     st.success(f"Đã thêm {member_name} vào gia đình!")
         
         # Xem và chỉnh sửa thành viên gia đình
@@ -1403,14 +1337,16 @@ def main():
                     cancel_edits = st.form_submit_button("Hủy")
                     
                     if save_edits:
-                        family_data[member_id]["name"] = new_name
-                        family_data[member_id]["age"] = new_age
-                        family_data[member_id]["preferences"] = {
-                            "food": new_food,
-                            "hobby": new_hobby,
-                            "color": new_color
-                        }
-                        save_data(FAMILY_DATA_FILE, family_data)
+                        storage.update_family_member(member_id, {
+                            "name": new_name,
+                            "age": new_age,
+                            "preferences": {
+                                "food": new_food,
+                                "hobby": new_hobby,
+                                "color": new_color
+                            }
+                        })
+                        family_data = storage.get_all_family_members()
                         st.session_state.editing_member = None
                         st.success("Đã cập nhật thông tin!")
                         st.rerun()
@@ -1447,28 +1383,38 @@ def main():
                 add_event_submitted = st.form_submit_button("Thêm sự kiện")
                 
                 if add_event_submitted and event_title:
-                    event_id = str(len(events_data) + 1)
-                    events_data[event_id] = {
+                    add_event({
                         "title": event_title,
                         "date": event_date.strftime("%Y-%m-%d"),
                         "time": event_time.strftime("%H:%M"),
                         "description": event_desc,
                         "participants": participants,
-                        "created_by": st.session_state.current_member,  # Lưu người tạo
-                        "created_on": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    }
-                    save_data(EVENTS_DATA_FILE, events_data)
+                        "created_by": st.session_state.current_member  # Lưu người tạo
+                    })
+                    events_data = storage.get_all_events()
                     st.success(f"Đã thêm sự kiện: {event_title}!")
         
         # Xem sự kiện sắp tới - đã được lọc theo người dùng
         with st.expander("📆 Sự kiện"):
-            # Lọc sự kiện theo người dùng hiện tại
-            filtered_events = (
-                filter_events_by_member(st.session_state.current_member) 
-                if st.session_state.current_member 
-                else events_data
+            time_range = st.radio(
+                "Khoảng thời gian:",
+                ["Sắp tới (14 ngày)", "Tất cả"],
+                horizontal=True
             )
             
+            # Lọc sự kiện theo người dùng hiện tại (sự kiện sắp tới chỉ truy vấn trong khoảng ngày)
+            if time_range == "Tất cả":
+                filtered_events = (
+                    filter_events_by_member(st.session_state.current_member) 
+                    if st.session_state.current_member 
+                    else events_data
+                )
+            else:
+                today = datetime.date.today()
+                filtered_events = storage.get_events_between(
+                    today, today + datetime.timedelta(days=14), st.session_state.current_member
+                )
+            
             # Phần hiển thị chế độ lọc
             mode = st.radio(
                 "Chế độ hiển thị:",
@@ -1572,12 +1518,13 @@ def main():
                 cancel_event_edits = st.form_submit_button("Hủy")
                 
                 if save_event_edits:
-                    events_data[event_id]["title"] = new_title
-                    events_data[event_id]["date"] = new_date.strftime("%Y-%m-%d")
-                    events_data[event_id]["time"] = new_time.strftime("%H:%M")
-                    events_data[event_id]["description"] = new_desc
-                    events_data[event_id]["participants"] = new_participants
-                    save_data(EVENTS_DATA_FILE, events_data)
+                    storage.update_event(event_id, {
+                        "title": new_title,
+                        "date": new_date.strftime("%Y-%m-%d"),
+                        "time": new_time.strftime("%H:%M"),
+                        "description": new_desc,
+                        "participants": new_participants
+                    })
                     st.session_state.editing_event = None
                     st.success("Đã cập nhật sự kiện!")
                     st.rerun()
@@ -1630,12 +1577,24 @@ def main():
                 col1, col2 = st.columns(2)
                 with col2:
                     if st.button(f"Xóa", key=f"delete_note_{note_id}"):
-                        del notes_data[note_id]
-                        save_data(NOTES_DATA_FILE, notes_data)
+                        storage.delete_note(note_id)
                         st.success(f"Đã xóa ghi chú!")
                         st.rerun()
                 st.divider()
         
+        # Tìm kiếm trong ghi chú, sự kiện và lịch sử trò chuyện (không phân biệt dấu)
+        with st.expander("🔎 Tìm trong dữ liệu gia đình"):
+            search_query = st.text_input("Từ khóa", key="family_search_query")
+            if search_query:
+                kind_labels = {"note": "📝 Ghi chú", "event": "📅 Sự kiện", "chat": "💬 Trò chuyện"}
+                hits = storage.search(search_query, limit=20, member_id=st.session_state.current_member)
+                if not hits:
+                    st.write("Không tìm thấy kết quả nào")
+                for hit in hits:
+                    st.write(f"{kind_labels[hit['kind']]}: **{hit.get('title') or ''}**")
+                    if hit.get("text"):
+                        st.caption(hit["text"][:200])
+        
         st.divider()
         
         # Phần tìm kiếm và truy vấn thông tin thực tế
@@ -1669,14 +1628,34 @@ def main():
                 # Trước khi xóa, lưu lịch sử trò chuyện nếu đang trò chuyện với một thành viên
                 if st.session_state.current_member and openai_api_key:
                     summary = generate_chat_summary(st.session_state.messages, openai_api_key)
-                    save_chat_history(st.session_state.current_member, st.session_state.messages, summary)
-                # Xóa tin nhắn
+                    save_chat_history(st.session_state.current_member, st.session_state.messages, summary,
+                                      conversation_id=st.session_state.get("conversation_id"))
+                # Xóa tin nhắn và bắt đầu cuộc trò chuyện mới
                 st.session_state.pop("messages", None)
+                st.session_state.pop("conversation_id", None)
 
         st.button(
             "🗑️ Xóa lịch sử trò chuyện", 
             on_click=reset_conversation,
         )
+        
+        # Số liệu hiệu năng database (chỉ hiện khi bật DB_SLOW_QUERY_MS)
+        if profiler:
+            with st.expander("📊 Hiệu năng database"):
+                snapshot = profiler.snapshot()
+                st.table([
+                    {"Phương thức": name, "Lần gọi": stats["calls"], "Dòng": stats["rows"],
+                     "Câu lệnh": stats["statements"], "p50 (ms)": stats["p50_ms"],
+                     "p95 (ms)": stats["p95_ms"], "p99 (ms)": stats["p99_ms"]}
+                    for name, stats in snapshot["methods"].items()
+                ])
+                if snapshot["slow"]:
+                    st.write(f"**Truy vấn chậm (≥ {snapshot['slow_ms']} ms):**")
+                    for entry in reversed(snapshot["slow"]):
+                        st.caption(f"{entry['at']} · {entry['method']} · {entry['ms']} ms · {entry['rows']} dòng")
+                if st.button("Xóa số liệu", key="reset_db_profiler"):
+                    profiler.reset()
+                    st.rerun()
 
     # --- Nội dung chính ---
     # Kiểm tra nếu người dùng đã nhập OpenAI API Key, nếu không thì hiển thị cảnh báo
@@ -1705,6 +1684,8 @@ def main():
 
         if "messages" not in st.session_state:
             st.session_state.messages = []
+        if "conversation_id" not in st.session_state:
+            st.session_state.conversation_id = uuid.uuid4().hex
 
         # Hiển thị các tin nhắn trước đó nếu có
         for message in st.session_state.messages:
@@ -1713,7 +1694,8 @@ def main():
                     if content["type"] == "text":
                         st.write(content["text"])
                     elif content["type"] == "image_url":      
-                        st.image(content["image_url"]["url"])
+                        image_url = content["image_url"]["url"]
+                        st.image(blob_store.path(image_url) if BlobStore.is_ref(image_url) else image_url)
 
         # Hiển thị banner thông tin người dùng hiện tại
         if st.session_state.current_member and st.session_state.current_member in family_data:
@@ -1901,14 +1883,15 @@ def main():
             def add_image_to_messages():
                 if st.session_state.uploaded_img or ("camera_img" in st.session_state and st.session_state.camera_img):
                     img_type = st.session_state.uploaded_img.type if st.session_state.uploaded_img else "image/jpeg"
-                    raw_img = Image.open(st.session_state.uploaded_img or st.session_state.camera_img)
-                    img = get_image_base64(raw_img)
+                    img_file = st.session_state.uploaded_img or st.session_state.camera_img
+                    # Lưu ảnh vào kho theo hash, tin nhắn chỉ giữ tham chiếu ngắn
+                    img_ref = blob_store.put(img_file.getvalue())
                     st.session_state.messages.append(
                         {
                             "role": "user", 
                             "content": [{
                                 "type": "image_url",
-                                "image_url": {"url": f"data:{img_type};base64,{img}"}
+                                "image_url": {"url": img_ref, "mime_type": img_type}
                             }]
                         }
                     )
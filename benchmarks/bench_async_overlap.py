@@ -0,0 +1,80 @@
+# benchmarks/bench_async_overlap.py
+"""
+So sánh thời gian một luồng xử lý async (gọi mạng + đọc database) khi đọc
+database đồng bộ và khi đọc qua AsyncDatabaseManager
+
+Cách dùng:
+    python -m benchmarks.bench_async_overlap --rows 2000 --network-ms 50
+
+Lời gọi mạng được mô phỏng bằng asyncio.sleep; mỗi "yêu cầu" vừa chờ mạng
+vừa đọc toàn bộ ghi chú (bộ đệm tắt để mỗi lần đọc đều chạy SQL). Ngoài tổng
+thời gian, bản đo còn ghi độ trễ lớn nhất của vòng lặp sự kiện (thời gian các
+tác vụ async khác, ví dụ stream phản hồi, bị chặn).
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.async_db_manager import AsyncDatabaseManager
+
+
+async def blocking_pipeline(db: DatabaseManager, network: float) -> None:
+    """Cách cũ: đọc database ngay trên vòng lặp sự kiện"""
+    db.get_all_notes()
+    await asyncio.sleep(network)
+
+
+async def async_pipeline(adb: AsyncDatabaseManager, network: float) -> None:
+    """Cách mới: đọc database trên luồng worker, chồng lên thời gian chờ mạng"""
+    await asyncio.gather(adb.get_all_notes(), asyncio.sleep(network))
+
+
+async def probe_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    """Độ trễ lớn nhất (ms) của một lần ngủ ngắn trên vòng lặp sự kiện"""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst * 1000
+
+
+async def run(args) -> None:
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "bench_async.db"), cache=False)
+    db.add_notes_bulk([{"title": f"Ghi chú {i}", "content": "nội dung " * 20, "tags": ["a", "b"]}
+                       for i in range(args.rows)])
+    network = args.network_ms / 1000
+
+    async with AsyncDatabaseManager(db, max_workers=args.workers) as adb:
+        for label, pipeline in (("đồng bộ", lambda: blocking_pipeline(db, network)),
+                                ("async", lambda: async_pipeline(adb, network))):
+            stop = asyncio.Event()
+            probe = asyncio.create_task(probe_loop_lag(stop))
+            started = time.perf_counter()
+            await asyncio.gather(*(pipeline() for _ in range(args.requests)))
+            elapsed = (time.perf_counter() - started) * 1000
+            stop.set()
+            lag = await probe
+            print(f"{label:>10}: {args.requests} yêu cầu trong {elapsed:.1f} ms, "
+                  f"vòng lặp bị chặn tối đa {lag:.1f} ms")
+    db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Đo mức chồng lấp giữa đọc database và chờ mạng")
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--network-ms", type=float, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
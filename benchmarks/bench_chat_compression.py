@@ -0,0 +1,152 @@
+# benchmarks/bench_chat_compression.py
+"""
+So sánh dung lượng và độ trễ của các cách lưu nội dung tin nhắn trong SQLite
+
+Cách dùng:
+    python -m benchmarks.bench_chat_compression --data-dir <thư mục dữ liệu JSON đã xuất>
+    python -m benchmarks.bench_chat_compression --db family_assistant.db
+
+Nguồn là lịch sử trò chuyện thật: thư mục dữ liệu JSON (chat_history/ hoặc
+chat_history.json) hoặc một database SQLite có sẵn. Nếu không chỉ định nguồn,
+bản đo dùng dữ liệu tiếng Việt tổng hợp (chỉ để thử, không phản ánh thực tế).
+
+Với mỗi cách lưu: tổng số byte nội dung, tỉ lệ so với JSON cũ (ensure_ascii),
+thời gian nén / giải nén + json.loads cho mỗi tin nhắn, và kích thước file
+database sau khi nạp toàn bộ lịch sử qua save_chat_history.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.migrate_json import JsonToSqliteMigrator
+from database.compression import CODECS, encode_payload, decode_payload
+
+Conversation = Tuple[str, List[Dict], str]  # (member_id, tin nhắn, tóm tắt)
+
+
+def load_json_export(data_dir: str) -> List[Conversation]:
+    """Đọc lịch sử trò chuyện từ thư mục dữ liệu JSON (không ghi gì vào database)"""
+    migrator = JsonToSqliteMigrator(DatabaseManager(":memory:"), data_dir)
+    return [
+        (member_id, entry.get("messages") or [], entry.get("summary") or "")
+        for member_id, entry in migrator._iter_conversations()
+        if isinstance(entry, dict)
+    ]
+
+
+def load_database(db_path: str) -> List[Conversation]:
+    """Đọc lịch sử trò chuyện từ một database SQLite có sẵn (chỉ đọc)"""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    conversations = []
+    for member_id, conversation_id, summary, snapshot in conn.execute(
+            'SELECT member_id, conversation_id, summary, messages FROM chat_history'):
+        if conversation_id:
+            rows = conn.execute('SELECT content FROM chat_messages WHERE conversation_id = ? ORDER BY position',
+                                (conversation_id,))
+            messages = [json.loads(decode_payload(content)) for (content,) in rows]
+        else:
+            messages = json.loads(decode_payload(snapshot) or "[]")
+        conversations.append((member_id, messages, summary or ""))
+    conn.close()
+    return conversations
+
+
+def synthetic(conversations: int) -> List[Conversation]:
+    """Dữ liệu tổng hợp: câu hỏi ngắn, câu trả lời dài lặp lại văn phong trợ lý"""
+    random.seed(42)
+    topics = ["món phở bò", "lịch họp phụ huynh", "sinh nhật bà nội", "chuyến đi Đà Lạt", "thời tiết Hà Nội"]
+    answer = ("Dạ, mình đã ghi nhận thông tin về {topic}. Gia đình mình có thể chuẩn bị trước "
+              "những việc sau: kiểm tra lịch của từng thành viên, đặt nhắc nhở trước một ngày và "
+              "ghi chú lại các món cần mua. Nếu cần, mình sẽ cập nhật sự kiện vào lịch gia đình nhé! ")
+    result = []
+    for i in range(conversations):
+        messages = []
+        for _ in range(random.randint(4, 16)):
+            topic = random.choice(topics)
+            messages.append({"role": "user", "content": [{"type": "text", "text": f"Cho mình hỏi về {topic} với"}]})
+            messages.append({"role": "assistant",
+                             "content": [{"type": "text", "text": answer.format(topic=topic) * random.randint(1, 3)}]})
+        result.append((f"member_{i % 5}", messages, f"Trao đổi về {random.choice(topics)} và các việc cần chuẩn bị."))
+    return result
+
+
+def measure_codec(codec: str, payloads: List[str]) -> Dict[str, float]:
+    """Tổng byte và thời gian nén / giải nén (µs mỗi tin nhắn) của một cách nén"""
+    started = time.perf_counter()
+    encoded = [encode_payload(text, codec) for text in payloads]
+    encode_us = (time.perf_counter() - started) * 1e6 / len(payloads)
+
+    started = time.perf_counter()
+    for value in encoded:
+        json.loads(decode_payload(value))
+    decode_us = (time.perf_counter() - started) * 1e6 / len(payloads)
+
+    size = sum(len(value) if isinstance(value, bytes) else len(value.encode("utf-8")) for value in encoded)
+    return {"bytes": size, "encode_us": encode_us, "decode_us": decode_us}
+
+
+def database_size(codec: str, conversations: List[Conversation]) -> int:
+    """Kích thước file database (byte) sau khi lưu toàn bộ lịch sử với một cách nén"""
+    db_path = os.path.join(tempfile.mkdtemp(), f"bench_{codec}.db")
+    db = DatabaseManager(db_path, compression=codec, cache=False)
+    for member_id, messages, summary in conversations:
+        # Mỗi cuộc trò chuyện là một thành viên riêng để không bị giới hạn 10 cuộc
+        db.save_chat_history(f"{member_id}/{id(messages)}", messages, summary)
+    db.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    db.close()
+    return os.path.getsize(db_path)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="So sánh các cách nén nội dung tin nhắn")
+    parser.add_argument("--data-dir", default=None, help="Thư mục dữ liệu JSON đã xuất")
+    parser.add_argument("--db", default=None, help="Database SQLite có sẵn (mở chỉ đọc)")
+    parser.add_argument("--synthetic", type=int, default=500, help="Số cuộc trò chuyện tổng hợp khi không có nguồn")
+    args = parser.parse_args()
+
+    if args.data_dir:
+        conversations = load_json_export(args.data_dir)
+    elif args.db:
+        conversations = load_database(args.db)
+    else:
+        print("CHÚ Ý: không có nguồn dữ liệu thật, dùng dữ liệu tổng hợp")
+        conversations = synthetic(args.synthetic)
+
+    messages = [message for _, conversation, _ in conversations for message in conversation]
+    if not messages:
+        print("Không có tin nhắn nào trong nguồn dữ liệu")
+        return
+    print(f"{len(conversations)} cuộc trò chuyện, {len(messages)} tin nhắn")
+
+    legacy = measure_codec("none", [json.dumps(message) for message in messages])
+    print(f"{'cách lưu':>16} {'byte':>12} {'tỉ lệ':>7} {'nén µs':>8} {'giải nén µs':>12} {'file db':>12}")
+    print(f"{'JSON cũ (ascii)':>16} {legacy['bytes']:>12} {1:>7.2f} {legacy['encode_us']:>8.1f} "
+          f"{legacy['decode_us']:>12.1f} {'':>12}")
+    payloads = [json.dumps(message, ensure_ascii=False) for message in messages]
+    for codec in CODECS:
+        stats = measure_codec(codec, payloads)
+        size = database_size(codec, conversations)
+        print(f"{codec:>16} {stats['bytes']:>12} {stats['bytes'] / legacy['bytes']:>7.2f} "
+              f"{stats['encode_us']:>8.1f} {stats['decode_us']:>12.1f} {size:>12}")
+
+    summaries = [summary for _, _, summary in conversations if summary]
+    if summaries:
+        raw = sum(len(summary.encode("utf-8")) for summary in summaries)
+        packed = sum(len(value) if isinstance(value, bytes) else len(value.encode("utf-8"))
+                     for value in (encode_payload(summary, "zlib") for summary in summaries))
+        print(f"Tóm tắt: {len(summaries)} dòng, {raw} byte -> {packed} byte với zlib "
+              f"({packed / raw:.2f}); giữ dạng TEXT cho chỉ mục tìm kiếm")
+
+
+if __name__ == "__main__":
+    main()
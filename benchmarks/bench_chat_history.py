@@ -0,0 +1,85 @@
+# benchmarks/bench_chat_history.py
+"""
+Đo độ trễ của DatabaseManager.save_chat_history khi bảng chat_history lớn dần
+
+Cách dùng:
+    python -m benchmarks.bench_chat_history --sizes 10000 100000 1000000
+
+Với mỗi kích thước, bảng được nạp thêm dòng giả (nhiều thành viên khác nhau,
+mỗi người đã đủ số cuộc trò chuyện tối đa) rồi đo thời gian lưu các cuộc trò
+chuyện mới, mỗi lần lưu đều kích hoạt việc giới hạn lịch sử.
+"""
+
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+
+CONVERSATIONS_PER_MEMBER = 10
+
+
+def fill(db: DatabaseManager, start: int, end: int) -> None:
+    """Thêm các dòng chat_history giả từ start tới end (mỗi thành viên đủ 10 cuộc)"""
+    rows = []
+    for i in range(start, end):
+        member_id = f"bench_{i // CONVERSATIONS_PER_MEMBER}"
+        timestamp = f"2024-01-01 00:00:{i % CONVERSATIONS_PER_MEMBER:02d}"
+        rows.append((member_id, timestamp, '[]', 'tóm tắt', uuid.uuid4().hex))
+        if len(rows) >= 50000:
+            db.cursor.executemany(
+                'INSERT INTO chat_history (member_id, timestamp, messages, summary, conversation_id) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            rows = []
+    if rows:
+        db.cursor.executemany(
+            'INSERT INTO chat_history (member_id, timestamp, messages, summary, conversation_id) VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+    db.conn.commit()
+
+
+def measure(db: DatabaseManager, table_rows: int, samples: int) -> list:
+    """Lưu `samples` cuộc trò chuyện mới cho các thành viên có sẵn, trả về độ trễ (ms)"""
+    members = max(table_rows // CONVERSATIONS_PER_MEMBER, 1)
+    messages = [{"role": "user", "content": "Xin chào"}, {"role": "assistant", "content": "Chào bạn!"}]
+    latencies = []
+    for i in range(samples):
+        member_id = f"bench_{(i * 7919) % members}"
+        started = time.perf_counter()
+        db.save_chat_history(member_id, messages, "tóm tắt", uuid.uuid4().hex)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Đo độ trễ lưu lịch sử chat theo kích thước bảng")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--db", default=None, help="File database (mặc định: file tạm)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(), "bench_chat.db")
+    db = DatabaseManager(db_path)
+    print(f"Database: {db_path}")
+    print(f"{'số dòng':>10} {'p50 (ms)':>10} {'p95 (ms)':>10} {'max (ms)':>10}")
+
+    current = 0
+    for size in sorted(args.sizes):
+        fill(db, current, size)
+        current = size
+        latencies = sorted(measure(db, size, args.samples))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"{size:>10} {statistics.median(latencies):>10.3f} {p95:>10.3f} {latencies[-1]:>10.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_models.py
+"""
+So sánh chi phí đọc danh sách dài: dict qua sqlite3.Row và model qua row_factory
+
+Cách dùng:
+    python -m benchmarks.bench_models --rows 10000 --repeat 20
+
+Các cách đọc bảng events (bộ đệm tắt, để đo đúng chi phí dựng kết quả):
+  - dict: get_all_events() như hiện tại (sqlite3.Row -> dict, giải mã JSON mọi dòng)
+  - dict -> model: get_all_events() rồi Event.from_dict cho từng dòng
+  - model: get_models('events') (dựng thẳng model, JSON chưa giải mã)
+  - model + JSON: như trên và đọc participants của mọi dòng
+In thời gian mỗi lần đọc và bộ nhớ cấp phát tối đa (tracemalloc).
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+from database.models import Event
+
+
+def fill(db: DatabaseManager, rows: int) -> None:
+    """Tạo các sự kiện giả, mỗi sự kiện có vài người tham gia"""
+    names = ["Bố", "Mẹ", "An", "Bình", "Bà nội"]
+    db.add_events_bulk([
+        {"title": f"Sự kiện {i}", "date": f"2026-{i % 12 + 1:02d}-{i % 28 + 1:02d}", "time": "19:00",
+         "description": "Họp mặt gia đình cuối tuần", "participants": names[:i % len(names) + 1],
+         "created_by": "1"}
+        for i in range(rows)
+    ])
+
+
+def measure(read, repeat: int):
+    """(ms mỗi lần, KB cấp phát tối đa của một lần)"""
+    read()  # Làm nóng: chuẩn bị câu lệnh, tính sẵn cách ghép cột
+    started = time.perf_counter()
+    for _ in range(repeat):
+        read()
+    elapsed = (time.perf_counter() - started) * 1000 / repeat
+
+    tracemalloc.start()
+    result = read()
+    peak = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    del result
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="So sánh đọc danh sách dạng dict và dạng model")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), "bench_models.db"), cache=False)
+    fill(db, args.rows)
+
+    def models_with_json():
+        events = db.get_models('events')
+        for event in events:
+            event.participants
+        return events
+
+    readers = {
+        "dict": db.get_all_events,
+        "dict -> model": lambda: [Event.from_dict({**record, "id": int(event_id)})
+                                  for event_id, record in db.get_all_events().items()],
+        "model": lambda: db.get_models('events'),
+        "model + JSON": models_with_json,
+    }
+    print(f"{args.rows} sự kiện")
+    print(f"{'cách đọc':>14} {'ms/lần':>9} {'µs/dòng':>8} {'KB tối đa':>10}")
+    for label, read in readers.items():
+        elapsed, peak = measure(read, args.repeat)
+        print(f"{label:>14} {elapsed:>9.2f} {elapsed * 1000 / args.rows:>8.2f} {peak:>10.0f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
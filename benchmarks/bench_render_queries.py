@@ -0,0 +1,101 @@
+# benchmarks/bench_render_queries.py
+"""
+Đếm số câu lệnh SQL mà một lần hiển thị trang sự kiện / ghi chú phát sinh
+
+Cách dùng:
+    python -m benchmarks.bench_render_queries --members 8 --rows 500
+
+Mô phỏng phần đọc dữ liệu của events_management_ui và notes_management_ui
+(một trang keyset + tên người tạo) rồi so sánh với cách cũ gọi
+get_family_member cho từng dòng. Thoát với mã 1 nếu một lần hiển thị trang
+chạy nhiều hơn MAX_STATEMENTS câu lệnh.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_manager import DatabaseManager
+
+PAGE_SIZE = 20  # Giống UIComponents.PAGE_SIZE
+MAX_STATEMENTS = 2  # Một truy vấn trang + một truy vấn tên người tạo
+
+
+class StatementCounter:
+    """Đếm câu lệnh chạy trên kết nối ghi và kết nối đọc của luồng hiện tại"""
+
+    def __init__(self, db: DatabaseManager):
+        self.statements = []
+        for conn in {db.conn, db._reader() or db.conn}:
+            conn.set_trace_callback(self.statements.append)
+
+    def reset(self) -> None:
+        self.statements.clear()
+
+
+def fill(db: DatabaseManager, members: int, rows: int) -> None:
+    """Tạo thành viên, sự kiện và ghi chú giả (người tạo xoay vòng)"""
+    member_ids = [db.add_family_member({"name": f"Thành viên {i}", "preferences": {"food": "phở"}})
+                  for i in range(members)]
+    for i in range(rows):
+        creator = member_ids[i % members]
+        db.add_event({"title": f"Sự kiện {i}", "date": "2026-01-01", "participants": [], "created_by": creator})
+        db.add_note({"title": f"Ghi chú {i}", "content": "...", "created_by": creator})
+
+
+def render_n_plus_one(db: DatabaseManager, iterate) -> None:
+    """Cách cũ: một lần get_family_member cho mỗi dòng của trang"""
+    for _, record in iterate(limit=PAGE_SIZE + 1):
+        db.get_family_member(record.get("created_by"))
+
+
+def render_batched(db: DatabaseManager, iterate) -> None:
+    """Cách mới: lấy tên người tạo của cả trang trong một truy vấn"""
+    page = list(iterate(limit=PAGE_SIZE + 1))
+    db.get_member_names(record.get("created_by") for _, record in page)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Đếm câu lệnh SQL cho mỗi lần hiển thị trang danh sách")
+    parser.add_argument("--members", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_render.db")
+    # Tắt bộ đệm để đếm đúng chi phí của một lần hiển thị khi dữ liệu vừa thay đổi
+    db = DatabaseManager(db_path, cache=False)
+    fill(db, args.members, args.rows)
+    counter = StatementCounter(db)
+
+    pages = {
+        "events": lambda **page: db.iter_events(**page, descending=True),
+        "notes": lambda **page: db.iter_notes(**page, descending=True),
+    }
+    print(f"{'trang':>8} {'cách':>12} {'câu lệnh':>9} {'ms/lần':>8}")
+    failed = False
+    for name, iterate in pages.items():
+        for label, render in (("N+1", render_n_plus_one), ("gộp tên", render_batched)):
+            counter.reset()
+            render(db, iterate)
+            count = len(counter.statements)
+
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                render(db, iterate)
+            elapsed = (time.perf_counter() - started) * 1000 / args.repeat
+            print(f"{name:>8} {label:>12} {count:>9} {elapsed:>8.3f}")
+
+            if render is render_batched and count > MAX_STATEMENTS:
+                print(f"LỖI: trang {name} chạy {count} câu lệnh (tối đa {MAX_STATEMENTS})")
+                failed = True
+    db.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
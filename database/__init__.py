@@ -5,6 +5,14 @@ Module khởi tạo cho package database
 """
 
 from .db_manager import DatabaseManager
+from .async_db_manager import AsyncDatabaseManager
+from .profiler import QueryProfiler
+from .scheduler import PeriodicJob, schedule_backups, schedule_maintenance
 from .models import FamilyMember, Event, Note, ChatHistory
+from .json_store import JsonStore, BackgroundWriter
+from .chat_store import ChatHistoryStore
+from .blob_store import BlobStore
+from .storage import StorageBackend, JsonStorageBackend, MemoryStorageBackend, create_storage_backend
 
-__all__ = ['DatabaseManager', 'FamilyMember', 'Event', 'Note', 'ChatHistory']
\ No newline at end of file
+__all__ = ['DatabaseManager', 'AsyncDatabaseManager', 'QueryProfiler', 'PeriodicJob', 'schedule_backups', 'schedule_maintenance', 'FamilyMember', 'Event', 'Note', 'ChatHistory', 'JsonStore', 'BackgroundWriter', 'ChatHistoryStore', 'BlobStore',
+           'StorageBackend', 'JsonStorageBackend', 'MemoryStorageBackend', 'create_storage_backend']
\ No newline at end of file
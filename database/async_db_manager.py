@@ -0,0 +1,121 @@
+# database/async_db_manager.py
+"""
+Lớp bọc bất đồng bộ cho DatabaseManager, dùng trong các luồng xử lý asyncio
+"""
+
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .storage import StorageBackend
+
+logger = logging.getLogger('family_assistant')
+
+
+class AsyncDatabaseManager:
+    """
+    Chạy các thao tác của một backend lưu trữ (thường là DatabaseManager) trên
+    nhóm luồng riêng và trả về awaitable, để các dịch vụ async (OpenAIService,
+    TavilyService) không chặn vòng lặp sự kiện khi đọc/ghi database.
+
+    Mọi phương thức công khai của backend đều có bản async cùng tên:
+    `await adb.get_all_events()`, `await adb.add_note({...})`... Các phương thức
+    iter_* trả về danh sách (nên truyền `limit`). Mỗi luồng worker dùng kết nối
+    đọc riêng của DatabaseManager nên các truy vấn đọc chạy song song; thao tác
+    ghi vẫn tuần tự qua khóa ghi.
+
+    transaction() không dùng được qua lớp này (khóa ghi gắn với luồng); thay
+    vào đó dùng run_in_transaction để chạy cả khối trên một luồng worker.
+    """
+
+    def __init__(self, db: StorageBackend, max_workers: int = 4):
+        """Bọc backend `db`, dùng tối đa max_workers luồng cho thao tác database"""
+        self.db = db
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db-worker")
+        # Số thao tác đang chờ luồng worker / đang chạy, để hiển thị trong stats()
+        self._counts_lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Chạy một hàm đồng bộ bất kỳ trên nhóm luồng database"""
+        call = functools.partial(func, *args, **kwargs)
+
+        def work():
+            with self._counts_lock:
+                self._queued -= 1
+                self._running += 1
+            return call()
+
+        with self._counts_lock:
+            self._queued += 1
+        try:
+            future = self._executor.submit(work)
+        except Exception:
+            with self._counts_lock:
+                self._queued -= 1
+            raise
+        future.add_done_callback(self._finished)
+        return await asyncio.wrap_future(future)
+
+    def _finished(self, future: Future) -> None:
+        """Cập nhật bộ đếm khi một thao tác xong (bị hủy trước khi chạy thì vẫn đang tính là chờ)"""
+        with self._counts_lock:
+            if future.cancelled():
+                self._queued -= 1
+            else:
+                self._running -= 1
+
+    async def run_in_transaction(self, func: Callable[[StorageBackend], Any]) -> Any:
+        """Chạy func(db) trong một db.transaction() trên một luồng worker, trả về kết quả của func"""
+        def work():
+            with self.db.transaction():
+                return func(self.db)
+        return await self.run(work)
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.db, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+        if name == 'transaction':
+            raise AttributeError("Dùng run_in_transaction thay cho transaction() với AsyncDatabaseManager")
+
+        if name.startswith('iter_'):
+            # Generator được duyệt hết trên luồng worker
+            func = lambda *args, **kwargs: list(attr(*args, **kwargs))
+        else:
+            func = attr
+
+        @functools.wraps(attr)
+        async def call(*args, **kwargs):
+            return await self.run(func, *args, **kwargs)
+
+        # Lưu lại để lần sau không phải tạo lại hàm bọc
+        self.__dict__[name] = call
+        return call
+
+    def stats(self) -> Dict[str, Any]:
+        """Số luồng worker tối đa, số thao tác đang chạy và đang chờ luồng worker"""
+        with self._counts_lock:
+            return {
+                "max_workers": self.max_workers,
+                "running": self._running,
+                "queued": self._queued,
+            }
+
+    async def close(self, close_db: bool = False) -> None:
+        """Chờ các thao tác đang chạy xong rồi dừng nhóm luồng (và đóng backend nếu close_db=True)"""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        if close_db:
+            self.db.close()
+        logger.info("Đã dừng nhóm luồng database bất đồng bộ")
+
+    async def __aenter__(self) -> 'AsyncDatabaseManager':
+        return self
+
+    async def __aexit__(self, exc_type: Optional[type], exc: Optional[BaseException], tb: Any) -> None:
+        await self.close()
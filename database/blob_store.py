@@ -0,0 +1,77 @@
+# database/blob_store.py
+"""
+Kho lưu ảnh theo địa chỉ nội dung, dùng cho hình ảnh trong tin nhắn
+"""
+
+import os
+import base64
+import hashlib
+import logging
+import threading
+from typing import Dict
+
+logger = logging.getLogger('family_assistant')
+
+
+class BlobStore:
+    """
+    Lưu dữ liệu nhị phân trên đĩa theo hash SHA-256 của nội dung.
+
+    Tin nhắn chỉ giữ tham chiếu ngắn dạng `blob:<sha256>` thay vì data URL
+    base64; ảnh giống nhau chỉ được lưu một lần. Data URL chỉ được dựng lại
+    khi cần gửi ảnh cho mô hình.
+    """
+
+    REF_PREFIX = "blob:"
+
+    _registry: Dict[str, 'BlobStore'] = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, root_dir: str) -> 'BlobStore':
+        """Lấy (hoặc tạo) store duy nhất cho một thư mục"""
+        key = os.path.abspath(root_dir)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            if store is None:
+                store = cls(root_dir)
+                cls._registry[key] = store
+            return store
+
+    def __init__(self, root_dir: str = "blobs"):
+        """Khởi tạo kho tại thư mục root_dir"""
+        self.root_dir = root_dir
+
+    @classmethod
+    def is_ref(cls, url: str) -> bool:
+        """Kiểm tra một URL có phải tham chiếu tới kho không"""
+        return isinstance(url, str) and url.startswith(cls.REF_PREFIX)
+
+    def path(self, ref: str) -> str:
+        """Đường dẫn file của một tham chiếu"""
+        digest = ref[len(self.REF_PREFIX):]
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Tham chiếu blob không hợp lệ: {ref}")
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Lưu dữ liệu (nếu chưa có) và trả về tham chiếu"""
+        ref = self.REF_PREFIX + hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp.{threading.get_ident()}"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            logger.info(f"Đã lưu blob mới {ref[:20]}... ({len(data)} byte)")
+        return ref
+
+    def read(self, ref: str) -> bytes:
+        """Đọc dữ liệu của một tham chiếu"""
+        with open(self.path(ref), "rb") as f:
+            return f.read()
+
+    def to_data_url(self, ref: str, mime_type: str = "image/jpeg") -> str:
+        """Dựng lại data URL base64 để gửi cho mô hình"""
+        return f"data:{mime_type};base64,{base64.b64encode(self.read(ref)).decode('utf-8')}"
@@ -0,0 +1,143 @@
+# database/chat_store.py
+"""
+Lưu lịch sử trò chuyện theo từng thành viên (mỗi thành viên một file)
+"""
+
+import os
+import re
+import hashlib
+import logging
+import datetime
+import threading
+import uuid
+from typing import Dict, List, Optional
+
+from .json_store import JsonStore
+
+logger = logging.getLogger('family_assistant')
+
+
+class ChatHistoryStore:
+    """
+    Lịch sử trò chuyện chia nhỏ theo thành viên.
+
+    Mỗi thành viên có một file riêng chứa các cuộc trò chuyện theo ID, cùng
+    một file chỉ mục nhỏ (`index.json`) chỉ giữ ID, thời gian và tóm tắt để
+    hiển thị ở thanh bên. Lưu lịch sử của một thành viên chỉ chạm tới file
+    của người đó.
+    """
+
+    _registry: Dict[str, 'ChatHistoryStore'] = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, root_dir: str, legacy_file: Optional[str] = None) -> 'ChatHistoryStore':
+        """Lấy (hoặc tạo) store duy nhất cho một thư mục lịch sử"""
+        key = os.path.abspath(root_dir)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            if store is None:
+                store = cls(root_dir, legacy_file)
+                cls._registry[key] = store
+            return store
+
+    def __init__(self, root_dir: str, legacy_file: Optional[str] = None, max_entries: int = 10):
+        """Khởi tạo store, chuyển dữ liệu từ file chat_history.json cũ nếu có"""
+        self.root_dir = root_dir
+        self.max_entries = max_entries
+        self.lock = threading.RLock()
+        self.index = JsonStore.get(os.path.join(root_dir, "index.json"))
+        if legacy_file:
+            self._migrate_legacy(legacy_file)
+
+    def _shard(self, member_id: str) -> JsonStore:
+        """Store chứa lịch sử của một thành viên"""
+        name = str(member_id)
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+            name = hashlib.sha1(name.encode("utf-8")).hexdigest()[:16]
+        return JsonStore.get(os.path.join(self.root_dir, f"member_{name}.json"))
+
+    def _migrate_legacy(self, legacy_file: str) -> None:
+        """Tách file lịch sử chung cũ thành các file theo thành viên (chạy một lần)"""
+        if not os.path.exists(legacy_file):
+            return
+        if os.path.exists(self.index.file_path) or os.path.exists(self.index.journal_path):
+            return
+
+        legacy = JsonStore.get(legacy_file).load()
+        logger.info(f"Đang tách {legacy_file} thành lịch sử theo thành viên: {len(legacy)} thành viên")
+        for member_id, history in legacy.items():
+            if isinstance(history, list):
+                self._import_entries(member_id, history)
+
+        # Ghi ngay xuống đĩa trước khi đổi tên file cũ để tránh mất dữ liệu
+        for member_id in legacy:
+            self._shard(member_id).flush()
+        self.index.flush()
+        for path in (legacy_file, f"{legacy_file}.journal"):
+            if os.path.exists(path):
+                os.replace(path, f"{path}.migrated")
+
+    def _import_entries(self, member_id: str, history: List[Dict]) -> None:
+        """Chuyển các bản chụp lịch sử kiểu cũ (không có ID) thành cuộc trò chuyện"""
+        shard = self._shard(member_id)
+        index = []
+        for entry in history[:self.max_entries]:
+            conversation_id = uuid.uuid4().hex
+            timestamp = entry.get("timestamp", "")
+            shard.set([conversation_id], {
+                "id": conversation_id,
+                "started": timestamp,
+                "timestamp": timestamp,
+                "summary": entry.get("summary", ""),
+                "messages": entry.get("messages", [])
+            })
+            index.append({"id": conversation_id, "timestamp": timestamp, "summary": entry.get("summary", "")})
+        self.index.set([member_id], index)
+
+    def get_index(self, member_id: str) -> List[Dict]:
+        """Danh sách (ID, thời gian, tóm tắt) các cuộc trò chuyện, mới nhất trước"""
+        return self.index.load().get(member_id, [])
+
+    def get_conversation(self, member_id: str, conversation_id: str) -> Optional[Dict]:
+        """Một cuộc trò chuyện (kèm tin nhắn) theo ID"""
+        return self._shard(member_id).load().get(conversation_id)
+
+    def save(self, member_id: str, conversation_id: str, messages: List[Dict],
+             summary: Optional[str] = None) -> None:
+        """
+        Lưu một cuộc trò chuyện theo ID.
+
+        Nếu cuộc trò chuyện đã có, chỉ các tin nhắn mới (sau số tin nhắn đã lưu)
+        được nối vào journal, nên chi phí ghi tỉ lệ với phần thay đổi.
+        """
+        with self.lock:
+            shard = self._shard(member_id)
+            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            summary = summary if summary else ""
+
+            conversation = shard.load().get(conversation_id)
+            stored = conversation.get("messages", []) if conversation else []
+            if conversation is None:
+                shard.set([conversation_id], {
+                    "id": conversation_id,
+                    "started": timestamp,
+                    "timestamp": timestamp,
+                    "summary": summary,
+                    "messages": list(messages)
+                })
+            else:
+                if len(messages) >= len(stored) and (not stored or messages[len(stored) - 1] == stored[-1]):
+                    shard.extend([conversation_id, "messages"], messages[len(stored):])
+                else:
+                    # Tin nhắn đã bị thay đổi phía trước: ghi lại toàn bộ cuộc trò chuyện
+                    shard.set([conversation_id, "messages"], list(messages))
+                shard.set([conversation_id, "timestamp"], timestamp)
+                shard.set([conversation_id, "summary"], summary)
+
+            # Đưa cuộc trò chuyện lên đầu chỉ mục, giới hạn số cuộc trò chuyện lưu trữ
+            entries = [e for e in self.index.load().get(member_id, []) if e.get("id") != conversation_id]
+            entries.insert(0, {"id": conversation_id, "timestamp": timestamp, "summary": summary})
+            for expired in entries[self.max_entries:]:
+                shard.delete([expired["id"]])
+            self.index.set([member_id], entries[:self.max_entries])
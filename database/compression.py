@@ -0,0 +1,57 @@
+# database/compression.py
+"""
+Nén nội dung tin nhắn trò chuyện khi lưu vào SQLite
+"""
+
+import lzma
+import zlib
+from typing import Union
+
+CODECS = ("none", "zlib", "lzma")
+
+# Byte đầu của BLOB cho biết cách nén; giá trị TEXT là JSON chưa nén (kể cả dữ liệu cũ)
+_TAGS = {"zlib": b"z", "lzma": b"x"}
+_LZMA_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 6}]  # Dạng raw: không tốn phần header của .xz
+
+MIN_COMPRESS_SIZE = 96  # Chuỗi ngắn hơn (byte) được giữ nguyên vì nén không lợi
+
+
+def check_codec(codec: str) -> str:
+    """Chuẩn hóa tên cách nén, báo lỗi nếu không hỗ trợ"""
+    codec = (codec or "none").lower()
+    if codec not in CODECS:
+        raise ValueError(f"Cách nén không hợp lệ: {codec} (hỗ trợ: {', '.join(CODECS)})")
+    return codec
+
+
+def encode_payload(text: str, codec: str = "zlib") -> Union[str, bytes]:
+    """
+    Nén một chuỗi JSON thành BLOB có byte đánh dấu cách nén.
+
+    Trả về chính chuỗi ban đầu (lưu dạng TEXT) nếu codec là "none", chuỗi quá
+    ngắn hoặc bản nén không nhỏ hơn.
+    """
+    if codec == "none":
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < MIN_COMPRESS_SIZE:
+        return text
+    if codec == "zlib":
+        packed = _TAGS["zlib"] + zlib.compress(raw, 6)
+    elif codec == "lzma":
+        packed = _TAGS["lzma"] + lzma.compress(raw, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS)
+    else:
+        raise ValueError(f"Cách nén không hợp lệ: {codec}")
+    return packed if len(packed) < len(raw) else text
+
+
+def decode_payload(value: Union[str, bytes, None]) -> str:
+    """Giải nén giá trị đọc từ database (TEXT được trả về nguyên vẹn)"""
+    if value is None or isinstance(value, str):
+        return value
+    tag, body = value[:1], value[1:]
+    if tag == _TAGS["zlib"]:
+        return zlib.decompress(body).decode("utf-8")
+    if tag == _TAGS["lzma"]:
+        return lzma.decompress(body, format=lzma.FORMAT_RAW, filters=_LZMA_FILTERS).decode("utf-8")
+    raise ValueError(f"Không nhận ra định dạng nén (byte đánh dấu {tag!r})")
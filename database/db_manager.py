@@ -3,26 +3,111 @@
 Quản lý cơ sở dữ liệu và cung cấp các phương thức truy cập dữ liệu
 """
 
+import re
 import sqlite3
 import json
 import os
+import time
+import zlib
 import datetime
 import logging
 import threading
-from typing import Dict, List, Optional, Any, Union, Tuple
-from .models import FamilyMember, Event, Note, ChatHistory, Preference
+import uuid
+import contextlib
+import copy
+import dataclasses
+from collections import OrderedDict
+from typing import Dict, List, Optional, Any, Union, Tuple, Iterator, Iterable, Callable
+from .models import FamilyMember, Event, Note, ChatHistory, Preference, row_factory
+from .storage import StorageBackend, fold_vietnamese
+from .compression import check_codec, encode_payload, decode_payload
 
 logger = logging.getLogger('family_assistant')
 
-class DatabaseManager:
-    """Quản lý cơ sở dữ liệu SQLite cho ứng dụng Trợ lý Gia đình"""
+SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+BUSY_TIMEOUT = 10.0  # Số giây chờ khi database đang bị khóa
+
+class DatabaseManager(StorageBackend):
+    """
+    Quản lý cơ sở dữ liệu SQLite cho ứng dụng Trợ lý Gia đình
+    
+    Database chạy ở chế độ WAL: mọi thao tác ghi đi qua một kết nối ghi duy
+    nhất (bảo vệ bởi `self.lock`), còn các truy vấn đọc dùng kết nối đọc riêng
+    của từng luồng nên không phải chờ nhau hay chờ thao tác ghi.
+    
+    Kết quả đọc toàn bộ bảng được lưu đệm theo "thế hệ" của từng bảng: mỗi
+    phương thức ghi tăng thế hệ của các bảng nó thay đổi, nên lần đọc lặp lại
+    khi dữ liệu chưa đổi không chạy SQL và không giải mã JSON. Chỉ các thay đổi
+    đi qua đối tượng này được theo dõi. Bản ghi trả về được dùng chung với bộ
+    đệm, người gọi không nên sửa trực tiếp.
+    """
+    
+    # Các cột được phép chọn khi đọc theo trang; cột JSON được giải mã khi đọc
+    _PAGE_COLUMNS = {
+        'family_members': ('name', 'age', 'preferences', 'added_on'),
+        'events': ('title', 'date', 'time', 'description', 'participants', 'created_by', 'created_on'),
+        'notes': ('title', 'content', 'tags', 'created_by', 'created_on'),
+        'chat_history': ('timestamp', 'summary', 'messages'),
+    }
+    _JSON_COLUMNS = {'preferences': dict, 'participants': list, 'tags': list}
+    # Model trả về bởi get_models() cho từng bảng
+    _MODELS = {'family_members': FamilyMember, 'events': Event, 'notes': Note}
+    PAGE_SIZE = 200  # Số dòng mỗi truy vấn khi duyệt không giới hạn
+    
+    # Các bảng có bộ đếm thế hệ (event_participants tính chung với events)
+    _CACHED_TABLES = ('family_members', 'events', 'notes', 'chat_history')
+    # Các bảng ghi vào nhật ký thay đổi (bảng changes) qua trigger
+    _CHANGE_TABLES = ('family_members', 'events', 'notes', 'chat_history')
+    # Chỉ ghi nhật ký khi các cột người dùng thấy thay đổi (nén lại cột messages thì không)
+    _CHANGE_COLUMNS = {'chat_history': ('member_id', 'conversation_id', 'timestamp', 'summary')}
+    CACHE_SIZE = 256  # Số kết quả tối đa giữ trong bộ đệm
     
-    def __init__(self, db_path: str = "family_assistant.db"):
-        """Khởi tạo kết nối với cơ sở dữ liệu SQLite"""
+    # Tìm kiếm toàn văn: loại -> (bảng FTS5, bảng nguồn, các cột, trọng số BM25 của từng cột)
+    _SEARCH_TABLES = {
+        'note': ('search_notes', 'notes', ('title', 'content', 'tags'), (10.0, 1.0, 5.0)),
+        'event': ('search_events', 'events', ('title', 'description'), (10.0, 1.0)),
+        'chat': ('search_chat', 'chat_history', ('summary',), (1.0,)),
+    }
+    
+    # Duyệt các tên trong cột events.participants (JSON), bỏ qua giá trị không hợp lệ
+    _JSON_PARTICIPANTS = "json_each(CASE WHEN json_valid(e.participants) THEN e.participants ELSE '[]' END)"
+    
+    def __init__(self, db_path: str = "family_assistant.db", synchronous: str = "NORMAL",
+                 read_pool: bool = True, cache: bool = True, compression: str = "zlib"):
+        """
+        Khởi tạo kết nối với cơ sở dữ liệu SQLite.
+        
+        compression: cách nén nội dung tin nhắn mới ("zlib", "lzma" hoặc "none");
+        tin nhắn đã lưu ở bất kỳ dạng nào đều đọc được.
+        """
+        synchronous = (synchronous or "NORMAL").upper()
+        if synchronous not in SYNCHRONOUS_LEVELS:
+            raise ValueError(f"Mức synchronous không hợp lệ: {synchronous}")
+        
         self.db_path = db_path
+        self.synchronous = synchronous
+        self.compression = check_codec(compression)
+        # Database trong bộ nhớ không chia sẻ được giữa các kết nối: đọc qua kết nối ghi
+        self.read_pool = read_pool and db_path != ":memory:"
         self.conn = None
         self.cursor = None
-        self.lock = threading.RLock()  # Thêm khóa để đồng bộ hóa truy cập
+        self.lock = threading.RLock()  # Khóa cho kết nối ghi
+        self._local = threading.local()  # Kết nối đọc của từng luồng
+        self._readers: List[Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._readers_lock = threading.Lock()
+        self._trace_callback: Optional[Callable[[str], None]] = None
+        self.search_enabled = False
+        self._tx_depth = 0  # Độ sâu transaction() đang mở (chỉ đọc/ghi khi giữ khóa ghi)
+        self._tx_tables: set = set()  # Các bảng đã thay đổi trong transaction() đang mở
+        self.cache_enabled = cache
+        self._generations = {table: 0 for table in self._CACHED_TABLES}
+        self._cache: 'OrderedDict[Tuple, Tuple[Tuple[str, ...], Tuple[int, ...], Any]]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._last_write = 0.0  # time.monotonic() của lần commit gần nhất
+        self._commits = 0  # Số lần commit, để subscribe() biết có thay đổi mới
+        self._commit_cond = threading.Condition()
         self._initialize_db()
     
     def _initialize_db(self):
@@ -31,9 +116,16 @@ class DatabaseManager:
             # Đảm bảo thư mục tồn tại
             os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
             
-            # Tạo kết nối và cursor với check_same_thread=False để cho phép sử dụng ở nhiều thread
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.conn.row_factory = sqlite3.Row  # Để kết quả truy vấn dạng dict
+            # Kết nối ghi dùng chung (check_same_thread=False để dùng ở nhiều thread, có khóa bảo vệ)
+            self.conn = self._connect()
+            # Trang trống sau khi xóa được trả lại bằng PRAGMA incremental_vacuum (xem run_maintenance).
+            # Chỉ có hiệu lực với database mới; database cũ được chuyển bằng một lần VACUUM toàn bộ.
+            self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            if self.read_pool:
+                journal_mode = self.conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+                if journal_mode.lower() != 'wal':
+                    logger.warning(f"Không bật được chế độ WAL (journal_mode={journal_mode}), dùng kết nối ghi cho cả đọc")
+                    self.read_pool = False
             self.cursor = self.conn.cursor()
             
             # Tạo các bảng nếu chưa tồn tại
@@ -44,6 +136,167 @@ class DatabaseManager:
             logger.error(f"Lỗi khi khởi tạo database: {e}")
             raise
     
+    def _connect(self) -> sqlite3.Connection:
+        """Mở một kết nối mới với cấu hình chung"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=BUSY_TIMEOUT)
+        conn.row_factory = sqlite3.Row  # Để kết quả truy vấn dạng dict
+        conn.execute(f'PRAGMA synchronous={self.synchronous}')
+        conn.set_trace_callback(self._trace_callback)
+        return conn
+    
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]) -> None:
+        """
+        Gọi callback(câu lệnh SQL) cho mọi câu lệnh trên kết nối ghi và mọi kết
+        nối đọc (kể cả kết nối mở sau này); None để tắt. Dùng cho QueryProfiler.
+        """
+        self._trace_callback = callback
+        with self.lock:
+            if self.conn:
+                self.conn.set_trace_callback(callback)
+        with self._readers_lock:
+            for _, reader in self._readers:
+                reader.set_trace_callback(callback)
+    
+    def _reader(self) -> Optional[sqlite3.Connection]:
+        """Kết nối đọc của luồng hiện tại (tạo khi cần), None nếu không dùng pool"""
+        if not self.read_pool:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            conn.execute('PRAGMA query_only=ON')
+            self._local.conn = conn
+            with self._readers_lock:
+                # Đóng kết nối của các luồng đã kết thúc (Streamlit có thể tạo luồng mới cho mỗi phiên)
+                alive = []
+                for thread, reader in self._readers:
+                    if thread.is_alive():
+                        alive.append((thread, reader))
+                    else:
+                        reader.close()
+                alive.append((threading.current_thread(), conn))
+                self._readers = alive
+        return conn
+    
+    @contextlib.contextmanager
+    def _reading(self):
+        """Cursor cho truy vấn đọc: dùng kết nối đọc của luồng, hoặc kết nối ghi (có khóa)"""
+        conn = self._reader()
+        if conn is None:
+            with self.lock:
+                yield self.cursor
+            return
+        
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+    
+    # === Giao dịch ===
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Gom nhiều thao tác ghi vào một giao dịch (một lần commit/fsync).
+        
+        Khối giữ khóa ghi tới khi kết thúc. Các phương thức ghi trong khối không
+        tự commit; lỗi của bất kỳ thao tác nào được ném ra ngoài khối và toàn bộ
+        khối bị rollback. Khối lồng nhau chỉ commit/rollback ở khối ngoài cùng.
+        """
+        with self.lock:
+            outermost = self._tx_depth == 0
+            self._tx_depth += 1
+            try:
+                yield self
+                if outermost:
+                    self.conn.commit()
+                    tables, self._tx_tables = self._tx_tables, set()
+                    self._bump_generation(*tables)
+                    self._notify_commit()
+            except BaseException:
+                if outermost:
+                    self.conn.rollback()
+                    self._tx_tables = set()
+                raise
+            finally:
+                self._tx_depth -= 1
+    
+    def _commit(self, *tables: str) -> None:
+        """Commit và đánh dấu các bảng đã thay đổi; trong transaction() thì hoãn tới cuối khối (cần giữ khóa ghi)"""
+        if self._tx_depth:
+            self._tx_tables.update(tables)
+            return
+        self.conn.commit()
+        self._bump_generation(*tables)
+        self._notify_commit()
+    
+    def _notify_commit(self) -> None:
+        """Ghi nhận một lần commit và đánh thức các subscribe() đang chờ"""
+        self._last_write = time.monotonic()
+        with self._commit_cond:
+            self._commits += 1
+            self._commit_cond.notify_all()
+    
+    def _abort(self, error: Exception) -> None:
+        """Rollback sau lỗi ghi; trong transaction() thì ném lỗi ra để hủy cả khối"""
+        with self.lock:
+            if self._tx_depth:
+                raise error
+            self.conn.rollback()
+    
+    # === Bộ đệm đọc theo thế hệ ===
+    def _cached(self, key: Tuple, tables: Tuple[str, ...], load):
+        """
+        Trả về kết quả đệm của `key` nếu thế hệ các bảng phụ thuộc chưa đổi,
+        ngược lại gọi `load()` và lưu kết quả. Kết quả trả về là bản sao nông.
+        """
+        if not self.cache_enabled:
+            return load()
+        
+        with self._cache_lock:
+            # Lấy thế hệ trước khi truy vấn: nếu có ghi xen giữa, kết quả sẽ bị coi là cũ
+            generation = tuple(self._generations[table] for table in tables)
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] == generation:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return copy.copy(entry[2])
+            self.cache_misses += 1
+        
+        value = load()
+        with self._cache_lock:
+            self._cache[key] = (tables, generation, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return copy.copy(value)
+    
+    def _bump_generation(self, *tables: str) -> None:
+        """Đánh dấu các bảng đã thay đổi, bỏ các kết quả đệm phụ thuộc vào chúng"""
+        with self._cache_lock:
+            for table in tables:
+                self._generations[table] += 1
+            stale = [key for key, (depends, _, _) in self._cache.items()
+                     if any(table in depends for table in tables)]
+            for key in stale:
+                del self._cache[key]
+    
+    def invalidate_cache(self, *tables: str) -> None:
+        """Bỏ bộ đệm của các bảng chỉ định (mặc định: tất cả), ví dụ sau khi tiến trình khác ghi vào database"""
+        self._bump_generation(*(tables or self._CACHED_TABLES))
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Số lần trúng/trượt bộ đệm, số kết quả đang giữ và thế hệ của từng bảng"""
+        with self._cache_lock:
+            total = self.cache_hits + self.cache_misses
+            return {
+                'hits': self.cache_hits,
+                'misses': self.cache_misses,
+                'hit_rate': self.cache_hits / total if total else 0.0,
+                'entries': len(self._cache),
+                'generations': dict(self._generations),
+            }
+    
     def _create_tables(self):
         """Tạo các bảng trong database"""
         with self.lock:  # Sử dụng khóa khi truy cập database
@@ -72,6 +325,32 @@ class DatabaseManager:
             )
             ''')
             
+            # Bảng người tham gia sự kiện (theo ID thành viên, không so khớp theo tên)
+            self.cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'event_participants'"
+            )
+            backfill_participants = self.cursor.fetchone() is None
+            self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS event_participants (
+                event_id INTEGER NOT NULL,
+                member_id INTEGER NOT NULL,
+                PRIMARY KEY (event_id, member_id)
+            )
+            ''')
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_event_participants_member ON event_participants(member_id)'
+            )
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_created_by ON events(created_by)')
+            # Chỉ mục theo ngày giờ cho truy vấn khoảng thời gian (đã sắp xếp sẵn)
+            self.cursor.execute('DROP INDEX IF EXISTS idx_events_date')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_events_date_time ON events(date, time)')
+            # Phân trang theo (date, time, id) cần giá trị khác NULL
+            self.cursor.execute("UPDATE events SET date = IFNULL(date, ''), time = IFNULL(time, '') "
+                                "WHERE date IS NULL OR time IS NULL")
+            if backfill_participants:
+                # Chuyển danh sách tên người tham gia của các sự kiện có sẵn sang bảng mới
+                self._backfill_event_participants()
+            
             # Bảng ghi chú
             self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS notes (
@@ -84,7 +363,7 @@ class DatabaseManager:
             )
             ''')
             
-            # Bảng lịch sử chat
+            # Bảng lịch sử chat (mỗi dòng là một cuộc trò chuyện)
             self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS chat_history (
                 id INTEGER PRIMARY KEY,
@@ -94,22 +373,723 @@ class DatabaseManager:
                 summary TEXT
             )
             ''')
+            self._ensure_column('chat_history', 'conversation_id', 'TEXT')
+            self.cursor.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS idx_chat_history_conversation ON chat_history(conversation_id)'
+            )
+            # Chỉ mục cho việc đọc lịch sử mới nhất và giới hạn số cuộc trò chuyện của một thành viên
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_chat_history_member_time ON chat_history(member_id, timestamp)'
+            )
+            
+            # Bảng tin nhắn của từng cuộc trò chuyện (chỉ nối thêm tin nhắn mới)
+            self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY,
+                conversation_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                role TEXT,
+                content TEXT NOT NULL,
+                UNIQUE (conversation_id, position)
+            )
+            ''')
+            # Xóa một cuộc trò chuyện thì xóa luôn tin nhắn của nó
+            self.cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_chat_history_delete_messages
+            AFTER DELETE ON chat_history
+            WHEN OLD.conversation_id IS NOT NULL
+            BEGIN
+                DELETE FROM chat_messages WHERE conversation_id = OLD.conversation_id;
+            END
+            ''')
+            
+            # Chỉ mục tìm kiếm toàn văn
+            self._create_search_index()
+            
+            # Nhật ký thay đổi cho subscribe()
+            self._create_change_log()
             
             self.conn.commit()
     
+    def _backfill_event_participants(self) -> None:
+        """
+        Điền event_participants từ danh sách tên trong events.participants
+        (ghép theo tên thành viên). Người gọi giữ khóa ghi và commit.
+        """
+        self.cursor.execute(f'''
+        INSERT OR IGNORE INTO event_participants (event_id, member_id)
+        SELECT e.id, m.id FROM events e, {self._JSON_PARTICIPANTS} p
+        JOIN family_members m ON m.name = p.value
+        ''')
+    
+    def _create_search_index(self) -> None:
+        """
+        Tạo các bảng FTS5 cho tìm kiếm toàn văn cùng trigger đồng bộ với bảng nguồn.
+        
+        Tokenizer unicode61 (remove_diacritics 2) bỏ dấu tiếng Việt; riêng chữ
+        "đ" không phải dấu nên được thay bằng "d" ngay trong trigger.
+        """
+        try:
+            for fts_table, source, columns, _ in self._SEARCH_TABLES.values():
+                self.cursor.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts_table,))
+                backfill = self.cursor.fetchone() is None
+                self.cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+                    f"{', '.join(columns)}, tokenize = 'unicode61 remove_diacritics 2')"
+                )
+                
+                column_list = ', '.join(columns)
+                new_values = ', '.join(self._search_value_sql(column, 'NEW.') for column in columns)
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_insert AFTER INSERT ON {source}
+                BEGIN
+                    INSERT INTO {fts_table} (rowid, {column_list}) VALUES (NEW.id, {new_values});
+                END
+                ''')
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_delete AFTER DELETE ON {source}
+                BEGIN
+                    DELETE FROM {fts_table} WHERE rowid = OLD.id;
+                END
+                ''')
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{fts_table}_update AFTER UPDATE OF {column_list} ON {source}
+                BEGIN
+                    DELETE FROM {fts_table} WHERE rowid = OLD.id;
+                    INSERT INTO {fts_table} (rowid, {column_list}) VALUES (NEW.id, {new_values});
+                END
+                ''')
+                
+                if backfill:
+                    self.cursor.execute(
+                        f"INSERT INTO {fts_table} (rowid, {column_list}) SELECT id, "
+                        f"{', '.join(self._search_value_sql(column) for column in columns)} FROM {source}"
+                    )
+            self.search_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite không hỗ trợ FTS5, tắt tính năng tìm kiếm: {e}")
+            self.search_enabled = False
+    
+    def _create_change_log(self) -> None:
+        """
+        Tạo bảng changes và trigger ghi lại mọi thêm / sửa / xóa trên các bảng
+        dữ liệu chính, kể cả thay đổi từ tiến trình khác hoặc SQL chạy trực tiếp.
+        Dòng nhật ký nằm cùng giao dịch với thay đổi nên rollback thì mất theo.
+        """
+        self.cursor.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            op TEXT NOT NULL,
+            row_id TEXT,
+            ts TEXT NOT NULL
+        )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_changes_ts ON changes(ts)')
+        for table in self._CHANGE_TABLES:
+            update = 'UPDATE'
+            if table in self._CHANGE_COLUMNS:
+                update = f"UPDATE OF {', '.join(self._CHANGE_COLUMNS[table])}"
+            for op, event, row in (('insert', 'INSERT', 'NEW'), ('update', update, 'NEW'), ('delete', 'DELETE', 'OLD')):
+                # Trigger tạo bởi phiên bản trước với điều kiện khác thì tạo lại
+                self.cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?",
+                                    (f'trg_changes_{table}_{op}',))
+                existing = self.cursor.fetchone()
+                if existing and f'AFTER {event} ON {table}' not in existing[0]:
+                    self.cursor.execute(f'DROP TRIGGER trg_changes_{table}_{op}')
+                self.cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_changes_{table}_{op} AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO changes (table_name, op, row_id, ts)
+                    VALUES ('{table}', '{op}', {row}.id, datetime('now', 'localtime'));
+                END
+                ''')
+    
+    @staticmethod
+    def _search_value_sql(column: str, prefix: str = '') -> str:
+        """
+        Biểu thức SQL cho giá trị được đánh chỉ mục của một cột: thay "đ" bằng "d"
+        (các dấu khác do tokenizer xử lý); cột tags (JSON) được nối thành chuỗi.
+        """
+        expression = f'{prefix}{column}'
+        if column == 'tags':
+            expression = (f"(SELECT group_concat(value, ' ') FROM json_each("
+                          f"CASE WHEN json_valid({expression}) THEN {expression} ELSE '[]' END))")
+        return f"replace(replace(coalesce({expression}, ''), 'đ', 'd'), 'Đ', 'D')"
+    
+    def _ensure_column(self, table: str, column: str, definition: str) -> None:
+        """Thêm cột vào bảng đã tồn tại nếu cột chưa có (nâng cấp schema)"""
+        self.cursor.execute(f'PRAGMA table_info({table})')
+        if column not in [row['name'] for row in self.cursor.fetchall()]:
+            self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
+    def _page_columns(self, table: str, columns: Optional[Iterable[str]]) -> List[str]:
+        """Kiểm tra danh sách cột được chọn (mặc định: tất cả)"""
+        allowed = self._PAGE_COLUMNS[table]
+        columns = list(columns) if columns else list(allowed)
+        unknown = [column for column in columns if column not in allowed]
+        if unknown:
+            raise ValueError(f"Cột không hợp lệ cho bảng {table}: {unknown}")
+        return columns
+    
+    def _decode_column(self, column: str, value: Any) -> Any:
+        if column in self._JSON_COLUMNS:
+            return json.loads(value) if value else self._JSON_COLUMNS[column]()
+        return value
+    
+    def _iter_keyset(self, table: str, after_id: Any, limit: Optional[int],
+                     columns: Optional[Iterable[str]], where: str = '', params: Tuple = (),
+                     descending: bool = False, keys: Tuple[str, ...] = ('id',)) -> Iterator[Tuple[str, Dict]]:
+        """
+        Duyệt bảng theo khóa (keyset pagination): mỗi truy vấn chỉ đọc một trang
+        sau `after_id`, không dùng OFFSET và không giữ kết nối giữa các trang.
+        
+        Mặc định khóa là id; với khóa nhiều cột (ví dụ (date, time, id)) thì
+        after_id là tuple giá trị các cột đó và so sánh theo row value.
+        """
+        columns = self._page_columns(table, columns)
+        order, compare = ('DESC', '<') if descending else ('ASC', '>')
+        key_list = ', '.join(keys)
+        selected = ', '.join(dict.fromkeys(['id', *keys, *columns]))
+        remaining = limit
+        
+        while remaining is None or remaining > 0:
+            page_size = self.PAGE_SIZE if remaining is None else min(self.PAGE_SIZE, remaining)
+            clauses = [where] if where else []
+            page_params = list(params)
+            if after_id is not None:
+                if len(keys) == 1:
+                    clauses.append(f'{key_list} {compare} ?')
+                    page_params.append(int(after_id))
+                else:
+                    clauses.append(f'({key_list}) {compare} ({", ".join("?" * len(keys))})')
+                    page_params.extend(after_id)
+            query = f'SELECT {selected} FROM {table}'
+            if clauses:
+                query += f' WHERE {" AND ".join(clauses)}'
+            query += f' ORDER BY {", ".join(f"{key} {order}" for key in keys)} LIMIT ?'
+            
+            try:
+                with self._reading() as cursor:
+                    cursor.execute(query, page_params + [page_size])
+                    rows = cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Lỗi khi đọc trang dữ liệu từ bảng {table}: {e}")
+                return
+            
+            for row in rows:
+                yield str(row['id']), {column: self._decode_column(column, row[column]) for column in columns}
+            
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1]['id'] if len(keys) == 1 else tuple(rows[-1][key] for key in keys)
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    def iter_family_members(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None,
+                            descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt thành viên theo trang (ID, thông tin)"""
+        return self._iter_keyset('family_members', after_id, limit, columns, descending=descending)
+    
+    def iter_events(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                    columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                    participant: Optional[str] = None, descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt sự kiện theo trang, có thể lọc theo người tạo và/hoặc người tham gia (ID thành viên)"""
+        where, params = self._event_filters(created_by, participant)
+        return self._iter_keyset('events', after_id, limit, columns, where, params, descending)
+    
+    def iter_events_by_date(self, after: Optional[Tuple[str, str, int]] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                            participant: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt sự kiện theo (ngày, giờ, ID) sau con trỏ `after`, dùng chỉ mục idx_events_date_time"""
+        where, params = self._event_filters(created_by, participant)
+        after = (after[0], after[1], int(after[2])) if after is not None else None
+        return self._iter_keyset('events', after, limit, columns, where, params, keys=('date', 'time', 'id'))
+    
+    @staticmethod
+    def _event_filters(created_by: Optional[str], participant: Optional[str]) -> Tuple[str, Tuple]:
+        """Điều kiện WHERE lọc sự kiện theo người tạo / người tham gia"""
+        clauses, params = [], []
+        if created_by:
+            clauses.append('created_by = ?')
+            params.append(created_by)
+        if participant:
+            clauses.append('id IN (SELECT event_id FROM event_participants WHERE member_id = ?)')
+            params.append(participant)
+        return ' AND '.join(clauses), tuple(params)
+    
+    def iter_notes(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                   columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                   descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt ghi chú theo trang, có thể lọc theo người tạo"""
+        where, params = ('created_by = ?', (created_by,)) if created_by else ('', ())
+        return self._iter_keyset('notes', after_id, limit, columns, where, params, descending)
+    
+    def iter_chat_history(self, member_id: str, after_id: Optional[str] = None, limit: Optional[int] = None,
+                          columns: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Duyệt các cuộc trò chuyện của thành viên, mới nhất trước (ID cuộc trò chuyện, dữ liệu).
+        
+        after_id là ID cuộc trò chuyện cuối cùng của trang trước; tin nhắn chỉ
+        được đọc khi cột "messages" được chọn.
+        """
+        columns = self._page_columns('chat_history', columns)
+        remaining = limit
+        
+        while remaining is None or remaining > 0:
+            page_size = self.PAGE_SIZE if remaining is None else min(self.PAGE_SIZE, remaining)
+            query = 'SELECT id, conversation_id, timestamp, summary, messages FROM chat_history WHERE member_id = ?'
+            params: List[Any] = [member_id]
+            if after_id is not None:
+                query += ''' AND (timestamp, id) < (
+                    SELECT timestamp, id FROM chat_history WHERE conversation_id = ?)'''
+                params.append(after_id)
+            query += ' ORDER BY timestamp DESC, id DESC LIMIT ?'
+            
+            try:
+                with self._reading() as cursor:
+                    cursor.execute(query, params + [page_size])
+                    rows = cursor.fetchall()
+                    page = []
+                    for row in rows:
+                        entry = {}
+                        for column in columns:
+                            entry[column] = (
+                                self._load_conversation_messages(cursor, row) if column == 'messages' else row[column]
+                            )
+                        page.append((row['conversation_id'], entry))
+            except Exception as e:
+                logger.error(f"Lỗi khi đọc trang lịch sử chat của thành viên ID={member_id}: {e}")
+                return
+            
+            yield from page
+            
+            if len(rows) < page_size or not rows[-1]['conversation_id']:
+                return
+            after_id = rows[-1]['conversation_id']
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    def get_models(self, table: str) -> List[Any]:
+        """
+        Đọc toàn bộ bảng dưới dạng model (FamilyMember / Event / Note) theo thứ tự ID.
+        
+        Dòng được dựng thẳng thành model qua row_factory, không qua sqlite3.Row
+        hay dict trung gian; các cột JSON chỉ được giải mã khi trường tương ứng
+        được đọc. Kết quả được lưu đệm như get_all_*: các model dùng chung với
+        bộ đệm, người gọi không nên sửa trực tiếp.
+        """
+        model = self._MODELS.get(table)
+        if model is None:
+            raise ValueError(f"Không có model cho bảng {table}")
+        columns = ', '.join(field.name for field in dataclasses.fields(model))
+        
+        def load():
+            with self._reading() as cursor:
+                # Cursor riêng: không đổi row_factory của cursor dùng chung
+                typed = cursor.connection.cursor()
+                typed.row_factory = row_factory(model)
+                try:
+                    return typed.execute(f'SELECT {columns} FROM {table} ORDER BY id').fetchall()
+                finally:
+                    typed.close()
+        
+        try:
+            return self._cached(('models', table), (table,), load)
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc model từ bảng {table}: {e}")
+            return []
+    
     def close(self):
-        """Đóng kết nối database"""
+        """Đóng kết nối database (kết nối ghi và mọi kết nối đọc)"""
+        with self._readers_lock:
+            for _, reader in self._readers:
+                reader.close()
+            self._readers = []
+        self._local = threading.local()
         with self.lock:
             if self.conn:
                 self.conn.close()
     
+    # === Nạp dữ liệu hàng loạt (công cụ chuyển dữ liệu) ===
+    # Bảng phụ được tính vào thế hệ bộ đệm của bảng chính
+    _PARENT_TABLES = {'chat_messages': 'chat_history', 'event_participants': 'events'}
+    
+    @staticmethod
+    def _check_identifiers(*names: str) -> None:
+        """Tên bảng/cột được ghép thẳng vào câu lệnh SQL nên chỉ chấp nhận chữ, số và _"""
+        for name in names:
+            if not re.fullmatch(r'\w+', name):
+                raise ValueError(f"Tên bảng/cột không hợp lệ: {name}")
+    
+    def _changed_tables(self, table: str) -> Tuple[str, ...]:
+        table = self._PARENT_TABLES.get(table, table)
+        return (table,) if table in self._generations else ()
+    
+    def insert_rows(self, table: str, columns: List[str], rows: Iterable[Tuple]) -> int:
+        """
+        Chèn nhiều dòng (giá trị theo thứ tự `columns`, giữ nguyên ID) bằng một
+        executemany; trả về số dòng đã chèn. Nên gọi trong transaction() để cả
+        lô chỉ commit một lần; khi đó lỗi được ném ra để hủy toàn bộ khối.
+        """
+        self._check_identifiers(table, *columns)
+        sql = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["?"] * len(columns))})'
+        try:
+            with self.lock:
+                self.cursor.executemany(sql, rows)
+                inserted = self.cursor.rowcount
+                self._commit(*self._changed_tables(table))
+                return inserted
+        except Exception as e:
+            logger.error(f"Lỗi khi chèn dữ liệu vào bảng {table}: {e}")
+            self._abort(e)
+            return 0
+    
+    def count_rows(self, table: str) -> int:
+        """Số dòng của một bảng"""
+        self._check_identifiers(table)
+        with self._reading() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {table}')
+            return cursor.fetchone()[0]
+    
+    def clear_table(self, table: str) -> int:
+        """Xóa mọi dòng của một bảng, trả về số dòng đã xóa (lỗi được ném ra trong transaction())"""
+        self._check_identifiers(table)
+        try:
+            with self.lock:
+                self.cursor.execute(f'DELETE FROM {table}')
+                deleted = self.cursor.rowcount
+                self._commit(*self._changed_tables(table))
+                return deleted
+        except Exception as e:
+            logger.error(f"Lỗi khi xóa dữ liệu bảng {table}: {e}")
+            self._abort(e)
+            return 0
+    
+    def iter_rows(self, table: str, columns: List[str]) -> Iterator[Tuple]:
+        """Duyệt các cột chỉ định của mọi dòng trong bảng (dạng tuple, chưa giải mã)"""
+        self._check_identifiers(table, *columns)
+        with self._reading() as cursor:
+            cursor.execute(f'SELECT {", ".join(columns)} FROM {table}')
+            for row in cursor:
+                yield tuple(row)
+    
+    def backfill_event_participants(self) -> bool:
+        """Liên kết người tham gia của mọi sự kiện với thành viên cùng tên (lỗi được ném ra trong transaction())"""
+        try:
+            with self.lock:
+                self._backfill_event_participants()
+                self._commit('events')
+                return True
+        except Exception as e:
+            logger.error(f"Lỗi khi liên kết người tham gia sự kiện: {e}")
+            self._abort(e)
+            return False
+    
+    # === Sao lưu ===
+    def backup(self, dest: str, pages_per_step: int = 256, compress: bool = False,
+               verify: bool = True) -> Dict[str, Any]:
+        """
+        Sao lưu database khi ứng dụng đang chạy bằng backup API của SQLite.
+        
+        Bản sao được chép từ một kết nối riêng, mỗi bước pages_per_step trang
+        (-1: chép một lần), nên kết nối ghi không bị khóa. Kết nối nguồn giữ một
+        giao dịch đọc trong suốt quá trình: ở chế độ WAL điều này không chặn thao
+        tác ghi, và bản sao là ảnh chụp nhất quán tại lúc bắt đầu (không phải
+        chép lại từ đầu khi có ghi xen giữa các bước). File đích được ghi qua file
+        tạm rồi đổi tên; compress=True nén kiểu gzip (zlib). verify=True chạy
+        PRAGMA integrity_check trên bản sao trước khi nén.
+        
+        Trả về báo cáo {path, pages, bytes, seconds, verified}, hoặc {} nếu lỗi.
+        """
+        started = time.perf_counter()
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        snapshot_path = f"{dest}.tmp" if not compress else f"{dest}.db.tmp"
+        progress = {'pages': 0}
+        
+        def on_progress(status: int, remaining: int, total: int) -> None:
+            progress['pages'] = total
+            logger.debug(f"Sao lưu: còn {remaining}/{total} trang")
+        
+        try:
+            target = sqlite3.connect(snapshot_path)
+            try:
+                if self.read_pool:
+                    source = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+                    try:
+                        # Giữ ảnh chụp WAL cố định cho mọi bước sao lưu
+                        source.execute('BEGIN')
+                        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+                        source.backup(target, pages=pages_per_step, progress=on_progress, sleep=0.01)
+                        source.execute('COMMIT')
+                    finally:
+                        source.close()
+                else:
+                    # Database trong bộ nhớ (hoặc không có WAL): chép từ kết nối ghi
+                    with self.lock:
+                        self.conn.backup(target, pages=pages_per_step, progress=on_progress, sleep=0.01)
+                
+                # Bản sao dùng journal thường để là một file duy nhất (không kèm -wal/-shm)
+                target.execute('PRAGMA journal_mode=DELETE')
+                verified = False
+                if verify:
+                    result = target.execute('PRAGMA integrity_check').fetchone()[0]
+                    if result != 'ok':
+                        raise sqlite3.DatabaseError(f"Bản sao lưu không hợp lệ: {result}")
+                    verified = True
+            finally:
+                target.close()
+            
+            if compress:
+                compressor = zlib.compressobj(level=6, wbits=31)  # wbits=31: định dạng gzip
+                with open(snapshot_path, 'rb') as src, open(f"{dest}.tmp", 'wb') as out:
+                    for chunk in iter(lambda: src.read(1 << 20), b''):
+                        out.write(compressor.compress(chunk))
+                    out.write(compressor.flush())
+                os.remove(snapshot_path)
+            os.replace(f"{dest}.tmp", dest)
+            
+            report = {
+                'path': dest,
+                'pages': progress['pages'],
+                'bytes': os.path.getsize(dest),
+                'seconds': round(time.perf_counter() - started, 3),
+                'verified': verified,
+            }
+            logger.info(f"Đã sao lưu database vào {dest}: {report['pages']} trang, {report['bytes']} byte, "
+                        f"{report['seconds']} giây")
+            return report
+        except Exception as e:
+            logger.error(f"Lỗi khi sao lưu database vào {dest}: {e}")
+            for path in {snapshot_path, f"{dest}.tmp"}:
+                if os.path.exists(path):
+                    os.remove(path)
+            return {}
+
+    # === Bảo trì ===
+    def idle_seconds(self) -> float:
+        """Số giây kể từ lần commit gần nhất qua đối tượng này"""
+        return time.monotonic() - self._last_write
+
+    def _page_stats(self) -> Dict[str, int]:
+        """Kích thước trang, tổng số trang và số trang trống của database (cần giữ khóa ghi)"""
+        return {
+            'page_size': self.conn.execute('PRAGMA page_size').fetchone()[0],
+            'page_count': self.conn.execute('PRAGMA page_count').fetchone()[0],
+            'freelist_count': self.conn.execute('PRAGMA freelist_count').fetchone()[0],
+        }
+
+    def _file_size(self) -> int:
+        """Dung lượng trên đĩa của database, tính cả file -wal"""
+        if self.db_path == ':memory:':
+            return 0
+        return sum(os.path.getsize(path) for path in (self.db_path, f"{self.db_path}-wal") if os.path.exists(path))
+
+    def apply_retention(self, chat_days: Optional[int] = None, event_days: Optional[int] = None) -> Dict[str, int]:
+        """
+        Xóa các cuộc trò chuyện cũ hơn chat_days ngày và các sự kiện đã qua quá
+        event_days ngày (None: giữ lại tất cả). Sự kiện không có ngày được giữ lại.
+        Trả về số cuộc trò chuyện / sự kiện đã xóa.
+        """
+        removed = {'chat_history': 0, 'events': 0}
+        if chat_days is None and event_days is None:
+            return removed
+
+        now = datetime.datetime.now()
+        try:
+            with self.lock:
+                if chat_days is not None:
+                    cutoff = (now - datetime.timedelta(days=chat_days)).strftime("%Y-%m-%d %H:%M:%S")
+                    # Tin nhắn của các cuộc trò chuyện bị xóa được trigger dọn theo
+                    self.cursor.execute('DELETE FROM chat_history WHERE timestamp < ?', (cutoff,))
+                    removed['chat_history'] = self.cursor.rowcount
+                if event_days is not None:
+                    cutoff = (now - datetime.timedelta(days=event_days)).strftime("%Y-%m-%d")
+                    expired = "SELECT id FROM events WHERE date IS NOT NULL AND date != '' AND date < ?"
+                    self.cursor.execute(f'DELETE FROM event_participants WHERE event_id IN ({expired})', (cutoff,))
+                    self.cursor.execute(f'DELETE FROM events WHERE id IN ({expired})', (cutoff,))
+                    removed['events'] = self.cursor.rowcount
+                self._commit('chat_history', 'events')
+
+            if any(removed.values()):
+                logger.info(f"Đã xóa dữ liệu hết hạn lưu trữ: {removed['chat_history']} cuộc trò chuyện, "
+                            f"{removed['events']} sự kiện")
+            return removed
+        except Exception as e:
+            logger.error(f"Lỗi khi xóa dữ liệu hết hạn lưu trữ: {e}")
+            self._abort(e)
+            return removed
+
+    def run_maintenance(self, vacuum_pages: int = 1000, step_pages: int = 100,
+                        chat_days: Optional[int] = None, event_days: Optional[int] = None,
+                        changes_days: Optional[float] = 7, convert_auto_vacuum: bool = False) -> Dict[str, Any]:
+        """
+        Bảo trì database: xóa dữ liệu hết hạn (apply_retention) và nhật ký thay
+        đổi cũ hơn changes_days ngày (None: giữ lại), trả tối đa
+        vacuum_pages trang trống về hệ điều hành bằng PRAGMA incremental_vacuum
+        rồi chạy PRAGMA optimize.
+
+        Trang trống được trả theo từng bước step_pages trang, nhả khóa ghi giữa
+        các bước để thao tác ghi của người dùng không phải chờ lâu. Database tạo
+        trước khi bật auto_vacuum=INCREMENTAL chỉ được chuyển (bằng một lần VACUUM
+        toàn bộ, giữ khóa ghi và cần thêm dung lượng đĩa bằng cỡ file) khi
+        convert_auto_vacuum=True; nếu không thì bỏ qua bước trả trang trống.
+
+        Trả về báo cáo {removed, pages_before, pages_after, free_pages,
+        bytes_reclaimed, file_bytes_before, file_bytes_after, full_vacuum,
+        seconds}, hoặc {} nếu lỗi.
+        """
+        started = time.perf_counter()
+        file_before = self._file_size()
+        removed = self.apply_retention(chat_days, event_days)
+        if changes_days is not None:
+            removed['changes'] = self.prune_changes(changes_days)
+
+        try:
+            with self.lock:
+                if self._tx_depth:
+                    raise RuntimeError("Không chạy bảo trì bên trong transaction()")
+                before = self._page_stats()
+                incremental = self.conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+                full_vacuum = not incremental and convert_auto_vacuum
+                if full_vacuum:
+                    # auto_vacuum chỉ đổi được qua VACUUM (chép lại toàn bộ database, chạy một lần)
+                    logger.info("Chuyển database sang auto_vacuum=INCREMENTAL bằng VACUUM toàn bộ")
+                    self.conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                    self.conn.execute('VACUUM')
+                elif not incremental:
+                    logger.info("Database chưa bật auto_vacuum=INCREMENTAL nên không trả được trang trống; "
+                                "chạy bảo trì với convert_auto_vacuum=True để chuyển (VACUUM toàn bộ)")
+
+            remaining = vacuum_pages
+            while remaining > 0 and incremental:
+                with self.lock:
+                    if not self.conn.execute('PRAGMA freelist_count').fetchone()[0]:
+                        break
+                    step = min(step_pages, remaining)
+                    # executescript chạy câu lệnh tới hết; execute() chỉ bước một lần (trả một trang)
+                    self.conn.executescript(f'PRAGMA incremental_vacuum({step});')
+                    remaining -= step
+
+            with self.lock:
+                # Đo trước PRAGMA optimize: ANALYZE có thể thêm trang vào sqlite_stat1
+                after = self._page_stats()
+                self.conn.execute('PRAGMA optimize')
+                if self.read_pool:
+                    # Ở chế độ WAL, file database chỉ nhỏ lại sau khi checkpoint
+                    self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+
+            report = {
+                'removed': removed,
+                'pages_before': before['page_count'],
+                'pages_after': after['page_count'],
+                'free_pages': after['freelist_count'],
+                # Thao tác ghi xen giữa các bước có thể làm database lớn thêm
+                'bytes_reclaimed': max(0, before['page_count'] - after['page_count']) * after['page_size'],
+                'file_bytes_before': file_before,
+                'file_bytes_after': self._file_size(),
+                'full_vacuum': full_vacuum,
+                'seconds': round(time.perf_counter() - started, 3),
+            }
+            logger.info(f"Bảo trì database xong: trả lại {report['bytes_reclaimed']} byte "
+                        f"({report['pages_before']} -> {report['pages_after']} trang, còn {report['free_pages']} "
+                        f"trang trống), file {file_before} -> {report['file_bytes_after']} byte")
+            return report
+        except Exception as e:
+            logger.error(f"Lỗi khi bảo trì database: {e}")
+            return {}
+
+    # === Nhật ký thay đổi ===
+    @staticmethod
+    def _change_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            'seq': row['seq'],
+            'table': row['table_name'],
+            'op': row['op'],
+            'row_id': row['row_id'],
+            'ts': row['ts'],
+        }
+    
+    def latest_change_seq(self) -> int:
+        """Số thứ tự của thay đổi mới nhất (0 nếu nhật ký trống)"""
+        try:
+            with self._reading() as cursor:
+                cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM changes')
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc nhật ký thay đổi: {e}")
+            return 0
+    
+    def get_changes(self, since_seq: int = 0, limit: int = 500) -> List[Dict]:
+        """Các thay đổi có seq > since_seq theo thứ tự: {seq, table, op, row_id, ts}"""
+        try:
+            with self._reading() as cursor:
+                cursor.execute(
+                    'SELECT seq, table_name, op, row_id, ts FROM changes WHERE seq > ? ORDER BY seq LIMIT ?',
+                    (since_seq, limit)
+                )
+                return [self._change_from_row(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc nhật ký thay đổi: {e}")
+            return []
+    
+    def subscribe(self, since_seq: Optional[int] = None, poll_interval: float = 1.0,
+                  stop: Optional[threading.Event] = None, batch_size: int = 500) -> Iterator[Dict]:
+        """
+        Generator trả về các thay đổi (như get_changes) ngay khi chúng được commit.
+        
+        since_seq=None: chỉ nhận thay đổi mới từ lúc gọi. Commit qua đối tượng
+        này đánh thức subscriber ngay; thay đổi từ tiến trình khác được thấy sau
+        tối đa poll_interval giây. Generator chặn luồng gọi: chạy trên luồng
+        riêng, dừng bằng `stop.set()` hoặc close().
+        
+        Nếu các thay đổi sau since_seq đã bị xóa (prune_changes), subscriber
+        nhận một bản ghi op='reset' (table=None) và nên bỏ toàn bộ dữ liệu đệm.
+        """
+        if since_seq is None:
+            since_seq = self.latest_change_seq()
+        
+        while stop is None or not stop.is_set():
+            with self._commit_cond:
+                seen = self._commits
+            
+            changes = self.get_changes(since_seq, batch_size)
+            if changes:
+                if changes[0]['seq'] > since_seq + 1:
+                    yield {'seq': changes[0]['seq'] - 1, 'table': None, 'op': 'reset', 'row_id': None, 'ts': None}
+                for change in changes:
+                    yield change
+                since_seq = changes[-1]['seq']
+                continue
+            
+            with self._commit_cond:
+                self._commit_cond.wait_for(
+                    lambda: self._commits != seen or (stop is not None and stop.is_set()),
+                    timeout=poll_interval
+                )
+    
+    def prune_changes(self, max_age_days: float = 7) -> int:
+        """Xóa các thay đổi cũ hơn max_age_days ngày khỏi nhật ký; trả về số dòng đã xóa"""
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self.lock:
+                self.cursor.execute('DELETE FROM changes WHERE ts < ?', (cutoff,))
+                removed = self.cursor.rowcount
+                self._commit()
+                return removed
+        except Exception as e:
+            logger.error(f"Lỗi khi dọn nhật ký thay đổi: {e}")
+            self._abort(e)
+            return 0
+    
     # === Các phương thức cho thành viên gia đình ===
     def get_all_family_members(self) -> Dict[str, Dict]:
         """Lấy tất cả thành viên gia đình"""
-        try:
-            with self.lock:
-                self.cursor.execute('SELECT * FROM family_members')
-                rows = self.cursor.fetchall()
+        def load():
+            with self._reading() as cursor:
+                cursor.execute('SELECT * FROM family_members')
+                rows = cursor.fetchall()
                 
                 result = {}
                 for row in rows:
@@ -122,16 +1102,19 @@ class DatabaseManager:
                     }
                 
                 return result
+        
+        try:
+            return self._cached(('family_members',), ('family_members',), load)
         except Exception as e:
             logger.error(f"Lỗi khi lấy dữ liệu thành viên: {e}")
             return {}
     
     def get_family_member(self, member_id: str) -> Optional[Dict]:
         """Lấy thông tin một thành viên cụ thể"""
-        try:
-            with self.lock:
-                self.cursor.execute('SELECT * FROM family_members WHERE id = ?', (member_id,))
-                row = self.cursor.fetchone()
+        def load():
+            with self._reading() as cursor:
+                cursor.execute('SELECT * FROM family_members WHERE id = ?', (member_id,))
+                row = cursor.fetchone()
                 
                 if row:
                     return {
@@ -141,6 +1124,9 @@ class DatabaseManager:
                         'added_on': row['added_on']
                     }
                 return None
+        
+        try:
+            return self._cached(('family_member', str(member_id)), ('family_members',), load)
         except Exception as e:
             logger.error(f"Lỗi khi lấy thành viên ID={member_id}: {e}")
             return None
@@ -156,16 +1142,17 @@ class DatabaseManager:
                     'INSERT INTO family_members (name, age, preferences, added_on) VALUES (?, ?, ?, ?)',
                     (details.get('name', ''), details.get('age', ''), preferences, added_on)
                 )
-                self.conn.commit()
+                member_id = self.cursor.lastrowid
+                self._link_member_events(member_id, details.get('name', ''))
+                self._commit('family_members', 'events')
                 
                 # Trả về ID mới tạo
-                member_id = str(self.cursor.lastrowid)
+                member_id = str(member_id)
                 logger.info(f"Đã thêm thành viên mới: {details.get('name')} với ID={member_id}")
                 return member_id
         except Exception as e:
             logger.error(f"Lỗi khi thêm thành viên: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             raise
     
     def update_family_member(self, member_id: str, details: Dict) -> bool:
@@ -194,65 +1181,125 @@ class DatabaseManager:
             
             with self.lock:
                 self.cursor.execute(query, params)
-                self.conn.commit()
+                updated = self.cursor.rowcount > 0
+                if updated and details.get('name'):
+                    self._link_member_events(member_id, details['name'])
+                self._commit('family_members', 'events')
                 
-                return self.cursor.rowcount > 0
+                return updated
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật thành viên ID={member_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
     def update_preference(self, member_id: str, key: str, value: str) -> bool:
         """Cập nhật sở thích của thành viên"""
+        return self.update_preferences(member_id, {key: value})
+    
+    def update_preferences(self, member_id: str, preferences: Dict[str, Any]) -> bool:
+        """
+        Cập nhật nhiều sở thích của một thành viên trong một câu lệnh UPDATE.
+        
+        Các khóa được ghi trực tiếp bằng json_set trong SQLite nên không phải đọc,
+        giải mã và ghi lại cả khối JSON khi đang giữ khóa ghi.
+        """
         try:
+            if not preferences:
+                return False
+            invalid = [key for key in preferences if not key or not isinstance(key, str) or '"' in key]
+            if invalid:
+                raise ValueError(f"Khóa sở thích không hợp lệ: {invalid}")
+            
+            paths = ', '.join(['?, json(?)'] * len(preferences))
+            params = []
+            for key, value in preferences.items():
+                params += [f'$."{key}"', json.dumps(value)]
+            
             with self.lock:
-                # Lấy sở thích hiện tại
-                self.cursor.execute('SELECT preferences FROM family_members WHERE id = ?', (member_id,))
-                row = self.cursor.fetchone()
-                
-                if not row:
-                    return False
-                
-                preferences = json.loads(row['preferences']) if row['preferences'] else {}
-                preferences[key] = value
-                
-                # Cập nhật sở thích
                 self.cursor.execute(
-                    'UPDATE family_members SET preferences = ? WHERE id = ?',
-                    (json.dumps(preferences), member_id)
+                    f'''UPDATE family_members SET preferences = json_set(
+                           CASE WHEN json_valid(preferences) THEN preferences ELSE '{{}}' END, {paths})
+                       WHERE id = ?''',
+                    params + [member_id]
                 )
-                self.conn.commit()
+                updated = self.cursor.rowcount > 0
+                self._commit('family_members')
                 
-                return True
+                return updated
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật sở thích cho thành viên ID={member_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
+    def get_member_names(self, member_ids: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """
+        Lấy {ID: tên} của các thành viên chỉ định (mặc định: tất cả) trong một
+        truy vấn, chỉ đọc cột tên. Dùng khi hiển thị danh sách thay vì gọi
+        get_family_member cho từng dòng.
+        """
+        ids = None if member_ids is None else sorted({str(member_id) for member_id in member_ids if member_id})
+        if ids == []:
+            return {}
+        
+        def load():
+            query = 'SELECT id, name FROM family_members'
+            if ids is not None:
+                query += f' WHERE id IN ({", ".join(["?"] * len(ids))})'
+            with self._reading() as cursor:
+                cursor.execute(query, ids or ())
+                return {str(row['id']): row['name'] for row in cursor.fetchall()}
+        
+        try:
+            return self._cached(('member_names', tuple(ids) if ids is not None else None), ('family_members',), load)
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy tên thành viên: {e}")
+            return {}
+    
+    def _link_member_events(self, member_id: Any, name: str) -> None:
+        """Gắn thành viên vào các sự kiện có tên họ trong danh sách người tham gia (cần giữ khóa ghi)"""
+        if not name:
+            return
+        self.cursor.execute(
+            f'''INSERT OR IGNORE INTO event_participants (event_id, member_id)
+               SELECT e.id, ? FROM events e, {self._JSON_PARTICIPANTS} p WHERE p.value = ?''',
+            (member_id, name)
+        )
+    
     # === Các phương thức cho sự kiện ===
+    def _set_event_participants(self, event_id: Any, names: List[str]) -> None:
+        """Ghi lại người tham gia của sự kiện theo ID thành viên (cần giữ khóa ghi)"""
+        self.cursor.execute('DELETE FROM event_participants WHERE event_id = ?', (event_id,))
+        names = [name for name in names if isinstance(name, str) and name]
+        if names:
+            self.cursor.execute(
+                f'''INSERT OR IGNORE INTO event_participants (event_id, member_id)
+                   SELECT ?, id FROM family_members WHERE name IN ({', '.join(['?'] * len(names))})''',
+                [event_id, *names]
+            )
+    
+    @staticmethod
+    def _event_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            'title': row['title'],
+            'date': row['date'],
+            'time': row['time'],
+            'description': row['description'],
+            'participants': json.loads(row['participants']) if row['participants'] else [],
+            'created_by': row['created_by'],
+            'created_on': row['created_on']
+        }
+    
     def get_all_events(self) -> Dict[str, Dict]:
         """Lấy tất cả sự kiện"""
-        try:
-            with self.lock:
-                self.cursor.execute('SELECT * FROM events')
-                rows = self.cursor.fetchall()
+        def load():
+            with self._reading() as cursor:
+                cursor.execute('SELECT * FROM events')
+                rows = cursor.fetchall()
                 
-                result = {}
-                for row in rows:
-                    event_id = str(row['id'])
-                    result[event_id] = {
-                        'title': row['title'],
-                        'date': row['date'],
-                        'time': row['time'],
-                        'description': row['description'],
-                        'participants': json.loads(row['participants']) if row['participants'] else [],
-                        'created_by': row['created_by'],
-                        'created_on': row['created_on']
-                    }
-                
-                return result
+                return {str(row['id']): self._event_from_row(row) for row in rows}
+        
+        try:
+            return self._cached(('events',), ('events',), load)
         except Exception as e:
             logger.error(f"Lỗi khi lấy dữ liệu sự kiện: {e}")
             return {}
@@ -270,26 +1317,76 @@ class DatabaseManager:
                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
                     (
                         details.get('title', ''),
-                        details.get('date', ''),
-                        details.get('time', ''),
+                        details.get('date') or '',
+                        details.get('time') or '',
                         details.get('description', ''),
                         participants,
                         details.get('created_by', ''),
                         created_on
                     )
                 )
-                self.conn.commit()
+                event_id = self.cursor.lastrowid
+                self._set_event_participants(event_id, details.get('participants', []))
+                self._commit('events')
                 
                 # Trả về ID mới tạo
-                event_id = str(self.cursor.lastrowid)
+                event_id = str(event_id)
                 logger.info(f"Đã thêm sự kiện mới: {details.get('title')} với ID={event_id}")
                 return event_id
         except Exception as e:
             logger.error(f"Lỗi khi thêm sự kiện: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return None
     
+    def add_events_bulk(self, events: List[Dict]) -> List[str]:
+        """
+        Thêm nhiều sự kiện bằng một executemany trong một giao dịch; người tham gia
+        của cả lô được gắn bằng một câu lệnh. Trả về các ID mới (rỗng nếu lỗi).
+        """
+        if not events:
+            return []
+        try:
+            created_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows = [
+                (
+                    details.get('title', ''),
+                    details.get('date') or '',
+                    details.get('time') or '',
+                    details.get('description', ''),
+                    json.dumps(details.get('participants', [])),
+                    details.get('created_by', ''),
+                    created_on
+                )
+                for details in events
+            ]
+            
+            with self.lock:
+                # Đang giữ khóa ghi nên các dòng mới là các ID lớn hơn ID lớn nhất hiện tại
+                self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM events')
+                last_id = self.cursor.fetchone()[0]
+                self.cursor.executemany(
+                    '''INSERT INTO events 
+                       (title, date, time, description, participants, created_by, created_on) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    rows
+                )
+                self.cursor.execute(
+                    f'''INSERT OR IGNORE INTO event_participants (event_id, member_id)
+                       SELECT e.id, m.id FROM events e, {self._JSON_PARTICIPANTS} p
+                       JOIN family_members m ON m.name = p.value WHERE e.id > ?''',
+                    (last_id,)
+                )
+                self.cursor.execute('SELECT id FROM events WHERE id > ? ORDER BY id', (last_id,))
+                event_ids = [str(row['id']) for row in self.cursor.fetchall()]
+                self._commit('events')
+                
+                logger.info(f"Đã thêm {len(event_ids)} sự kiện mới")
+                return event_ids
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm nhiều sự kiện: {e}")
+            self._abort(e)
+            return []
+    
     def update_event(self, event_id: str, details: Dict) -> bool:
         """Cập nhật thông tin sự kiện"""
         try:
@@ -299,7 +1396,8 @@ class DatabaseManager:
             for field in ['title', 'date', 'time', 'description']:
                 if field in details:
                     updates.append(f"{field} = ?")
-                    params.append(details[field])
+                    # date / time không để NULL (khóa phân trang của iter_events_by_date)
+                    params.append(details[field] or '' if field in ('date', 'time') else details[field])
             
             if 'participants' in details:
                 updates.append("participants = ?")
@@ -313,13 +1411,15 @@ class DatabaseManager:
             
             with self.lock:
                 self.cursor.execute(query, params)
-                self.conn.commit()
+                updated = self.cursor.rowcount > 0
+                if updated and 'participants' in details:
+                    self._set_event_participants(event_id, details['participants'])
+                self._commit('events')
                 
-                return self.cursor.rowcount > 0
+                return updated
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật sự kiện ID={event_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
     def delete_event(self, event_id: str) -> bool:
@@ -327,50 +1427,63 @@ class DatabaseManager:
         try:
             with self.lock:
                 self.cursor.execute('DELETE FROM events WHERE id = ?', (event_id,))
-                self.conn.commit()
+                deleted = self.cursor.rowcount > 0
+                self.cursor.execute('DELETE FROM event_participants WHERE event_id = ?', (event_id,))
+                self._commit('events')
                 
-                return self.cursor.rowcount > 0
+                return deleted
         except Exception as e:
             logger.error(f"Lỗi khi xóa sự kiện ID={event_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
     def filter_events_by_member(self, member_id: Optional[str] = None) -> Dict[str, Dict]:
-        """Lọc sự kiện theo thành viên cụ thể"""
+        """Lọc sự kiện mà thành viên tạo hoặc tham gia (một truy vấn dùng chỉ mục)"""
         try:
             if not member_id:
                 return self.get_all_events()
             
-            # Lấy thông tin thành viên
-            member = self.get_family_member(member_id)
-            if not member:
-                return {}
-            
-            member_name = member.get('name', '')
+            def load():
+                with self._reading() as cursor:
+                    cursor.execute(
+                        '''SELECT * FROM events WHERE created_by = ? 
+                           OR id IN (SELECT event_id FROM event_participants WHERE member_id = ?)''',
+                        (member_id, member_id)
+                    )
+                    return {str(row['id']): self._event_from_row(row) for row in cursor.fetchall()}
             
-            # Lấy tất cả sự kiện
-            all_events = self.get_all_events()
+            return self._cached(('events_by_member', str(member_id)), ('events',), load)
+        except Exception as e:
+            logger.error(f"Lỗi khi lọc sự kiện theo thành viên ID={member_id}: {e}")
+            return {}
+    
+    def get_events_between(self, start: Any, end: Any, member_id: Optional[str] = None) -> Dict[str, Dict]:
+        """Lấy sự kiện có ngày trong khoảng [start, end], sắp xếp theo ngày và giờ"""
+        try:
+            query = 'SELECT * FROM events WHERE date BETWEEN ? AND ?'
+            params = [self._date_key(start), self._date_key(end)]
+            if member_id:
+                query += ' AND (created_by = ? OR id IN (SELECT event_id FROM event_participants WHERE member_id = ?))'
+                params += [member_id, member_id]
+            query += ' ORDER BY date, time'
             
-            # Lọc sự kiện theo người tạo hoặc người tham gia
-            filtered_events = {}
-            for event_id, event in all_events.items():
-                if (event.get('created_by') == member_id or 
-                    member_name in event.get('participants', [])):
-                    filtered_events[event_id] = event
+            def load():
+                with self._reading() as cursor:
+                    cursor.execute(query, params)
+                    return {str(row['id']): self._event_from_row(row) for row in cursor.fetchall()}
             
-            return filtered_events
+            return self._cached(('events_between', *map(str, params)), ('events',), load)
         except Exception as e:
-            logger.error(f"Lỗi khi lọc sự kiện theo thành viên ID={member_id}: {e}")
+            logger.error(f"Lỗi khi lấy sự kiện từ {start} đến {end}: {e}")
             return {}
     
     # === Các phương thức cho ghi chú ===
     def get_all_notes(self) -> Dict[str, Dict]:
         """Lấy tất cả ghi chú"""
-        try:
-            with self.lock:
-                self.cursor.execute('SELECT * FROM notes')
-                rows = self.cursor.fetchall()
+        def load():
+            with self._reading() as cursor:
+                cursor.execute('SELECT * FROM notes')
+                rows = cursor.fetchall()
                 
                 result = {}
                 for row in rows:
@@ -384,6 +1497,9 @@ class DatabaseManager:
                     }
                 
                 return result
+        
+        try:
+            return self._cached(('notes',), ('notes',), load)
         except Exception as e:
             logger.error(f"Lỗi khi lấy dữ liệu ghi chú: {e}")
             return {}
@@ -405,7 +1521,7 @@ class DatabaseManager:
                         created_on
                     )
                 )
-                self.conn.commit()
+                self._commit('notes')
                 
                 # Trả về ID mới tạo
                 note_id = str(self.cursor.lastrowid)
@@ -413,40 +1529,149 @@ class DatabaseManager:
                 return note_id
         except Exception as e:
             logger.error(f"Lỗi khi thêm ghi chú: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return None
     
+    def add_notes_bulk(self, notes: List[Dict]) -> List[str]:
+        """Thêm nhiều ghi chú bằng một executemany trong một giao dịch, trả về các ID mới (rỗng nếu lỗi)"""
+        if not notes:
+            return []
+        try:
+            created_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows = [
+                (
+                    details.get('title', ''),
+                    details.get('content', ''),
+                    json.dumps(details.get('tags', [])),
+                    details.get('created_by', ''),
+                    created_on
+                )
+                for details in notes
+            ]
+            
+            with self.lock:
+                self.cursor.execute('SELECT COALESCE(MAX(id), 0) FROM notes')
+                last_id = self.cursor.fetchone()[0]
+                self.cursor.executemany(
+                    'INSERT INTO notes (title, content, tags, created_by, created_on) VALUES (?, ?, ?, ?, ?)',
+                    rows
+                )
+                self.cursor.execute('SELECT id FROM notes WHERE id > ? ORDER BY id', (last_id,))
+                note_ids = [str(row['id']) for row in self.cursor.fetchall()]
+                self._commit('notes')
+                
+                logger.info(f"Đã thêm {len(note_ids)} ghi chú mới")
+                return note_ids
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm nhiều ghi chú: {e}")
+            self._abort(e)
+            return []
+    
     def delete_note(self, note_id: str) -> bool:
         """Xóa ghi chú"""
         try:
             with self.lock:
                 self.cursor.execute('DELETE FROM notes WHERE id = ?', (note_id,))
-                self.conn.commit()
+                deleted = self.cursor.rowcount > 0
+                self._commit('notes')
                 
-                return self.cursor.rowcount > 0
+                return deleted
         except Exception as e:
             logger.error(f"Lỗi khi xóa ghi chú ID={note_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
+    # === Tìm kiếm toàn văn ===
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None, limit: int = 20,
+               member_id: Optional[str] = None) -> List[Dict]:
+        """
+        Tìm kiếm không phân biệt dấu trên ghi chú ("note"), sự kiện ("event") và
+        tóm tắt trò chuyện ("chat"), xếp hạng theo BM25 (điểm nhỏ hơn là khớp hơn).
+        Nếu có member_id, chỉ tìm trong các cuộc trò chuyện của thành viên đó.
+        """
+        match = self._search_expression(query)
+        kinds = list(kinds) if kinds else list(self._SEARCH_TABLES)
+        unknown = [kind for kind in kinds if kind not in self._SEARCH_TABLES]
+        if unknown:
+            raise ValueError(f"Loại tìm kiếm không hợp lệ: {unknown}")
+        if not match or not self.search_enabled:
+            return []
+        
+        hits = []
+        try:
+            with self._reading() as cursor:
+                for kind in kinds:
+                    fts_table, source, _, weights = self._SEARCH_TABLES[kind]
+                    # Lọc theo thành viên ngay trong truy vấn FTS để LIMIT chỉ tính các cuộc trò chuyện của họ
+                    owner, params = '', [match]
+                    if kind == 'chat' and member_id is not None:
+                        owner = 'AND rowid IN (SELECT id FROM chat_history WHERE member_id = ?)'
+                        params.append(member_id)
+                    cursor.execute(
+                        f'''SELECT s.*, hit.score FROM (
+                               SELECT rowid AS ref, bm25({fts_table}, {', '.join(map(str, weights))}) AS score
+                               FROM {fts_table} WHERE {fts_table} MATCH ? {owner} ORDER BY score LIMIT ?
+                           ) hit JOIN {source} s ON s.id = hit.ref
+                           ORDER BY hit.score''',
+                        (*params, limit)
+                    )
+                    hits.extend(self._search_hit(kind, row) for row in cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Lỗi khi tìm kiếm '{query}': {e}")
+            return []
+        
+        hits.sort(key=lambda hit: hit['score'])
+        return hits[:limit]
+    
+    @staticmethod
+    def _search_expression(query: str) -> str:
+        """Chuyển câu tìm kiếm thành biểu thức MATCH: mọi từ đều phải có (khớp tiền tố)"""
+        terms = re.findall(r'\w+', fold_vietnamese(query or ''))
+        return ' '.join(f'"{term}"*' for term in terms)
+    
+    @staticmethod
+    def _search_hit(kind: str, row: sqlite3.Row) -> Dict:
+        if kind == 'note':
+            return {'kind': kind, 'id': str(row['id']), 'title': row['title'], 'text': row['content'],
+                    'created_by': row['created_by'], 'score': row['score']}
+        if kind == 'event':
+            return {'kind': kind, 'id': str(row['id']), 'title': row['title'], 'text': row['description'],
+                    'date': row['date'], 'time': row['time'], 'score': row['score']}
+        return {'kind': kind, 'id': row['conversation_id'], 'title': row['timestamp'], 'text': row['summary'],
+                'member_id': row['member_id'], 'score': row['score']}
+    
     # === Các phương thức cho lịch sử chat ===
+    def encode_message(self, message: Any) -> Union[str, bytes]:
+        """Giá trị lưu vào chat_messages.content: JSON (giữ nguyên chữ tiếng Việt) được nén theo cấu hình"""
+        return encode_payload(json.dumps(message, ensure_ascii=False), self.compression)
+    
+    def _load_conversation_messages(self, cursor: sqlite3.Cursor, row: sqlite3.Row) -> List[Dict]:
+        """Lấy tin nhắn của một dòng chat_history (dạng cuộc trò chuyện hoặc bản chụp cũ)"""
+        if not row['conversation_id']:
+            return json.loads(decode_payload(row['messages']))
+        
+        cursor.execute(
+            'SELECT content FROM chat_messages WHERE conversation_id = ? ORDER BY position',
+            (row['conversation_id'],)
+        )
+        return [json.loads(decode_payload(message['content'])) for message in cursor.fetchall()]
+    
     def get_chat_history(self, member_id: str, limit: int = 10) -> List[Dict]:
         """Lấy lịch sử chat của một thành viên"""
         try:
-            with self.lock:
-                self.cursor.execute(
-                    'SELECT * FROM chat_history WHERE member_id = ? ORDER BY timestamp DESC LIMIT ?',
+            with self._reading() as cursor:
+                cursor.execute(
+                    'SELECT * FROM chat_history WHERE member_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?',
                     (member_id, limit)
                 )
-                rows = self.cursor.fetchall()
+                rows = cursor.fetchall()
                 
                 result = []
                 for row in rows:
                     result.append({
+                        'id': row['conversation_id'],
                         'timestamp': row['timestamp'],
-                        'messages': json.loads(row['messages']),
+                        'messages': self._load_conversation_messages(cursor, row),
                         'summary': row['summary']
                     })
                 
@@ -455,54 +1680,162 @@ class DatabaseManager:
             logger.error(f"Lỗi khi lấy lịch sử chat cho thành viên ID={member_id}: {e}")
             return []
     
-    def save_chat_history(self, member_id: str, messages: List[Dict], summary: Optional[str] = None) -> bool:
-        """Lưu lịch sử chat cho một thành viên"""
+    def get_chat_summaries(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy danh sách (ID, thời gian, tóm tắt) các cuộc trò chuyện, không kèm tin nhắn"""
+        def load():
+            with self._reading() as cursor:
+                cursor.execute(
+                    '''SELECT conversation_id, timestamp, summary FROM chat_history 
+                       WHERE member_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                    (member_id, limit)
+                )
+                return [
+                    {'id': row['conversation_id'], 'timestamp': row['timestamp'], 'summary': row['summary']}
+                    for row in cursor.fetchall()
+                ]
+        
+        try:
+            return self._cached(('chat_summaries', str(member_id), limit), ('chat_history',), load)
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy tóm tắt lịch sử chat cho thành viên ID={member_id}: {e}")
+            return []
+    
+    def get_conversation(self, member_id: str, conversation_id: str) -> Optional[Dict]:
+        """Lấy một cuộc trò chuyện (kèm tin nhắn) theo ID"""
+        try:
+            with self._reading() as cursor:
+                cursor.execute(
+                    'SELECT * FROM chat_history WHERE member_id = ? AND conversation_id = ?',
+                    (member_id, conversation_id)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                
+                return {
+                    'id': row['conversation_id'],
+                    'timestamp': row['timestamp'],
+                    'messages': self._load_conversation_messages(cursor, row),
+                    'summary': row['summary']
+                }
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy cuộc trò chuyện ID={conversation_id}: {e}")
+            return None
+    
+    def save_chat_history(self, member_id: str, messages: List[Dict], summary: Optional[str] = None,
+                          conversation_id: Optional[str] = None) -> bool:
+        """
+        Lưu lịch sử chat cho một thành viên.
+        
+        Mỗi cuộc trò chuyện có một ID ổn định; những lần lưu sau chỉ chèn các
+        tin nhắn mới vào bảng chat_messages thay vì lưu lại toàn bộ cuộc trò chuyện.
+        Nếu tin nhắn cuối đã lưu không khớp (tin nhắn bị sửa hoặc cuộc trò chuyện
+        ngắn lại), toàn bộ tin nhắn được ghi lại như ChatHistoryStore.save.
+        """
         try:
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            messages_json = json.dumps(messages)
+            conversation_id = conversation_id or uuid.uuid4().hex
             
             with self.lock:
                 self.cursor.execute(
-                    'INSERT INTO chat_history (member_id, timestamp, messages, summary) VALUES (?, ?, ?, ?)',
-                    (member_id, timestamp, messages_json, summary or "")
+                    'SELECT id FROM chat_history WHERE conversation_id = ?', (conversation_id,)
                 )
-                self.conn.commit()
+                if self.cursor.fetchone():
+                    self.cursor.execute(
+                        'UPDATE chat_history SET timestamp = ?, summary = ? WHERE conversation_id = ?',
+                        (timestamp, summary or "", conversation_id)
+                    )
+                else:
+                    self.cursor.execute(
+                        '''INSERT INTO chat_history (member_id, timestamp, messages, summary, conversation_id) 
+                           VALUES (?, ?, ?, ?, ?)''',
+                        (member_id, timestamp, '[]', summary or "", conversation_id)
+                    )
                 
-                # Giới hạn số lượng lịch sử lưu trữ
+                # Chỉ chèn các tin nhắn chưa được lưu, nếu tin nhắn cuối đã lưu vẫn khớp
+                self.cursor.execute(
+                    '''SELECT position, content FROM chat_messages WHERE conversation_id = ?
+                       ORDER BY position DESC LIMIT 1''',
+                    (conversation_id,)
+                )
+                last = self.cursor.fetchone()
+                stored_count = last['position'] + 1 if last else 0
+                if last and (stored_count > len(messages)
+                             or json.loads(decode_payload(last['content'])) != messages[stored_count - 1]):
+                    # Tin nhắn đã bị sửa hoặc cuộc trò chuyện ngắn lại: ghi lại toàn bộ
+                    self.cursor.execute('DELETE FROM chat_messages WHERE conversation_id = ?', (conversation_id,))
+                    stored_count = 0
+                self.cursor.executemany(
+                    'INSERT INTO chat_messages (conversation_id, position, role, content) VALUES (?, ?, ?, ?)',
+                    [
+                        (conversation_id, position, message.get('role'), self.encode_message(message))
+                        for position, message in enumerate(messages[stored_count:], stored_count)
+                    ]
+                )
+                
+                # Giới hạn số lượng cuộc trò chuyện lưu trữ (cùng giao dịch)
                 self._limit_chat_history(member_id, 10)
+                self._commit('chat_history')
                 
                 return True
         except Exception as e:
             logger.error(f"Lỗi khi lưu lịch sử chat cho thành viên ID={member_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
+            self._abort(e)
             return False
     
     def _limit_chat_history(self, member_id: str, limit: int) -> None:
-        """Giới hạn số lượng lịch sử chat lưu trữ cho một thành viên"""
-        try:
-            with self.lock:
-                # Lấy ID của các bản ghi cần xóa
-                self.cursor.execute(
-                    '''SELECT id FROM chat_history 
-                       WHERE member_id = ? 
-                       ORDER BY timestamp DESC 
-                       LIMIT -1 OFFSET ?''',
-                    (member_id, limit)
-                )
-                rows = self.cursor.fetchall()
-                
-                # Nếu có bản ghi cần xóa
-                if rows:
-                    ids_to_delete = [str(row['id']) for row in rows]
-                    placeholders = ', '.join(['?'] * len(ids_to_delete))
-                    
-                    self.cursor.execute(
-                        f'DELETE FROM chat_history WHERE id IN ({placeholders})',
-                        ids_to_delete
-                    )
-                    self.conn.commit()
-        except Exception as e:
-            logger.error(f"Lỗi khi giới hạn lịch sử chat cho thành viên ID={member_id}: {e}")
-            with self.lock:
-                self.conn.rollback()
\ No newline at end of file
+        """
+        Giới hạn số lượng cuộc trò chuyện lưu trữ cho một thành viên.
+        
+        Một câu lệnh DELETE dựa trên chỉ mục (member_id, timestamp); tin nhắn của
+        các cuộc trò chuyện bị xóa được trigger dọn theo. Người gọi giữ khóa ghi
+        và commit cùng với thao tác lưu.
+        """
+        self.cursor.execute(
+            '''DELETE FROM chat_history WHERE id IN (
+                   SELECT id FROM chat_history WHERE member_id = ?
+                   ORDER BY timestamp DESC, id DESC LIMIT -1 OFFSET ?
+               )''',
+            (member_id, limit)
+        )
+    
+    def compress_chat_history(self, batch_size: int = 500) -> int:
+        """
+        Nén lại các tin nhắn (và bản chụp lịch sử cũ) còn lưu dạng TEXT theo cách
+        nén hiện tại. Mỗi lô là một giao dịch ngắn nên không giữ khóa ghi lâu.
+        Trả về số dòng đã nén; dung lượng file chỉ giảm sau khi dọn trang trống.
+        """
+        if self.compression == 'none':
+            return 0
+        
+        compressed = 0
+        for table, column in (('chat_messages', 'content'), ('chat_history', 'messages')):
+            last_id = 0
+            while True:
+                try:
+                    with self.lock:
+                        self.cursor.execute(
+                            f'''SELECT id, {column} FROM {table}
+                                WHERE id > ? AND typeof({column}) = 'text' ORDER BY id LIMIT ?''',
+                            (last_id, batch_size)
+                        )
+                        rows = self.cursor.fetchall()
+                        if not rows:
+                            break
+                        last_id = rows[-1]['id']
+                        updates = []
+                        for row in rows:
+                            # Mã hóa lại như tin nhắn mới (dữ liệu cũ có thể là JSON escape ASCII)
+                            value = self.encode_message(json.loads(row[column]))
+                            if isinstance(value, bytes):
+                                updates.append((value, row['id']))
+                        self.cursor.executemany(f'UPDATE {table} SET {column} = ? WHERE id = ?', updates)
+                        self._commit('chat_history')
+                        compressed += len(updates)
+                except Exception as e:
+                    logger.error(f"Lỗi khi nén dữ liệu cũ của bảng {table}: {e}")
+                    self._abort(e)
+                    return compressed
+        
+        logger.info(f"Đã nén {compressed} dòng lịch sử chat ({self.compression})")
+        return compressed
@@ -0,0 +1,405 @@
+# database/json_store.py
+"""
+Kho dữ liệu JSON dùng chung trong tiến trình cho các file dữ liệu của app.py
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+import atexit
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger('family_assistant')
+
+# Kích thước journal (byte) vượt ngưỡng này thì gộp vào snapshot
+DEFAULT_COMPACT_THRESHOLD = 256 * 1024
+
+
+def _atomic_write(file_path: str, raw: bytes) -> None:
+    """Ghi file an toàn: ghi ra file tạm, fsync rồi đổi tên đè lên file đích"""
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(raw)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class JsonStore:
+    """
+    Một file JSON được nạp một lần cho mỗi tiến trình.
+
+    Streamlit chạy lại app.py sau mỗi thao tác, nhưng các module được import
+    vẫn nằm trong sys.modules, nên registry ở đây sống suốt vòng đời tiến trình.
+    File chỉ được đọc lại khi mtime/kích thước thay đổi và nội dung (hash) khác
+    với lần nạp trước; chỉ ghi khi dữ liệu thực sự thay đổi.
+
+    Mỗi thay đổi được nối vào một journal JSONL (`<file>.journal`) thay vì ghi
+    lại toàn bộ file. Dòng đầu của journal ghi hash của snapshot mà nó áp dụng
+    lên; khi journal vượt ngưỡng, nó được gộp vào snapshot mới. Việc ghi do
+    BackgroundWriter đảm nhận để gom các thay đổi liên tiếp thành một lần ghi.
+    """
+
+    _registry: Dict[str, 'JsonStore'] = {}
+    _registry_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, file_path: str) -> 'JsonStore':
+        """Lấy (hoặc tạo) store duy nhất cho một file"""
+        key = os.path.abspath(file_path)
+        with cls._registry_lock:
+            store = cls._registry.get(key)
+            if store is None:
+                store = cls(file_path)
+                cls._registry[key] = store
+            return store
+
+    def __init__(self, file_path: str, compact_threshold: int = DEFAULT_COMPACT_THRESHOLD):
+        """Khởi tạo store, chưa đọc file cho tới lần load() đầu tiên"""
+        self.file_path = file_path
+        self.journal_path = f"{file_path}.journal"
+        self.compact_threshold = compact_threshold
+        self.lock = threading.RLock()
+        self.data: Dict = {}
+        self._snapshot_signature: Optional[Tuple[int, int]] = None
+        self._journal_signature: Optional[Tuple[int, int]] = None
+        self._digest: Optional[str] = None
+        self._journal_offset = 0
+        self._journal_valid = False
+        self._journal_ops = 0
+        self._pending: List[bytes] = []
+        self._loaded = False
+
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        """Trả về (mtime_ns, size) của file hoặc None nếu file không tồn tại"""
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _hash(raw: bytes) -> str:
+        return hashlib.sha1(raw).hexdigest()
+
+    # === Đọc dữ liệu ===
+    def load(self) -> Dict:
+        """Trả về dữ liệu hiện tại, chỉ đọc lại file khi file đã thay đổi"""
+        with self.lock:
+            snapshot_signature = self._signature(self.file_path)
+            journal_signature = self._signature(self.journal_path)
+            if (self._loaded and snapshot_signature == self._snapshot_signature
+                    and journal_signature == self._journal_signature):
+                return self.data
+
+            if self._loaded and self._pending:
+                # File bị tiến trình khác thay đổi khi còn thay đổi chưa ghi:
+                # nối thay đổi của mình vào journal rồi nạp lại toàn bộ từ đĩa
+                logger.warning(f"{self.file_path} đã thay đổi bên ngoài khi còn dữ liệu chưa ghi")
+                self._flush_locked(allow_compact=False)
+                snapshot_signature = None
+
+            try:
+                if not self._loaded or snapshot_signature != self._snapshot_signature:
+                    self._load_snapshot()
+                elif journal_signature is None or journal_signature[1] < self._journal_offset:
+                    # Journal bị thay thế bởi tiến trình khác: nạp lại từ đầu
+                    self._load_snapshot()
+                else:
+                    self._replay_journal()
+            except Exception as e:
+                logger.error(f"Lỗi khi đọc {self.file_path}: {e}")
+
+            self._snapshot_signature = self._signature(self.file_path)
+            self._loaded = True
+            return self.data
+
+    def _load_snapshot(self) -> None:
+        """Đọc snapshot rồi áp dụng toàn bộ journal lên trên"""
+        raw = b""
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "rb") as f:
+                raw = f.read()
+
+        digest = self._hash(raw)
+        # Dữ liệu trong bộ nhớ đã chứa thao tác journal thì phải giải mã lại trước khi phát lại
+        if digest != self._digest or not self._loaded or self._journal_ops:
+            self.data = self._parse(raw)
+            self._digest = digest
+            logger.info(f"Đã nạp dữ liệu từ {self.file_path}: {len(self.data)} mục")
+        self._journal_offset = 0
+        self._journal_valid = False
+        self._journal_ops = 0
+        self._replay_journal()
+
+    def _parse(self, raw: bytes) -> Dict:
+        """Giải mã nội dung snapshot, đảm bảo kết quả là từ điển"""
+        try:
+            data = json.loads(raw.decode("utf-8")) if raw.strip() else {}
+        except Exception as e:
+            logger.error(f"Lỗi khi đọc {self.file_path}: {e}")
+            return {}
+        if not isinstance(data, dict):
+            logger.warning(f"Dữ liệu trong {self.file_path} không phải từ điển. Khởi tạo lại.")
+            return {}
+        return data
+
+    def _replay_journal(self) -> None:
+        """Áp dụng các dòng journal mới (kể từ vị trí đã đọc) lên dữ liệu"""
+        self._journal_signature = self._signature(self.journal_path)
+        if self._journal_signature is None:
+            self._journal_offset = 0
+            self._journal_valid = False
+            return
+
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._journal_offset)
+            chunk = f.read()
+
+        # Bỏ qua dòng cuối chưa ghi xong (ví dụ tiến trình bị dừng giữa chừng)
+        end = chunk.rfind(b"\n") + 1
+        applied = 0
+        for line in chunk[:end].splitlines():
+            if not line.strip():
+                continue
+            entry = json.loads(line.decode("utf-8"))
+            if self._journal_offset == 0 and applied == 0 and "base" in entry:
+                # Journal đã được gộp vào một snapshot khác thì không áp dụng nữa
+                self._journal_valid = entry["base"] == self._digest
+                applied += 1
+                continue
+            if self._journal_valid:
+                self._apply(entry)
+                self._journal_ops += 1
+            applied += 1
+        self._journal_offset += end
+
+    # === Thay đổi dữ liệu ===
+    def _apply(self, entry: Dict) -> None:
+        """Áp dụng một thao tác journal lên dữ liệu trong bộ nhớ"""
+        path = entry["path"]
+        parent = self.data
+        for key in path[:-1]:
+            parent = parent.setdefault(key, {})
+        if entry["op"] == "set":
+            parent[path[-1]] = entry["value"]
+        elif entry["op"] == "delete":
+            parent.pop(path[-1], None)
+        elif entry["op"] == "extend":
+            parent.setdefault(path[-1], []).extend(entry["value"])
+        else:
+            raise ValueError(f"Thao tác journal không hợp lệ: {entry['op']}")
+
+    def _lookup(self, path: List[str]) -> Tuple[bool, Any]:
+        """Tìm giá trị tại path, trả về (có tồn tại, giá trị)"""
+        node: Any = self.data
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                return False, None
+            node = node[key]
+        return True, node
+
+    def set(self, path: List[str], value: Any) -> bool:
+        """Đặt giá trị tại path và ghi thao tác vào journal"""
+        with self.lock:
+            self.load()
+            exists, current = self._lookup(path)
+            if exists and current == value:
+                return False
+            return self._record({"op": "set", "path": list(path), "value": value})
+
+    def delete(self, path: List[str]) -> bool:
+        """Xóa khóa tại path và ghi thao tác vào journal"""
+        with self.lock:
+            self.load()
+            exists, _ = self._lookup(path)
+            if not exists:
+                return False
+            return self._record({"op": "delete", "path": list(path)})
+
+    def extend(self, path: List[str], items: List[Any]) -> bool:
+        """Nối thêm phần tử vào danh sách tại path, journal chỉ chứa phần mới"""
+        if not items:
+            return False
+        with self.lock:
+            self.load()
+            return self._record({"op": "extend", "path": list(path), "value": list(items)})
+
+    def _record(self, entry: Dict) -> bool:
+        """Áp dụng thao tác trong bộ nhớ và xếp dòng journal chờ luồng ghi nền"""
+        self._apply(entry)
+        self._journal_ops += 1
+        self._pending.append((json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8"))
+        BackgroundWriter.instance().mark_dirty(self)
+        return True
+
+    # === Ghi xuống đĩa ===
+    @property
+    def pending_ops(self) -> int:
+        """Số thao tác đã áp dụng trong bộ nhớ nhưng chưa ghi xuống đĩa"""
+        return len(self._pending)
+
+    def flush(self) -> None:
+        """Ghi các thay đổi đang chờ: một lần nối journal hoặc một snapshot mới"""
+        with self.lock:
+            self._flush_locked(allow_compact=True)
+
+    def _flush_locked(self, allow_compact: bool) -> None:
+        if not self._pending:
+            return
+
+        pending_size = sum(len(line) for line in self._pending)
+        if allow_compact and self._journal_offset + pending_size > self.compact_threshold:
+            # Journal quá lớn: gộp vào snapshot mới
+            self.compact()
+            return
+
+        payload = b"".join(self._pending)
+        if not self._journal_valid:
+            # Journal cũ (hoặc chưa có) không khớp snapshot: bắt đầu journal mới
+            header = (json.dumps({"base": self._digest}) + "\n").encode("utf-8")
+            _atomic_write(self.journal_path, header + payload)
+            self._journal_valid = True
+            self._journal_offset = len(header) + len(payload)
+        else:
+            with open(self.journal_path, "ab") as f:
+                f.write(payload)
+            self._journal_offset += len(payload)
+        self._pending = []
+        self._journal_signature = self._signature(self.journal_path)
+
+    def compact(self) -> None:
+        """Ghi snapshot mới (nguyên tử) rồi bắt đầu journal rỗng trỏ tới snapshot đó"""
+        with self.lock:
+            raw = json.dumps(self.data, indent=4, ensure_ascii=False).encode("utf-8")
+            digest = self._hash(raw)
+            _atomic_write(self.file_path, raw)
+
+            # Nếu dừng giữa hai bước, journal cũ sẽ có "base" khác snapshot và bị bỏ qua
+            header = (json.dumps({"base": digest}) + "\n").encode("utf-8")
+            _atomic_write(self.journal_path, header)
+
+            self._digest = digest
+            self._pending = []
+            self._journal_valid = True
+            self._journal_offset = len(header)
+            self._journal_ops = 0
+            self._snapshot_signature = self._signature(self.file_path)
+            self._journal_signature = self._signature(self.journal_path)
+            logger.info(f"Đã lưu dữ liệu vào {self.file_path}: {len(self.data)} mục")
+
+
+class BackgroundWriter:
+    """
+    Luồng ghi nền dùng chung cho mọi JsonStore.
+
+    Các store được đánh dấu "bẩn" khi có thay đổi; luồng ghi đợi thêm một
+    khoảng `window` giây để gom các thay đổi đến sát nhau (ví dụ nhiều lệnh
+    trong cùng một phản hồi của trợ lý) rồi ghi mỗi store một lần.
+    """
+
+    _instance: Optional['BackgroundWriter'] = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> 'BackgroundWriter':
+        """Lấy luồng ghi dùng chung, khởi động khi dùng lần đầu"""
+        with cls._instance_lock:
+            if cls._instance is None:
+                window = float(os.environ.get("JSON_WRITE_WINDOW_MS", "50")) / 1000
+                cls._instance = cls(window=window)
+                atexit.register(cls._instance.stop)
+            return cls._instance
+
+    def __init__(self, window: float = 0.05):
+        """Khởi tạo luồng ghi với cửa sổ gom thay đổi (giây)"""
+        self.window = window
+        self._dirty: Dict[int, JsonStore] = {}
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._flush_count = 0
+        self._merged_ops = 0
+        self._last_flush_latency = 0.0
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+        self._thread = threading.Thread(target=self._run, name="json-store-writer", daemon=True)
+        self._thread.start()
+
+    def configure(self, window: float) -> None:
+        """Thay đổi cửa sổ gom thay đổi (giây)"""
+        self.window = window
+
+    def mark_dirty(self, store: JsonStore) -> None:
+        """Đánh dấu store có thay đổi cần ghi"""
+        with self._condition:
+            stopped = self._stopped
+            if not stopped:
+                self._dirty[id(store)] = store
+                self._condition.notify()
+        if stopped:
+            # Đang tắt ứng dụng: ghi ngay thay vì xếp hàng
+            store.flush()
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._dirty and not self._stopped:
+                    self._condition.wait()
+                if self._stopped and not self._dirty:
+                    return
+            # Đợi thêm để gom các thay đổi đến trong cùng cửa sổ
+            if self.window > 0 and not self._stopped:
+                time.sleep(self.window)
+            self.flush_all()
+
+    def flush_all(self) -> None:
+        """Ghi ngay mọi store đang có thay đổi"""
+        with self._condition:
+            stores = list(self._dirty.values())
+            self._dirty.clear()
+        if not stores:
+            return
+
+        started = time.perf_counter()
+        merged = 0
+        for store in stores:
+            try:
+                merged += store.pending_ops
+                store.flush()
+            except Exception as e:
+                logger.error(f"Lỗi khi ghi dữ liệu vào {store.file_path}: {e}")
+        latency = time.perf_counter() - started
+
+        with self._condition:
+            self._flush_count += 1
+            self._merged_ops += merged
+            self._last_flush_latency = latency
+            self._max_flush_latency = max(self._max_flush_latency, latency)
+            self._total_flush_latency += latency
+        logger.debug(f"Đã ghi {len(stores)} store ({merged} thay đổi) trong {latency * 1000:.1f}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        """Số liệu theo dõi: độ sâu hàng đợi và độ trễ ghi"""
+        with self._condition:
+            return {
+                "pending_stores": len(self._dirty),
+                "pending_ops": sum(store.pending_ops for store in self._dirty.values()),
+                "flushes": self._flush_count,
+                "merged_ops": self._merged_ops,
+                "last_flush_ms": self._last_flush_latency * 1000,
+                "max_flush_ms": self._max_flush_latency * 1000,
+                "avg_flush_ms": (self._total_flush_latency / self._flush_count * 1000) if self._flush_count else 0.0,
+            }
+
+    def stop(self) -> None:
+        """Ghi nốt các thay đổi còn lại và dừng luồng ghi (gọi khi tắt ứng dụng)"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self.flush_all()
+        self._thread.join(timeout=5)
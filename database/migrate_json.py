@@ -0,0 +1,453 @@
+# database/migrate_json.py
+"""
+Chuyển dữ liệu từ các file JSON sang cơ sở dữ liệu SQLite (chạy một lần)
+
+Cách dùng:
+    python -m database.migrate_json --data-dir . --db family_assistant.db
+
+Mỗi file được đọc theo luồng (không nạp toàn bộ vào bộ nhớ), các dòng được
+chèn theo lô bằng executemany trong một giao dịch cho mỗi bảng, giữ nguyên
+ID, sau đó kiểm tra số dòng và checksum giữa nguồn và database.
+"""
+
+import os
+import sys
+import json
+import uuid
+import hashlib
+import logging
+import argparse
+from typing import Dict, List, Optional, Any, Iterator, Tuple, TextIO
+
+from .json_store import JsonStore
+from .chat_store import ChatHistoryStore
+from .db_manager import DatabaseManager
+from .compression import decode_payload
+
+logger = logging.getLogger('family_assistant')
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 1 << 20  # Số ký tự đọc mỗi lần
+
+# Cột được kiểm tra checksum của từng bảng (theo đúng thứ tự khi chèn)
+TABLE_COLUMNS = {
+    "family_members": ["id", "name", "age", "preferences", "added_on"],
+    "events": ["id", "title", "date", "time", "description", "participants", "created_by", "created_on"],
+    "notes": ["id", "title", "content", "tags", "created_by", "created_on"],
+    "chat_history": ["member_id", "conversation_id", "timestamp", "summary"],
+    "chat_messages": ["conversation_id", "position", "role", "content"],
+}
+
+# Bảng liên kết được dựng lại từ dữ liệu đã chuyển (không kiểm tra checksum)
+LINK_TABLES = ["event_participants"]
+
+# Cột chứa tin nhắn, lưu bằng DatabaseManager.encode_message như save_chat_history
+# (checksum tính trên tin nhắn chưa mã hóa): bảng -> vị trí cột
+PAYLOAD_COLUMNS = {"chat_messages": 3}
+
+
+class JsonStream:
+    """
+    Bộ đọc JSON tăng dần trên một file.
+
+    Chỉ giữ trong bộ nhớ phần đệm đang đọc và giá trị hiện tại; các object
+    và mảng lớn được duyệt từng phần tử bằng `iter_object` / `iter_array`.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Đọc thêm một phần file vào bộ đệm, bỏ phần đã xử lý"""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Ký tự khác khoảng trắng tiếp theo ("" nếu hết file)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos] if self.pos < len(self.buf) else ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"JSON không hợp lệ: cần '{char}' nhưng gặp '{found}'")
+        self.pos += 1
+
+    def value(self) -> Any:
+        """Đọc trọn một giá trị JSON"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            if end == len(self.buf) and self._fill():
+                continue  # Số ở cuối bộ đệm có thể còn các chữ số tiếp theo
+            self.pos = end
+            return value
+
+    def _separator(self, closing: str) -> bool:
+        """Đọc ',' hoặc ký tự đóng; trả về True nếu còn phần tử"""
+        char = self.peek()
+        self.pos += 1
+        if char == closing:
+            return False
+        if char != ",":
+            raise ValueError(f"JSON không hợp lệ: cần ',' hoặc '{closing}' nhưng gặp '{char}'")
+        return True
+
+    def iter_object(self) -> Iterator[str]:
+        """Duyệt khóa của object; người gọi phải đọc giá trị của mỗi khóa trước khi lấy khóa tiếp theo"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if not self._separator("}"):
+                return
+
+    def iter_array(self) -> Iterator[Any]:
+        """Duyệt từng phần tử của mảng"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if not self._separator("]"):
+                return
+
+
+def _has_journal_ops(file_path: str) -> bool:
+    """File có journal chứa thay đổi chưa được gộp vào snapshot không"""
+    journal_path = f"{file_path}.journal"
+    if not os.path.exists(journal_path):
+        return False
+    with open(journal_path, "rb") as f:
+        f.readline()  # Dòng tiêu đề {"base": ...}
+        return bool(f.read(1))
+
+
+def _prepare(file_path: str) -> bool:
+    """Gộp journal vào snapshot trước khi đọc theo luồng; trả về False nếu không có dữ liệu"""
+    if _has_journal_ops(file_path):
+        logger.info(f"Gộp journal của {file_path} trước khi chuyển")
+        store = JsonStore.get(file_path)
+        store.load()
+        store.flush()
+        store.compact()
+    return os.path.exists(file_path)
+
+
+def _iter_records(file_path: str, chunk_size: int) -> Iterator[Tuple[str, Any]]:
+    """Duyệt các cặp (ID, bản ghi) của một file JSON dạng {id: bản ghi}"""
+    if not _prepare(file_path):
+        return
+    with open(file_path, "r", encoding="utf-8") as f:
+        stream = JsonStream(f, chunk_size)
+        if not stream.peek():
+            return
+        for key in stream.iter_object():
+            yield key, stream.value()
+
+
+def _text(value: Any) -> str:
+    """Chuẩn hóa giá trị cho cột TEXT giống cách SQLite sẽ đọc lại"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _row_digest(row: Tuple) -> int:
+    raw = json.dumps(list(row), ensure_ascii=False, separators=(",", ":"))
+    return int(hashlib.sha256(raw.encode("utf-8")).hexdigest(), 16)
+
+
+class _Checksum:
+    """Checksum không phụ thuộc thứ tự: tổng SHA-256 của từng dòng (mod 2^256)"""
+
+    def __init__(self):
+        self.count = 0
+        self.value = 0
+
+    def add(self, row: Tuple) -> None:
+        self.count += 1
+        self.value = (self.value + _row_digest(row)) % (1 << 256)
+
+    def hexdigest(self) -> str:
+        return f"{self.value:064x}"
+
+
+class JsonToSqliteMigrator:
+    """Chuyển family/events/notes/lịch sử chat từ file JSON vào DatabaseManager"""
+
+    def __init__(self, db: DatabaseManager, data_dir: str = ".",
+                 batch_size: int = DEFAULT_BATCH_SIZE, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.db = db
+        self.data_dir = data_dir
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.checksums: Dict[str, _Checksum] = {}
+        self.skipped: Dict[str, int] = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    # === Chèn theo lô ===
+    def _insert(self, table: str, rows: Iterator[Tuple]) -> int:
+        """Chèn các dòng theo lô trong một giao dịch; cập nhật checksum nguồn"""
+        checksum = self.checksums.setdefault(table, _Checksum())
+        columns = TABLE_COLUMNS[table]
+
+        payload = PAYLOAD_COLUMNS.get(table)
+        batch: List[Tuple] = []
+        for row in rows:
+            checksum.add(row)
+            if payload is not None:
+                row = row[:payload] + (self.db.encode_message(row[payload]),) + row[payload + 1:]
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self.db.insert_rows(table, columns, batch)
+                batch = []
+        if batch:
+            self.db.insert_rows(table, columns, batch)
+        return checksum.count
+
+    def _run_table(self, tables: List[str], loader) -> None:
+        """Chạy một bước chuyển trong một giao dịch, rollback nếu lỗi"""
+        with self.db.transaction():
+            loader()
+        logger.info("Đã chuyển " + ", ".join(
+            f"{table}: {self.checksums[table].count} dòng" for table in tables if table in self.checksums
+        ))
+
+    def _numeric_id(self, table: str, record_id: str, record: Any) -> Optional[int]:
+        """ID số của bản ghi (để giữ nguyên ID); bỏ qua bản ghi không hợp lệ"""
+        if str(record_id).isdigit() and isinstance(record, dict):
+            return int(record_id)
+        logger.warning(f"Bỏ qua bản ghi {table} ID={record_id}: ID không phải số hoặc dữ liệu sai định dạng")
+        self.skipped[table] = self.skipped.get(table, 0) + 1
+        return None
+
+    # === Các bảng ===
+    def _family_rows(self) -> Iterator[Tuple]:
+        for member_id, member in _iter_records(self._path("family_data.json"), self.chunk_size):
+            row_id = self._numeric_id("family_members", member_id, member)
+            if row_id is None:
+                continue
+            preferences = member.get("preferences")
+            yield (
+                row_id,
+                _text(member.get("name")),
+                _text(member.get("age")),
+                json.dumps(preferences if isinstance(preferences, dict) else {}),
+                _text(member.get("added_on"))
+            )
+
+    def _event_rows(self) -> Iterator[Tuple]:
+        for event_id, event in _iter_records(self._path("events_data.json"), self.chunk_size):
+            row_id = self._numeric_id("events", event_id, event)
+            if row_id is None:
+                continue
+            participants = event.get("participants")
+            yield (
+                row_id,
+                _text(event.get("title")),
+                _text(event.get("date")),
+                _text(event.get("time")),
+                _text(event.get("description")),
+                json.dumps(participants if isinstance(participants, list) else []),
+                _text(event.get("created_by")),
+                _text(event.get("created_on"))
+            )
+
+    def _load_events(self) -> None:
+        """Chèn sự kiện rồi liên kết người tham gia với thành viên (đã chuyển ở bước trước)"""
+        self._insert("events", self._event_rows())
+        self.db.backfill_event_participants()
+
+    def _note_rows(self) -> Iterator[Tuple]:
+        for note_id, note in _iter_records(self._path("notes_data.json"), self.chunk_size):
+            row_id = self._numeric_id("notes", note_id, note)
+            if row_id is None:
+                continue
+            tags = note.get("tags")
+            yield (
+                row_id,
+                _text(note.get("title")),
+                _text(note.get("content")),
+                json.dumps(tags if isinstance(tags, list) else []),
+                _text(note.get("created_by")),
+                _text(note.get("created_on"))
+            )
+
+    def _iter_conversations(self) -> Iterator[Tuple[str, Dict]]:
+        """
+        Duyệt (member_id, cuộc trò chuyện) từ thư mục lịch sử theo thành viên,
+        hoặc từ file chat_history.json cũ nếu chưa được tách.
+        """
+        chat_dir = self._path("chat_history")
+        index_path = os.path.join(chat_dir, "index.json")
+        if _prepare(index_path):
+            chat_store = ChatHistoryStore(chat_dir)
+            member_ids = list(JsonStore.get(index_path).load().keys())
+            for member_id in member_ids:
+                for key, value in _iter_records(chat_store._shard(member_id).file_path, self.chunk_size):
+                    if isinstance(value, dict):
+                        yield member_id, dict(value, id=value.get("id") or key)
+            return
+
+        legacy_path = self._path("chat_history.json")
+        if not _prepare(legacy_path):
+            return
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            stream = JsonStream(f, self.chunk_size)
+            if not stream.peek():
+                return
+            for member_id in stream.iter_object():
+                if stream.peek() != "[":
+                    stream.value()
+                    continue
+                for entry in stream.iter_array():
+                    yield member_id, entry
+
+    def _load_chat(self) -> None:
+        """Chèn cuộc trò chuyện vào chat_history và tin nhắn vào chat_messages"""
+        message_rows: List[Tuple] = []
+
+        def conversation_rows() -> Iterator[Tuple]:
+            for member_id, entry in self._iter_conversations():
+                if not isinstance(entry, dict):
+                    self.skipped["chat_history"] = self.skipped.get("chat_history", 0) + 1
+                    continue
+                conversation_id = entry.get("id") or uuid.uuid4().hex
+                for position, message in enumerate(entry.get("messages") or []):
+                    role = message.get("role") if isinstance(message, dict) else None
+                    message_rows.append((conversation_id, position, role, message))
+                yield (member_id, conversation_id, _text(entry.get("timestamp")), _text(entry.get("summary")))
+
+                # Tin nhắn được chèn theo lô cùng nhịp với cuộc trò chuyện
+                if len(message_rows) >= self.batch_size:
+                    self._insert("chat_messages", iter(message_rows))
+                    message_rows.clear()
+
+        checksum = self.checksums.setdefault("chat_history", _Checksum())
+        columns = [*TABLE_COLUMNS["chat_history"], "messages"]
+        batch: List[Tuple] = []
+        for row in conversation_rows():
+            checksum.add(row)
+            batch.append(row + ('[]',))
+            if len(batch) >= self.batch_size:
+                self.db.insert_rows("chat_history", columns, batch)
+                batch = []
+        if batch:
+            self.db.insert_rows("chat_history", columns, batch)
+        self._insert("chat_messages", iter(message_rows))
+
+    # === Điều phối ===
+    def _check_empty(self, replace: bool) -> None:
+        """Đảm bảo các bảng đích rỗng (hoặc xóa dữ liệu cũ nếu replace=True)"""
+        with self.db.transaction():
+            for table in [*TABLE_COLUMNS, *LINK_TABLES]:
+                if self.db.count_rows(table):
+                    if not replace:
+                        raise ValueError(f"Bảng {table} đã có dữ liệu; dùng --replace để ghi đè")
+                    self.db.clear_table(table)
+
+    def run(self, replace: bool = False) -> Dict[str, Dict]:
+        """Chuyển toàn bộ dữ liệu và kiểm tra; trả về báo cáo theo bảng"""
+        self._check_empty(replace)
+        self._run_table(["family_members"], lambda: self._insert("family_members", self._family_rows()))
+        self._run_table(["events"], self._load_events)
+        self._run_table(["notes"], lambda: self._insert("notes", self._note_rows()))
+        self._run_table(["chat_history", "chat_messages"], self._load_chat)
+        return self.verify()
+
+    def verify(self) -> Dict[str, Dict]:
+        """So sánh số dòng và checksum của nguồn với dữ liệu đọc lại từ database"""
+        report = {}
+        for table, columns in TABLE_COLUMNS.items():
+            source = self.checksums.get(table, _Checksum())
+            target = _Checksum()
+            payload = PAYLOAD_COLUMNS.get(table)
+            for row in self.db.iter_rows(table, columns):
+                if payload is not None:
+                    row = row[:payload] + (json.loads(decode_payload(row[payload])),) + row[payload + 1:]
+                target.add(row)
+            report[table] = {
+                "source_rows": source.count,
+                "target_rows": target.count,
+                "skipped": self.skipped.get(table, 0),
+                "checksum": target.hexdigest(),
+                "ok": source.count == target.count and source.value == target.value
+            }
+        return report
+
+
+def migrate(data_dir: str = ".", db_path: str = "family_assistant.db", replace: bool = False,
+            batch_size: int = DEFAULT_BATCH_SIZE, synchronous: str = "NORMAL",
+            compression: str = "zlib") -> Dict[str, Dict]:
+    """
+    Chuyển dữ liệu JSON trong data_dir vào database tại db_path (synchronous và
+    compression như cấu hình DB_SYNCHRONOUS / DB_COMPRESSION của ứng dụng)
+    """
+    db = DatabaseManager(db_path, synchronous=synchronous, compression=compression)
+    try:
+        return JsonToSqliteMigrator(db, data_dir, batch_size=batch_size).run(replace=replace)
+    finally:
+        db.close()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from utils import ConfigManager
+
+    parser = argparse.ArgumentParser(description="Chuyển dữ liệu từ các file JSON sang SQLite")
+    parser.add_argument("--data-dir", default=".", help="Thư mục chứa các file JSON")
+    parser.add_argument("--db", default=None, help="Đường dẫn database (mặc định theo cấu hình DB_PATH)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Số dòng mỗi lô executemany")
+    parser.add_argument("--replace", action="store_true", help="Xóa dữ liệu có sẵn trong các bảng đích")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    secrets = ConfigManager.load_secrets()
+    db_path = args.db or secrets["db_path"]
+    try:
+        report = migrate(args.data_dir, db_path, replace=args.replace, batch_size=args.batch_size,
+                         synchronous=secrets["db_synchronous"], compression=secrets["db_compression"])
+    except Exception as e:
+        logger.error(f"Chuyển dữ liệu thất bại (bảng đang chuyển đã được rollback): {e}")
+        return 1
+
+    for table, result in report.items():
+        status = "OK" if result["ok"] else "LỖI"
+        print(f"{table:15} {status:4} nguồn={result['source_rows']} đích={result['target_rows']} "
+              f"bỏ qua={result['skipped']} checksum={result['checksum'][:16]}")
+    return 0 if all(result["ok"] for result in report.values()) else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,11 +5,62 @@
 
 import json
 import datetime
-from typing import Dict, List, Optional, Any, Union
+import functools
+import dataclasses
+from operator import itemgetter
+from typing import Dict, List, Optional, Any, Callable, Tuple, Type
 from dataclasses import dataclass
 
 
-@dataclass
+def _now() -> str:
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+class _LazyJson:
+    """
+    Trường được giải mã JSON khi đọc lần đầu.
+
+    Giá trị lưu trong slot có thể là chuỗi JSON thô (đọc thẳng từ database);
+    lần truy cập đầu tiên gọi `load` và ghi đè kết quả vào slot, các lần sau
+    trả về ngay. Gán giá trị đã giải mã thì không tốn thêm gì.
+    """
+
+    __slots__ = ("slot", "load", "ready")
+
+    def __init__(self, slot: Any, load: Callable[[Any], Any], ready: type):
+        self.slot = slot  # Descriptor slot gốc do dataclass(slots=True) tạo
+        self.load = load
+        self.ready = ready
+
+    def __get__(self, obj: Any, owner: type = None) -> Any:
+        if obj is None:
+            return self
+        value = self.slot.__get__(obj, owner)
+        if not isinstance(value, self.ready):
+            value = self.load(value)
+            self.slot.__set__(obj, value)
+        return value
+
+    def __set__(self, obj: Any, value: Any) -> None:
+        self.slot.__set__(obj, value)
+
+
+def _json_list(value: Any) -> List:
+    if isinstance(value, (str, bytes)):
+        value = json.loads(value) if value else []
+    return value if value is not None else []
+
+
+def _lazy_json(**fields: Tuple[Callable[[Any], Any], type]):
+    """Decorator (đặt trên @dataclass(slots=True)): các trường chỉ định được giải mã JSON khi đọc"""
+    def wrap(cls):
+        for name, (load, ready) in fields.items():
+            setattr(cls, name, _LazyJson(cls.__dict__[name], load, ready))
+        return cls
+    return wrap
+
+
+@dataclass(slots=True)
 class Preference:
     """Class đại diện cho sở thích của thành viên gia đình"""
     food: str = ""
@@ -38,9 +89,21 @@ class Preference:
         return json.dumps(self.to_dict(), ensure_ascii=False)
 
 
-@dataclass
+def _preference(value: Any) -> Preference:
+    if isinstance(value, (str, bytes)):
+        value = json.loads(value) if value else {}
+    return Preference.from_dict(value or {})
+
+
+@_lazy_json(preferences=(_preference, Preference))
+@dataclass(slots=True)
 class FamilyMember:
-    """Class đại diện cho thành viên gia đình"""
+    """
+    Class đại diện cho thành viên gia đình.
+    
+    preferences nhận đối tượng Preference, dict hoặc chuỗi JSON; dict và chuỗi
+    JSON được chuyển thành Preference khi đọc lần đầu.
+    """
     id: Optional[int] = None
     name: str = ""
     age: str = ""
@@ -48,15 +111,9 @@ class FamilyMember:
     added_on: str = ""
     
     def __post_init__(self):
-        """Sau khi khởi tạo, đảm bảo preferences luôn là đối tượng Preference"""
-        if self.preferences is None:
-            self.preferences = Preference()
-        elif isinstance(self.preferences, dict):
-            self.preferences = Preference.from_dict(self.preferences)
-        
-        # Cập nhật thời gian thêm nếu không có
+        """Cập nhật thời gian thêm nếu không có"""
         if not self.added_on:
-            self.added_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.added_on = _now()
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'FamilyMember':
@@ -65,8 +122,8 @@ class FamilyMember:
             id=data.get('id'),
             name=data.get('name', ''),
             age=data.get('age', ''),
-            preferences=Preference.from_dict(data.get('preferences', {})),
-            added_on=data.get('added_on', datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            preferences=data.get('preferences'),
+            added_on=data.get('added_on', '')
         )
     
     def to_dict(self) -> Dict:
@@ -80,9 +137,10 @@ class FamilyMember:
         }
 
 
-@dataclass
+@_lazy_json(participants=(_json_list, list))
+@dataclass(slots=True)
 class Event:
-    """Class đại diện cho sự kiện"""
+    """Class đại diện cho sự kiện (participants có thể là chuỗi JSON, giải mã khi đọc lần đầu)"""
     id: Optional[int] = None
     title: str = ""
     date: str = ""
@@ -93,13 +151,9 @@ class Event:
     created_on: str = ""
     
     def __post_init__(self):
-        """Sau khi khởi tạo, đảm bảo participants luôn là list"""
-        if self.participants is None:
-            self.participants = []
-        
-        # Cập nhật thời gian tạo nếu không có
+        """Cập nhật thời gian tạo nếu không có"""
         if not self.created_on:
-            self.created_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.created_on = _now()
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Event':
@@ -110,9 +164,9 @@ class Event:
             date=data.get('date', ''),
             time=data.get('time', ''),
             description=data.get('description', ''),
-            participants=data.get('participants', []),
+            participants=data.get('participants'),
             created_by=data.get('created_by', ''),
-            created_on=data.get('created_on', datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            created_on=data.get('created_on', '')
         )
     
     def to_dict(self) -> Dict:
@@ -129,9 +183,10 @@ class Event:
         }
 
 
-@dataclass
+@_lazy_json(tags=(_json_list, list))
+@dataclass(slots=True)
 class Note:
-    """Class đại diện cho ghi chú"""
+    """Class đại diện cho ghi chú (tags có thể là chuỗi JSON, giải mã khi đọc lần đầu)"""
     id: Optional[int] = None
     title: str = ""
     content: str = ""
@@ -140,13 +195,9 @@ class Note:
     created_on: str = ""
     
     def __post_init__(self):
-        """Sau khi khởi tạo, đảm bảo tags luôn là list"""
-        if self.tags is None:
-            self.tags = []
-        
-        # Cập nhật thời gian tạo nếu không có
+        """Cập nhật thời gian tạo nếu không có"""
         if not self.created_on:
-            self.created_on = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.created_on = _now()
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'Note':
@@ -155,9 +206,9 @@ class Note:
             id=data.get('id'),
             title=data.get('title', ''),
             content=data.get('content', ''),
-            tags=data.get('tags', []),
+            tags=data.get('tags'),
             created_by=data.get('created_by', ''),
-            created_on=data.get('created_on', datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            created_on=data.get('created_on', '')
         )
     
     def to_dict(self) -> Dict:
@@ -172,9 +223,10 @@ class Note:
         }
 
 
-@dataclass
+@_lazy_json(messages=(_json_list, list))
+@dataclass(slots=True)
 class ChatHistory:
-    """Class đại diện cho lịch sử trò chuyện"""
+    """Class đại diện cho lịch sử trò chuyện (messages có thể là chuỗi JSON, giải mã khi đọc lần đầu)"""
     id: Optional[int] = None
     member_id: str = ""
     timestamp: str = ""
@@ -182,13 +234,9 @@ class ChatHistory:
     summary: str = ""
     
     def __post_init__(self):
-        """Sau khi khởi tạo, đảm bảo messages luôn là list"""
-        if self.messages is None:
-            self.messages = []
-        
-        # Cập nhật thời gian nếu không có
+        """Cập nhật thời gian nếu không có"""
         if not self.timestamp:
-            self.timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self.timestamp = _now()
     
     @classmethod
     def from_dict(cls, data: Dict) -> 'ChatHistory':
@@ -196,8 +244,8 @@ class ChatHistory:
         return cls(
             id=data.get('id'),
             member_id=data.get('member_id', ''),
-            timestamp=data.get('timestamp', datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-            messages=data.get('messages', []),
+            timestamp=data.get('timestamp', ''),
+            messages=data.get('messages'),
             summary=data.get('summary', '')
         )
     
@@ -209,4 +257,45 @@ class ChatHistory:
             'timestamp': self.timestamp,
             'messages': self.messages,
             'summary': self.summary
-        }
\ No newline at end of file
+        }
+
+
+# === Ánh xạ dòng sqlite3 sang model ===
+@functools.lru_cache(maxsize=64)
+def _row_mapper(model: Type, columns: Tuple[str, ...]) -> Callable[[tuple], Any]:
+    """Hàm dựng model từ một dòng có các cột `columns` (tính một lần cho mỗi cặp model / cột)"""
+    names = [field.name for field in dataclasses.fields(model)]
+    if columns[:len(names)] == tuple(names):
+        # Cột trùng thứ tự các trường: truyền thẳng theo vị trí
+        count = len(names)
+        return lambda row: model(*row[:count])
+    present = [name for name in names if name in columns]
+    if not present:
+        raise ValueError(f"Truy vấn không có cột nào của {model.__name__}: {columns}")
+    getter = itemgetter(*(columns.index(name) for name in present))
+    if len(present) == 1:
+        return lambda row: model(**{present[0]: getter(row)})
+    return lambda row: model(**dict(zip(present, getter(row))))
+
+
+def row_factory(model: Type) -> Callable[[Any, tuple], Any]:
+    """
+    row_factory cho sqlite3 trả về đối tượng model thay cho sqlite3.Row:
+    `cursor.row_factory = row_factory(Event)`.
+
+    Cột được ghép với trường theo tên (cột thừa bị bỏ qua); cách ghép được tính
+    một lần cho mỗi truy vấn. Các trường JSON (participants, tags, preferences,
+    messages) giữ chuỗi thô cho tới khi được đọc.
+    """
+    state = (None, None)  # (cursor.description, hàm dựng) của truy vấn gần nhất
+
+    def factory(cursor: Any, row: tuple) -> Any:
+        nonlocal state
+        description, mapper = state
+        if cursor.description is not description:
+            description = cursor.description
+            mapper = _row_mapper(model, tuple(column[0] for column in description))
+            state = (description, mapper)
+        return mapper(row)
+
+    return factory
@@ -0,0 +1,234 @@
+# database/profiler.py
+"""
+Đo thời gian các lời gọi tới backend lưu trữ và ghi log truy vấn chậm
+"""
+
+import time
+import logging
+import functools
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List
+
+logger = logging.getLogger('family_assistant')
+
+
+class _MethodStats:
+    """Số liệu của một phương thức: số lần gọi, số dòng, số câu lệnh và mẫu thời gian"""
+
+    __slots__ = ("calls", "errors", "rows", "statements", "total", "samples")
+
+    def __init__(self, max_samples: int):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.statements = 0
+        self.total = 0.0
+        self.samples: Deque[float] = deque(maxlen=max_samples)
+
+
+class _CallFrame:
+    """Câu lệnh SQL của một lời gọi đang chạy (chỉ giữ vài câu đầu, đếm tất cả)"""
+
+    __slots__ = ("count", "statements")
+
+    def __init__(self):
+        self.count = 0
+        self.statements: List[str] = []
+
+
+class QueryProfiler:
+    """
+    Bộ đo hiệu năng cắm vào một backend lưu trữ (thường là DatabaseManager).
+
+    attach() thay các phương thức công khai của backend bằng hàm bọc đo thời
+    gian, đếm số dòng trả về và (với DatabaseManager) các câu lệnh SQL chạy
+    trong lời gọi qua trace callback của sqlite3. Lời gọi chậm hơn slow_ms
+    được ghi log kèm các câu lệnh. detach() gỡ toàn bộ hàm bọc: khi không gắn
+    profiler, backend không tốn thêm chi phí nào.
+    """
+
+    # Các phương thức không đo (không truy vấn dữ liệu, trả về context manager hoặc chạy không dừng)
+    EXCLUDED = frozenset({
+        "close", "transaction", "set_trace_callback", "cache_stats", "invalidate_cache", "subscribe",
+    })
+
+    MAX_STATEMENTS = 10  # Số câu lệnh giữ lại cho mỗi lời gọi chậm
+
+    def __init__(self, slow_ms: float = 100.0, max_samples: int = 1000, max_slow: int = 50):
+        """slow_ms: ngưỡng ghi log (ms); max_samples: số mẫu thời gian giữ cho mỗi phương thức"""
+        self.slow_ms = slow_ms
+        self.max_samples = max_samples
+        self._stats: Dict[str, _MethodStats] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=max_slow)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # Ngăn xếp các lời gọi đang chạy trong luồng
+        self._db: Any = None
+        self._wrapped: List[str] = []
+
+    # === Gắn / gỡ ===
+    def attach(self, db: Any) -> 'QueryProfiler':
+        """Bọc các phương thức công khai của db (mỗi profiler chỉ gắn một backend)"""
+        if self._db is not None:
+            raise RuntimeError("Profiler đã được gắn vào một backend khác")
+        self._db = db
+        for name in dir(type(db)):
+            if name.startswith("_") or name in self.EXCLUDED:
+                continue
+            method = getattr(db, name, None)
+            if not callable(method) or isinstance(method, type):
+                continue
+            wrapper = self._wrap_iterator(name, method) if name.startswith("iter_") else self._wrap(name, method)
+            setattr(db, name, wrapper)
+            self._wrapped.append(name)
+        if hasattr(db, "set_trace_callback"):
+            db.set_trace_callback(self._on_statement)
+        logger.info(f"Đã bật đo hiệu năng cho {len(self._wrapped)} phương thức (ngưỡng chậm {self.slow_ms} ms)")
+        return self
+
+    def detach(self) -> None:
+        """Gỡ các hàm bọc, trả backend về trạng thái ban đầu"""
+        if self._db is None:
+            return
+        for name in self._wrapped:
+            self._db.__dict__.pop(name, None)
+        if hasattr(self._db, "set_trace_callback"):
+            self._db.set_trace_callback(None)
+        self._db = None
+        self._wrapped = []
+
+    # === Ghi nhận ===
+    def _on_statement(self, statement: str) -> None:
+        """Trace callback của sqlite3: gán câu lệnh cho các lời gọi đang chạy trong luồng"""
+        if statement.startswith("--"):
+            return  # Câu lệnh con do trigger / FTS5 sinh ra
+        for frame in getattr(self._local, "stack", ()):
+            frame.count += 1
+            if len(frame.statements) < self.MAX_STATEMENTS:
+                frame.statements.append(statement)
+
+    def _stack(self) -> List[_CallFrame]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, name: str, elapsed: float, rows: int, frame: _CallFrame,
+                failed: bool = False, args: tuple = ()) -> None:
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _MethodStats(self.max_samples)
+            stats.calls += 1
+            stats.errors += failed
+            stats.rows += rows
+            stats.statements += frame.count
+            stats.total += elapsed_ms
+            stats.samples.append(elapsed_ms)
+
+        if elapsed_ms >= self.slow_ms:
+            entry = {
+                "method": name,
+                "ms": round(elapsed_ms, 3),
+                "rows": rows,
+                "args": [repr(arg)[:80] for arg in args],
+                "statement_count": frame.count,
+                "statements": [statement[:300] for statement in frame.statements],
+                "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            with self._lock:
+                self._slow.append(entry)
+            logger.warning(f"Truy vấn chậm: {name} mất {elapsed_ms:.1f} ms, {rows} dòng, "
+                           f"{frame.count} câu lệnh: {' | '.join(entry['statements'])}")
+
+    @staticmethod
+    def _count_rows(result: Any) -> int:
+        if isinstance(result, (list, dict, tuple)):
+            return len(result)
+        return 1 if result else 0
+
+    def _wrap(self, name: str, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            frame = _CallFrame()
+            self._stack().append(frame)
+            started = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            except Exception:
+                self._record(name, time.perf_counter() - started, 0, frame, True, args)
+                raise
+            finally:
+                self._stack().remove(frame)
+            self._record(name, time.perf_counter() - started, self._count_rows(result), frame, False, args)
+            return result
+        return wrapper
+
+    def _wrap_iterator(self, name: str, method: Callable) -> Callable:
+        """Với iter_*: chỉ tính thời gian bên trong generator, không tính thời gian người gọi xử lý"""
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            iterator = iter(method(*args, **kwargs))
+            frame = _CallFrame()
+            elapsed, rows, failed = 0.0, 0, False
+            try:
+                while True:
+                    self._stack().append(frame)
+                    started = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    except Exception:
+                        failed = True
+                        raise
+                    finally:
+                        elapsed += time.perf_counter() - started
+                        self._stack().remove(frame)
+                    rows += 1
+                    yield item
+            finally:
+                self._record(name, elapsed, rows, frame, failed, args)
+        return wrapper
+
+    # === Báo cáo ===
+    @staticmethod
+    def _percentile(ordered: List[float], percent: float) -> float:
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Số liệu hiện tại cho trang quản trị: theo từng phương thức (số lần gọi,
+        lỗi, số dòng, số câu lệnh, tổng thời gian, p50/p95/p99/max theo ms, tính
+        trên max_samples lần gọi gần nhất) và các lời gọi chậm gần đây.
+        """
+        with self._lock:
+            methods = {}
+            for name, stats in self._stats.items():
+                ordered = sorted(stats.samples)
+                methods[name] = {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "rows": stats.rows,
+                    "statements": stats.statements,
+                    "total_ms": round(stats.total, 3),
+                    "p50_ms": round(self._percentile(ordered, 50), 3),
+                    "p95_ms": round(self._percentile(ordered, 95), 3),
+                    "p99_ms": round(self._percentile(ordered, 99), 3),
+                    "max_ms": round(ordered[-1], 3) if ordered else 0.0,
+                }
+            return {
+                "slow_ms": self.slow_ms,
+                "methods": dict(sorted(methods.items(), key=lambda item: item[1]["total_ms"], reverse=True)),
+                "slow": list(self._slow),
+            }
+
+    def reset(self) -> None:
+        """Xóa toàn bộ số liệu đã thu"""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
@@ -0,0 +1,148 @@
+# database/scheduler.py
+"""
+Chạy các tác vụ định kỳ (sao lưu database...) trên luồng nền
+"""
+
+import os
+import glob
+import time
+import logging
+import datetime
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger('family_assistant')
+
+
+class PeriodicJob:
+    """
+    Gọi func() mỗi interval giây trên một luồng nền (daemon).
+
+    Lỗi của một lần chạy chỉ được ghi log, lần sau vẫn chạy. Kết quả và lỗi
+    gần nhất được giữ trong last_result / last_error để hiển thị.
+    """
+
+    def __init__(self, name: str, interval: float, func: Callable[[], Any], run_immediately: bool = False):
+        """name: tên tác vụ (dùng trong log); interval: số giây giữa hai lần chạy"""
+        if interval <= 0:
+            raise ValueError(f"Chu kỳ không hợp lệ cho tác vụ {name}: {interval}")
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_immediately = run_immediately
+        self.last_run: Optional[str] = None
+        self.last_result: Any = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'PeriodicJob':
+        """Bắt đầu luồng nền (không làm gì nếu đã chạy)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name=f"job-{self.name}", daemon=True)
+            self._thread.start()
+            logger.info(f"Đã bắt đầu tác vụ định kỳ {self.name} (mỗi {self.interval} giây)")
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Dừng luồng nền sau lần chạy hiện tại (nếu có)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_now(self) -> Any:
+        """Chạy tác vụ ngay trên luồng hiện tại (không chạy chồng với lần chạy nền)"""
+        with self._run_lock:
+            started = time.perf_counter()
+            try:
+                self.last_result = self.func()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Lỗi khi chạy tác vụ định kỳ {self.name}: {e}")
+            self.runs += 1
+            self.last_run = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            logger.info(f"Tác vụ {self.name} chạy xong sau {time.perf_counter() - started:.2f} giây")
+            return self.last_result
+
+    def _loop(self) -> None:
+        if self.run_immediately:
+            self.run_now()
+        while not self._stop.wait(self.interval):
+            self.run_now()
+
+    def status(self) -> Dict[str, Any]:
+        """Trạng thái tác vụ: đang chạy, số lần chạy, lần chạy cuối và lỗi gần nhất"""
+        return {
+            "name": self.name,
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval": self.interval,
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+def prune_backups(backup_dir: str, prefix: str, keep: int) -> int:
+    """Xóa các bản sao lưu cũ, chỉ giữ `keep` bản mới nhất; trả về số file đã xóa"""
+    backups = sorted(glob.glob(os.path.join(backup_dir, f"{prefix}-*")))
+    removed = 0
+    for path in backups[:-keep] if keep > 0 else []:
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Không xóa được bản sao lưu cũ {path}: {e}")
+    return removed
+
+
+def schedule_backups(db: Any, backup_dir: str, interval: float, keep: int = 7,
+                     compress: bool = True, pages_per_step: int = 256) -> PeriodicJob:
+    """
+    Tạo (và bắt đầu) tác vụ sao lưu định kỳ cho một DatabaseManager.
+
+    Mỗi lần chạy ghi một file `<tên db>-YYYYmmdd-HHMMSS.db[.gz]` vào backup_dir
+    bằng db.backup() rồi chỉ giữ `keep` bản mới nhất.
+    """
+    prefix = os.path.splitext(os.path.basename(db.db_path))[0] or "backup"
+    extension = ".db.gz" if compress else ".db"
+
+    def run_backup() -> Dict[str, Any]:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        report = db.backup(os.path.join(backup_dir, f"{prefix}-{stamp}{extension}"),
+                           pages_per_step=pages_per_step, compress=compress)
+        if not report:
+            raise RuntimeError("Sao lưu thất bại")
+        report["pruned"] = prune_backups(backup_dir, prefix, keep)
+        return report
+
+    return PeriodicJob("backup", interval, run_backup).start()
+
+
+def schedule_maintenance(db: Any, interval: float, idle_seconds: float = 60.0, vacuum_pages: int = 1000,
+                         chat_retention_days: Optional[int] = None,
+                         event_retention_days: Optional[int] = None,
+                         changes_retention_days: Optional[float] = 7) -> PeriodicJob:
+    """
+    Tạo (và bắt đầu) tác vụ bảo trì định kỳ cho một DatabaseManager.
+
+    Mỗi lần chạy gọi db.run_maintenance() (xóa dữ liệu và nhật ký thay đổi
+    hết hạn, incremental vacuum, PRAGMA optimize), nhưng chỉ khi database
+    không có thao tác ghi nào trong idle_seconds giây; nếu đang bận thì bỏ
+    qua, chờ lần sau.
+    """
+    def run_maintenance() -> Dict[str, Any]:
+        idle = db.idle_seconds()
+        if idle < idle_seconds:
+            logger.info(f"Bỏ qua bảo trì database: có thao tác ghi {idle:.0f} giây trước")
+            return {"skipped": True, "idle_seconds": round(idle, 1)}
+        report = db.run_maintenance(vacuum_pages=vacuum_pages, chat_days=chat_retention_days,
+                                    event_days=event_retention_days, changes_days=changes_retention_days)
+        if not report:
+            raise RuntimeError("Bảo trì database thất bại")
+        return report
+
+    return PeriodicJob("maintenance", interval, run_maintenance).start()
@@ -0,0 +1,847 @@
+# database/storage.py
+"""
+Giao diện lưu trữ chung và các backend JSON / bộ nhớ cho ứng dụng
+"""
+
+import os
+import re
+import copy
+import uuid
+import logging
+import datetime
+import threading
+import contextlib
+import unicodedata
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Any, Iterable, Iterator, Tuple, ContextManager, Callable
+
+from .json_store import JsonStore, BackgroundWriter
+from .chat_store import ChatHistoryStore
+
+logger = logging.getLogger('family_assistant')
+
+
+def fold_vietnamese(text: str) -> str:
+    """Bỏ dấu tiếng Việt và chuyển về chữ thường ("Đà Nẵng" -> "da nang")"""
+    text = text.replace("đ", "d").replace("Đ", "D")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if not unicodedata.combining(c)).lower()
+
+
+class StorageBackend(ABC):
+    """
+    Giao diện lưu trữ mà app.py sử dụng.
+
+    Có ba cài đặt: JsonStorageBackend (các file JSON), DatabaseManager
+    (SQLite) và MemoryStorageBackend (chỉ trong bộ nhớ, dùng để thử nghiệm
+    hoặc đo hiệu năng). Tất cả ID được trả về dưới dạng chuỗi.
+    """
+
+    # === Thành viên gia đình ===
+    @abstractmethod
+    def get_all_family_members(self) -> Dict[str, Dict]:
+        """Lấy tất cả thành viên gia đình"""
+
+    @abstractmethod
+    def get_family_member(self, member_id: str) -> Optional[Dict]:
+        """Lấy thông tin một thành viên cụ thể"""
+
+    @abstractmethod
+    def add_family_member(self, details: Dict) -> str:
+        """Thêm thành viên gia đình mới, trả về ID"""
+
+    @abstractmethod
+    def update_family_member(self, member_id: str, details: Dict) -> bool:
+        """Cập nhật thông tin thành viên"""
+
+    @abstractmethod
+    def update_preference(self, member_id: str, key: str, value: str) -> bool:
+        """Cập nhật một sở thích của thành viên"""
+
+    @abstractmethod
+    def update_preferences(self, member_id: str, preferences: Dict[str, Any]) -> bool:
+        """Cập nhật nhiều sở thích của một thành viên trong một lần ghi"""
+
+    # === Giao dịch và ghi theo lô ===
+    @abstractmethod
+    def transaction(self) -> ContextManager['StorageBackend']:
+        """
+        Khối ghi nguyên tử (`with storage.transaction(): ...`): các thao tác ghi
+        trong khối được lưu cùng nhau khi khối kết thúc, hoặc bị hủy hết nếu
+        khối phát sinh ngoại lệ. Có thể lồng nhau; chỉ khối ngoài cùng lưu/hủy.
+        """
+
+    @abstractmethod
+    def add_events_bulk(self, events: List[Dict]) -> List[str]:
+        """Thêm nhiều sự kiện trong một lần ghi, trả về các ID mới (rỗng nếu lỗi)"""
+
+    @abstractmethod
+    def add_notes_bulk(self, notes: List[Dict]) -> List[str]:
+        """Thêm nhiều ghi chú trong một lần ghi, trả về các ID mới (rỗng nếu lỗi)"""
+
+    @abstractmethod
+    def get_member_names(self, member_ids: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Lấy {ID: tên} của các thành viên chỉ định (mặc định: tất cả) trong một lần đọc"""
+
+    # === Sự kiện ===
+    @abstractmethod
+    def get_all_events(self) -> Dict[str, Dict]:
+        """Lấy tất cả sự kiện"""
+
+    @abstractmethod
+    def add_event(self, details: Dict) -> Optional[str]:
+        """Thêm sự kiện mới, trả về ID"""
+
+    @abstractmethod
+    def update_event(self, event_id: str, details: Dict) -> bool:
+        """Cập nhật thông tin sự kiện"""
+
+    @abstractmethod
+    def delete_event(self, event_id: str) -> bool:
+        """Xóa sự kiện"""
+
+    @abstractmethod
+    def filter_events_by_member(self, member_id: Optional[str] = None) -> Dict[str, Dict]:
+        """Lọc sự kiện mà thành viên tạo hoặc tham gia"""
+
+    @abstractmethod
+    def get_events_between(self, start: Any, end: Any, member_id: Optional[str] = None) -> Dict[str, Dict]:
+        """
+        Sự kiện có ngày trong khoảng [start, end] (date hoặc chuỗi YYYY-MM-DD),
+        sắp xếp theo ngày và giờ; lọc thêm theo thành viên nếu có member_id
+        """
+
+    @staticmethod
+    def _date_key(value: Any) -> str:
+        """Chuẩn hóa ngày về chuỗi YYYY-MM-DD (so sánh được như chuỗi)"""
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.strftime("%Y-%m-%d")
+        return str(value)
+
+    # === Ghi chú ===
+    @abstractmethod
+    def get_all_notes(self) -> Dict[str, Dict]:
+        """Lấy tất cả ghi chú"""
+
+    @abstractmethod
+    def add_note(self, details: Dict) -> Optional[str]:
+        """Thêm ghi chú mới, trả về ID"""
+
+    @abstractmethod
+    def delete_note(self, note_id: str) -> bool:
+        """Xóa ghi chú"""
+
+    # === Đọc theo trang (keyset pagination) ===
+    @abstractmethod
+    def iter_family_members(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None,
+                            descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt thành viên theo thứ tự ID, bắt đầu sau after_id, tối đa limit bản ghi"""
+
+    @abstractmethod
+    def iter_events(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                    columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                    participant: Optional[str] = None, descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt sự kiện theo thứ tự ID, có thể lọc theo người tạo / người tham gia"""
+
+    @abstractmethod
+    def iter_events_by_date(self, after: Optional[Tuple[str, str, int]] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                            participant: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """
+        Duyệt sự kiện theo (ngày, giờ, ID), bắt đầu sau con trỏ `after` là bộ
+        (date, time, id) của sự kiện cuối trang trước
+        """
+
+    @abstractmethod
+    def iter_notes(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                   columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                   descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt ghi chú theo thứ tự ID, có thể lọc theo người tạo"""
+
+    @abstractmethod
+    def iter_chat_history(self, member_id: str, after_id: Optional[str] = None, limit: Optional[int] = None,
+                          columns: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt các cuộc trò chuyện của thành viên, mới nhất trước, sau cuộc trò chuyện after_id"""
+
+    # === Lịch sử chat ===
+    @abstractmethod
+    def get_chat_history(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy các cuộc trò chuyện (kèm tin nhắn) của một thành viên, mới nhất trước"""
+
+    @abstractmethod
+    def get_chat_summaries(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy danh sách (ID, thời gian, tóm tắt) các cuộc trò chuyện, không kèm tin nhắn"""
+
+    @abstractmethod
+    def get_conversation(self, member_id: str, conversation_id: str) -> Optional[Dict]:
+        """Lấy một cuộc trò chuyện (kèm tin nhắn) theo ID"""
+
+    @abstractmethod
+    def save_chat_history(self, member_id: str, messages: List[Dict], summary: Optional[str] = None,
+                          conversation_id: Optional[str] = None) -> bool:
+        """Lưu (hoặc nối thêm tin nhắn mới vào) một cuộc trò chuyện"""
+
+    # === Tìm kiếm ===
+    @abstractmethod
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None, limit: int = 20,
+               member_id: Optional[str] = None) -> List[Dict]:
+        """
+        Tìm kiếm không phân biệt dấu trên ghi chú ("note"), sự kiện ("event") và tóm tắt
+        trò chuyện ("chat"). Mỗi kết quả có kind, id, title, text và score (nhỏ hơn là khớp hơn).
+        Nếu có member_id, chỉ tìm trong các cuộc trò chuyện của thành viên đó (lọc trước giới hạn limit).
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """Giải phóng tài nguyên / ghi nốt dữ liệu còn chờ"""
+
+
+class DictStorageBackend(StorageBackend):
+    """
+    Phần cài đặt chung cho các backend giữ dữ liệu dạng từ điển {id: bản ghi}.
+
+    Lớp con chỉ cần cung cấp cách đọc một bộ sưu tập ("family", "events",
+    "notes") và cách ghi/xóa một khóa theo đường dẫn. Lớp con đọc/ghi dưới
+    self.lock và gọi _remember trước mỗi lần ghi/xóa để khối có thể được hoàn tác.
+    """
+
+    def __init__(self):
+        # Khóa chung của backend: transaction() giữ nó suốt khối nên luồng khác
+        # không đọc được trạng thái dở dang và không ghi xen vào giữa khối
+        self.lock = threading.RLock()
+        self._undo = threading.local()  # Nhật ký hoàn tác của khối đang mở trong từng luồng
+
+    @abstractmethod
+    def _collection(self, name: str) -> Dict[str, Dict]:
+        """Trả về từ điển dữ liệu của một bộ sưu tập"""
+
+    @abstractmethod
+    def _set(self, name: str, path: List[str], value: Any) -> None:
+        """Đặt giá trị tại đường dẫn trong một bộ sưu tập"""
+
+    @abstractmethod
+    def _delete(self, name: str, path: List[str]) -> None:
+        """Xóa khóa tại đường dẫn trong một bộ sưu tập"""
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # === Giao dịch ===
+    def _remember(self, name: str, path: List[str]) -> None:
+        """Ghi lại giá trị hiện tại tại đường dẫn trước khi thay đổi (chỉ khi đang trong khối)"""
+        log = getattr(self._undo, "log", None)
+        if log is None:
+            return
+        node: Any = self._collection(name)
+        for key in path:
+            if not isinstance(node, dict) or key not in node:
+                log.append((name, list(path), False, None))
+                return
+            node = node[key]
+        log.append((name, list(path), True, copy.deepcopy(node)))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Khối ghi: nếu có ngoại lệ, các thay đổi trong khối được hoàn tác theo thứ tự ngược"""
+        with self._locked():
+            outermost = getattr(self._undo, "log", None) is None
+            if outermost:
+                self._undo.log = []
+            try:
+                yield self
+            except BaseException:
+                if outermost:
+                    log, self._undo.log = self._undo.log, None
+                    for name, path, existed, value in reversed(log):
+                        if existed:
+                            self._set(name, path, value)
+                        else:
+                            self._delete(name, path)
+                    logger.warning(f"Đã hoàn tác {len(log)} thay đổi của giao dịch lỗi")
+                raise
+            finally:
+                if outermost:
+                    self._undo.log = None
+
+    def _locked(self) -> ContextManager:
+        """Các khóa giữ suốt một transaction()"""
+        return self.lock
+
+    def _add_bulk(self, add, items: List[Dict], label: str) -> List[str]:
+        """Thêm nhiều bản ghi trong một khối; lỗi ở bất kỳ bản ghi nào hủy cả lô"""
+        try:
+            with self.transaction():
+                ids = []
+                for details in items:
+                    record_id = add(details)
+                    if record_id is None:
+                        raise ValueError(f"Không thể thêm {label}: {details.get('title')}")
+                    ids.append(record_id)
+                return ids
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm nhiều {label}: {e}")
+            return []
+
+    def add_events_bulk(self, events: List[Dict]) -> List[str]:
+        """Thêm nhiều sự kiện, trả về các ID mới (rỗng nếu lỗi)"""
+        return self._add_bulk(self.add_event, events, "sự kiện")
+
+    def add_notes_bulk(self, notes: List[Dict]) -> List[str]:
+        """Thêm nhiều ghi chú, trả về các ID mới (rỗng nếu lỗi)"""
+        return self._add_bulk(self.add_note, notes, "ghi chú")
+
+    @staticmethod
+    def _next_id(collection: Dict[str, Any]) -> str:
+        """ID mới lớn hơn mọi ID số hiện có (không bị trùng sau khi xóa)"""
+        numeric_ids = [int(key) for key in collection if str(key).isdigit()]
+        return str(max(numeric_ids, default=0) + 1)
+
+    # === Thành viên gia đình ===
+    def get_all_family_members(self) -> Dict[str, Dict]:
+        """Lấy tất cả thành viên gia đình"""
+        return {
+            member_id: member for member_id, member in self._collection("family").items()
+            if isinstance(member, dict)
+        }
+
+    def get_family_member(self, member_id: str) -> Optional[Dict]:
+        """Lấy thông tin một thành viên cụ thể"""
+        member = self._collection("family").get(member_id)
+        return member if isinstance(member, dict) else None
+
+    def add_family_member(self, details: Dict) -> str:
+        """Thêm thành viên gia đình mới"""
+        member_id = str(details.get("id") or self._next_id(self._collection("family")))
+        self._set("family", [member_id], {
+            "name": details.get("name", ""),
+            "age": details.get("age", ""),
+            "preferences": details.get("preferences", {}),
+            "added_on": self._now()
+        })
+        logger.info(f"Đã thêm thành viên mới: {details.get('name')} với ID={member_id}")
+        return member_id
+
+    def update_family_member(self, member_id: str, details: Dict) -> bool:
+        """Cập nhật thông tin thành viên"""
+        try:
+            member = self.get_family_member(member_id)
+            if member is None:
+                return False
+
+            updated = dict(member)
+            for field in ["name", "age", "preferences"]:
+                if field in details:
+                    updated[field] = details[field]
+            self._set("family", [member_id], updated)
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi cập nhật thành viên ID={member_id}: {e}")
+            return False
+
+    def update_preference(self, member_id: str, key: str, value: str) -> bool:
+        """Cập nhật sở thích của thành viên"""
+        try:
+            member = self.get_family_member(member_id)
+            if member is None or not key:
+                return False
+
+            if isinstance(member.get("preferences"), dict):
+                # Chỉ ghi thay đổi của một sở thích
+                self._set("family", [member_id, "preferences", key], value)
+            else:
+                self._set("family", [member_id, "preferences"], {key: value})
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi cập nhật sở thích cho thành viên ID={member_id}: {e}")
+            return False
+
+    def update_preferences(self, member_id: str, preferences: Dict[str, Any]) -> bool:
+        """Cập nhật nhiều sở thích của một thành viên trong một lần ghi"""
+        try:
+            member = self.get_family_member(member_id)
+            if member is None or not preferences:
+                return False
+
+            current = member.get("preferences")
+            updated = dict(current) if isinstance(current, dict) else {}
+            updated.update(preferences)
+            self._set("family", [member_id, "preferences"], updated)
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi cập nhật sở thích cho thành viên ID={member_id}: {e}")
+            return False
+
+    def get_member_names(self, member_ids: Optional[Iterable[str]] = None) -> Dict[str, str]:
+        """Lấy {ID: tên} của các thành viên chỉ định (mặc định: tất cả)"""
+        family = self._collection("family")
+        ids = family.keys() if member_ids is None else {str(member_id) for member_id in member_ids if member_id}
+        return {
+            member_id: family[member_id].get("name", "")
+            for member_id in ids if isinstance(family.get(member_id), dict)
+        }
+
+    # === Sự kiện ===
+    def get_all_events(self) -> Dict[str, Dict]:
+        """Lấy tất cả sự kiện"""
+        return dict(self._collection("events"))
+
+    def add_event(self, details: Dict) -> Optional[str]:
+        """Thêm sự kiện mới"""
+        try:
+            event_id = self._next_id(self._collection("events"))
+            self._set("events", [event_id], {
+                "title": details.get("title", ""),
+                "date": details.get("date", ""),
+                "time": details.get("time", ""),
+                "description": details.get("description", ""),
+                "participants": details.get("participants", []),
+                "created_by": details.get("created_by", ""),
+                "created_on": self._now()
+            })
+            logger.info(f"Đã thêm sự kiện mới: {details.get('title')} với ID={event_id}")
+            return event_id
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm sự kiện: {e}")
+            return None
+
+    def update_event(self, event_id: str, details: Dict) -> bool:
+        """Cập nhật thông tin sự kiện"""
+        try:
+            event = self._collection("events").get(event_id)
+            if event is None:
+                return False
+
+            updated = dict(event)
+            for field in ["title", "date", "time", "description", "participants"]:
+                if details.get(field) is not None:
+                    updated[field] = details[field]
+            if "created_on" not in updated:
+                updated["created_on"] = self._now()
+            self._set("events", [event_id], updated)
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi cập nhật sự kiện ID={event_id}: {e}")
+            return False
+
+    def delete_event(self, event_id: str) -> bool:
+        """Xóa sự kiện"""
+        try:
+            if event_id not in self._collection("events"):
+                return False
+            self._delete("events", [event_id])
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi xóa sự kiện ID={event_id}: {e}")
+            return False
+
+    def filter_events_by_member(self, member_id: Optional[str] = None) -> Dict[str, Dict]:
+        """Lọc sự kiện theo thành viên cụ thể"""
+        events = self.get_all_events()
+        if not member_id:
+            return events
+
+        member = self.get_family_member(member_id)
+        member_name = member.get("name") if member else None
+        return {
+            event_id: event for event_id, event in events.items()
+            if event.get("created_by") == member_id
+            or (member_name and member_name in event.get("participants", []))
+        }
+
+    def get_events_between(self, start: Any, end: Any, member_id: Optional[str] = None) -> Dict[str, Dict]:
+        """Lấy sự kiện trong khoảng ngày, sắp xếp theo ngày và giờ"""
+        start, end = self._date_key(start), self._date_key(end)
+        events = [
+            (event_id, event) for event_id, event in self.filter_events_by_member(member_id).items()
+            if start <= (event.get("date") or "") <= end
+        ]
+        events.sort(key=lambda item: (item[1].get("date", ""), item[1].get("time", "")))
+        return dict(events)
+
+    # === Ghi chú ===
+    def get_all_notes(self) -> Dict[str, Dict]:
+        """Lấy tất cả ghi chú"""
+        return dict(self._collection("notes"))
+
+    def add_note(self, details: Dict) -> Optional[str]:
+        """Thêm ghi chú mới"""
+        try:
+            note_id = self._next_id(self._collection("notes"))
+            self._set("notes", [note_id], {
+                "title": details.get("title", ""),
+                "content": details.get("content", ""),
+                "tags": details.get("tags", []),
+                "created_by": details.get("created_by", ""),
+                "created_on": self._now()
+            })
+            logger.info(f"Đã thêm ghi chú mới: {details.get('title')} với ID={note_id}")
+            return note_id
+        except Exception as e:
+            logger.error(f"Lỗi khi thêm ghi chú: {e}")
+            return None
+
+    def delete_note(self, note_id: str) -> bool:
+        """Xóa ghi chú"""
+        try:
+            if note_id not in self._collection("notes"):
+                return False
+            self._delete("notes", [note_id])
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi xóa ghi chú ID={note_id}: {e}")
+            return False
+
+    # === Đọc theo trang ===
+    _FIELDS = {
+        "family": ("name", "age", "preferences", "added_on"),
+        "events": ("title", "date", "time", "description", "participants", "created_by", "created_on"),
+        "notes": ("title", "content", "tags", "created_by", "created_on"),
+    }
+
+    @staticmethod
+    def _id_key(item_id: Any) -> Tuple:
+        """Khóa sắp xếp ID: ID số theo giá trị, ID khác theo chuỗi"""
+        return (0, int(item_id), "") if str(item_id).isdigit() else (1, 0, str(item_id))
+
+    def _iter_collection(self, name: str, after_id: Optional[str], limit: Optional[int],
+                         columns: Optional[Iterable[str]], predicate=None,
+                         descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt một bộ sưu tập theo ID sau after_id, chỉ lấy các trường được chọn"""
+        fields = list(columns) if columns else list(self._FIELDS[name])
+        unknown = [field for field in fields if field not in self._FIELDS[name]]
+        if unknown:
+            raise ValueError(f"Trường không hợp lệ cho {name}: {unknown}")
+
+        items = sorted(self._collection(name).items(), key=lambda item: self._id_key(item[0]), reverse=descending)
+        if after_id is not None:
+            after_key = self._id_key(after_id)
+            items = [
+                item for item in items
+                if (self._id_key(item[0]) < after_key if descending else self._id_key(item[0]) > after_key)
+            ]
+
+        count = 0
+        for item_id, record in items:
+            if limit is not None and count >= limit:
+                return
+            if not isinstance(record, dict) or (predicate and not predicate(record)):
+                continue
+            count += 1
+            yield item_id, {field: record.get(field) for field in fields}
+
+    def iter_family_members(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None,
+                            descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt thành viên theo trang"""
+        return self._iter_collection("family", after_id, limit, columns, descending=descending)
+
+    def _event_predicate(self, created_by: Optional[str], participant: Optional[str]) -> Callable[[Dict], bool]:
+        """Điều kiện lọc sự kiện theo người tạo / người tham gia (ID thành viên)"""
+        member = self.get_family_member(participant) if participant else None
+        participant_name = member.get("name") if member else None
+
+        def predicate(event: Dict) -> bool:
+            if created_by and event.get("created_by") != created_by:
+                return False
+            if participant and participant_name not in event.get("participants", []):
+                return False
+            return True
+
+        return predicate
+
+    def iter_events(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                    columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                    participant: Optional[str] = None, descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt sự kiện theo trang"""
+        predicate = self._event_predicate(created_by, participant)
+        return self._iter_collection("events", after_id, limit, columns, predicate, descending)
+
+    def iter_events_by_date(self, after: Optional[Tuple[str, str, int]] = None, limit: Optional[int] = None,
+                            columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                            participant: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt sự kiện theo (ngày, giờ, ID)"""
+        fields = list(columns) if columns else list(self._FIELDS["events"])
+        unknown = [field for field in fields if field not in self._FIELDS["events"]]
+        if unknown:
+            raise ValueError(f"Trường không hợp lệ cho events: {unknown}")
+        predicate = self._event_predicate(created_by, participant)
+
+        def sort_key(event_id: Any, event: Dict) -> Tuple:
+            return (event.get("date") or "", event.get("time") or "", self._id_key(event_id))
+
+        items = sorted(
+            ((sort_key(event_id, event), event_id, event) for event_id, event in self._collection("events").items()
+             if isinstance(event, dict) and predicate(event)),
+            key=lambda item: item[0]
+        )
+        if after is not None:
+            after_key = (after[0], after[1], self._id_key(after[2]))
+            items = [item for item in items if item[0] > after_key]
+        for _, event_id, event in items[:limit]:
+            yield event_id, {field: event.get(field) for field in fields}
+
+    def iter_notes(self, after_id: Optional[str] = None, limit: Optional[int] = None,
+                   columns: Optional[Iterable[str]] = None, created_by: Optional[str] = None,
+                   descending: bool = False) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt ghi chú theo trang"""
+        predicate = (lambda note: note.get("created_by") == created_by) if created_by else None
+        return self._iter_collection("notes", after_id, limit, columns, predicate, descending)
+
+    def iter_chat_history(self, member_id: str, after_id: Optional[str] = None, limit: Optional[int] = None,
+                          columns: Optional[Iterable[str]] = None) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt các cuộc trò chuyện của thành viên, mới nhất trước"""
+        fields = list(columns) if columns else ["timestamp", "summary", "messages"]
+        entries = self.get_chat_summaries(member_id, limit=self.max_conversations)
+        if after_id is not None:
+            positions = [entry["id"] for entry in entries]
+            entries = entries[positions.index(after_id) + 1:] if after_id in positions else []
+        for entry in entries[:limit]:
+            record = dict(entry)
+            if "messages" in fields:
+                conversation = self.get_conversation(member_id, entry["id"]) or {}
+                record["messages"] = conversation.get("messages", [])
+            yield entry["id"], {field: record.get(field) for field in fields}
+
+    # === Tìm kiếm ===
+    SEARCH_KINDS = ("note", "event", "chat")
+
+    @abstractmethod
+    def _iter_chat_summaries(self) -> Iterator[Tuple[str, Dict]]:
+        """Duyệt (member_id, tóm tắt cuộc trò chuyện) của mọi thành viên"""
+
+    def search(self, query: str, kinds: Optional[Iterable[str]] = None, limit: int = 20,
+               member_id: Optional[str] = None) -> List[Dict]:
+        """Tìm kiếm không phân biệt dấu bằng cách duyệt dữ liệu trong bộ nhớ"""
+        kinds = list(kinds) if kinds else list(self.SEARCH_KINDS)
+        unknown = [kind for kind in kinds if kind not in self.SEARCH_KINDS]
+        if unknown:
+            raise ValueError(f"Loại tìm kiếm không hợp lệ: {unknown}")
+        terms = re.findall(r"\w+", fold_vietnamese(query or ""))
+        if not terms:
+            return []
+
+        def score(*texts: Any) -> int:
+            """Số từ khớp (khớp tiền tố); 0 nếu thiếu một từ tìm kiếm nào đó"""
+            tokens = re.findall(r"\w+", fold_vietnamese(" ".join(str(text or "") for text in texts)))
+            matches = [sum(1 for token in tokens if token.startswith(term)) for term in terms]
+            return sum(matches) if all(matches) else 0
+
+        hits = []
+        if "note" in kinds:
+            for note_id, note in self.get_all_notes().items():
+                matched = score(note.get("title"), note.get("content"), " ".join(map(str, note.get("tags", []))))
+                if matched:
+                    hits.append({"kind": "note", "id": note_id, "title": note.get("title"), "text": note.get("content"),
+                                 "created_by": note.get("created_by"), "score": -matched})
+        if "event" in kinds:
+            for event_id, event in self.get_all_events().items():
+                matched = score(event.get("title"), event.get("description"))
+                if matched:
+                    hits.append({"kind": "event", "id": event_id, "title": event.get("title"),
+                                 "text": event.get("description"), "date": event.get("date"),
+                                 "time": event.get("time"), "score": -matched})
+        if "chat" in kinds:
+            for owner, entry in self._iter_chat_summaries():
+                if member_id is not None and owner != member_id:
+                    continue
+                matched = score(entry.get("summary"))
+                if matched:
+                    hits.append({"kind": "chat", "id": entry.get("id"), "title": entry.get("timestamp"),
+                                 "text": entry.get("summary"), "member_id": owner, "score": -matched})
+
+        hits.sort(key=lambda hit: hit["score"])
+        return hits[:limit]
+
+
+class JsonStorageBackend(DictStorageBackend):
+    """Backend lưu dữ liệu trong các file JSON (kèm journal) như bản app.py ban đầu"""
+
+    def __init__(self, data_dir: str = ".",
+                 family_file: str = "family_data.json",
+                 events_file: str = "events_data.json",
+                 notes_file: str = "notes_data.json",
+                 chat_dir: str = "chat_history",
+                 legacy_chat_file: str = "chat_history.json",
+                 max_conversations: int = 10):
+        """Khởi tạo backend với các file dữ liệu trong data_dir"""
+        super().__init__()
+        self.data_dir = data_dir
+        self.max_conversations = max_conversations
+        self._stores = {
+            "family": JsonStore.get(os.path.join(data_dir, family_file)),
+            "events": JsonStore.get(os.path.join(data_dir, events_file)),
+            "notes": JsonStore.get(os.path.join(data_dir, notes_file)),
+        }
+        self.chat = ChatHistoryStore.get(
+            os.path.join(data_dir, chat_dir),
+            legacy_file=os.path.join(data_dir, legacy_chat_file)
+        )
+        self._verify_data_structure()
+
+    def _verify_data_structure(self) -> None:
+        """Xóa các thành viên không đúng định dạng (chỉ ghi khi thực sự có thay đổi)"""
+        family = self._collection("family")
+        for member_id in [key for key, member in family.items() if not isinstance(member, dict)]:
+            logger.warning(f"Dữ liệu thành viên ID={member_id} không đúng định dạng. Đã xóa.")
+            self._delete("family", [member_id])
+
+    def _collection(self, name: str) -> Dict[str, Dict]:
+        with self.lock:
+            return self._stores[name].load()
+
+    def _set(self, name: str, path: List[str], value: Any) -> None:
+        with self.lock:
+            self._remember(name, path)
+            self._stores[name].set(path, value)
+
+    def _delete(self, name: str, path: List[str]) -> None:
+        with self.lock:
+            self._remember(name, path)
+            self._stores[name].delete(path)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Giữ thêm khóa của từng file để luồng ghi nền không ghi một phần khối xuống đĩa"""
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(self.lock)
+            for store in self._stores.values():
+                stack.enter_context(store.lock)
+            yield
+
+    # === Lịch sử chat ===
+    def get_chat_history(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy lịch sử chat của một thành viên"""
+        result = []
+        for entry in self.chat.get_index(member_id)[:limit]:
+            conversation = self.chat.get_conversation(member_id, entry["id"])
+            if conversation:
+                result.append({
+                    "id": entry["id"],
+                    "timestamp": conversation.get("timestamp", ""),
+                    "messages": conversation.get("messages", []),
+                    "summary": conversation.get("summary", "")
+                })
+        return result
+
+    def get_chat_summaries(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy danh sách cuộc trò chuyện từ file chỉ mục"""
+        return self.chat.get_index(member_id)[:limit]
+
+    def _iter_chat_summaries(self) -> Iterator[Tuple[str, Dict]]:
+        for member_id in list(self.chat.index.load()):
+            for entry in self.chat.get_index(member_id):
+                yield member_id, entry
+
+    def get_conversation(self, member_id: str, conversation_id: str) -> Optional[Dict]:
+        """Lấy một cuộc trò chuyện theo ID"""
+        return self.chat.get_conversation(member_id, conversation_id)
+
+    def save_chat_history(self, member_id: str, messages: List[Dict], summary: Optional[str] = None,
+                          conversation_id: Optional[str] = None) -> bool:
+        """Lưu lịch sử chat, chỉ nối các tin nhắn mới vào file của thành viên"""
+        try:
+            self.chat.save(member_id, conversation_id or uuid.uuid4().hex, messages, summary)
+            return True
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu lịch sử chat cho thành viên ID={member_id}: {e}")
+            return False
+
+    def close(self) -> None:
+        """Ghi nốt các thay đổi đang chờ xuống đĩa"""
+        BackgroundWriter.instance().flush_all()
+
+
+class MemoryStorageBackend(DictStorageBackend):
+    """Backend chỉ giữ dữ liệu trong bộ nhớ (thử nghiệm, đo hiệu năng)"""
+
+    def __init__(self, max_conversations: int = 10):
+        """Khởi tạo backend rỗng"""
+        super().__init__()
+        self.max_conversations = max_conversations
+        self._data: Dict[str, Dict[str, Dict]] = {"family": {}, "events": {}, "notes": {}}
+        # {member_id: [cuộc trò chuyện, mới nhất trước]}
+        self._conversations: Dict[str, List[Dict]] = {}
+
+    def _collection(self, name: str) -> Dict[str, Dict]:
+        with self.lock:
+            return self._data[name]
+
+    def _set(self, name: str, path: List[str], value: Any) -> None:
+        with self.lock:
+            self._remember(name, path)
+            parent = self._data[name]
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[path[-1]] = value
+
+    def _delete(self, name: str, path: List[str]) -> None:
+        with self.lock:
+            self._remember(name, path)
+            parent = self._data[name]
+            for key in path[:-1]:
+                parent = parent.get(key, {})
+            parent.pop(path[-1], None)
+
+    # === Lịch sử chat ===
+    def get_chat_history(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy lịch sử chat của một thành viên"""
+        return [dict(conversation) for conversation in self._conversations.get(member_id, [])[:limit]]
+
+    def get_chat_summaries(self, member_id: str, limit: int = 10) -> List[Dict]:
+        """Lấy danh sách cuộc trò chuyện, không kèm tin nhắn"""
+        return [
+            {"id": c["id"], "timestamp": c["timestamp"], "summary": c["summary"]}
+            for c in self._conversations.get(member_id, [])[:limit]
+        ]
+
+    def _iter_chat_summaries(self) -> Iterator[Tuple[str, Dict]]:
+        for member_id, conversations in list(self._conversations.items()):
+            for conversation in conversations:
+                yield member_id, conversation
+
+    def get_conversation(self, member_id: str, conversation_id: str) -> Optional[Dict]:
+        """Lấy một cuộc trò chuyện theo ID"""
+        for conversation in self._conversations.get(member_id, []):
+            if conversation["id"] == conversation_id:
+                return dict(conversation)
+        return None
+
+    def save_chat_history(self, member_id: str, messages: List[Dict], summary: Optional[str] = None,
+                          conversation_id: Optional[str] = None) -> bool:
+        """Lưu lịch sử chat cho một thành viên"""
+        with self.lock:
+            conversation_id = conversation_id or uuid.uuid4().hex
+            conversations = [c for c in self._conversations.get(member_id, []) if c["id"] != conversation_id]
+            conversations.insert(0, {
+                "id": conversation_id,
+                "timestamp": self._now(),
+                "messages": list(messages),
+                "summary": summary or ""
+            })
+            self._conversations[member_id] = conversations[:self.max_conversations]
+            return True
+
+    def close(self) -> None:
+        """Không có tài nguyên cần giải phóng"""
+
+
+def create_storage_backend(backend: str = "json", db_path: str = "family_assistant.db",
+                           data_dir: str = ".", synchronous: str = "NORMAL",
+                           compression: str = "zlib") -> StorageBackend:
+    """
+    Tạo backend lưu trữ theo cấu hình.
+
+    backend: "json" (mặc định, các file JSON trong data_dir), "sqlite"
+    (DatabaseManager tại db_path, chế độ WAL với mức synchronous cho trước,
+    tin nhắn được nén theo `compression`) hoặc "memory".
+    """
+    backend = (backend or "json").lower()
+    if backend == "sqlite":
+        from .db_manager import DatabaseManager
+        return DatabaseManager(db_path, synchronous=synchronous, compression=compression)
+    if backend == "memory":
+        return MemoryStorageBackend()
+    if backend == "json":
+        return JsonStorageBackend(data_dir)
+    raise ValueError(f"Backend lưu trữ không hợp lệ: {backend}")
@@ -9,7 +9,7 @@ import json
 import base64
 from io import BytesIO
 from PIL import Image
-from typing import Dict, List, Optional, Any, Union, Callable
+from typing import Dict, List, Optional, Any, Union, Callable, Tuple
 import hashlib
 import random
 
@@ -18,6 +18,42 @@ class UIComponents:
     Lớp cung cấp các thành phần giao diện người dùng tái sử dụng
     """
     
+    PAGE_SIZE = 20  # Số mục hiển thị mỗi trang trong các danh sách
+    
+    @staticmethod
+    def fetch_page(key: str, fetch: Callable[..., Any], page_size: int = PAGE_SIZE) -> Tuple[List[Tuple[str, Dict]], bool]:
+        """
+        Lấy trang hiện tại của một danh sách theo keyset (after_id, limit).
+        
+        Con trỏ (khóa của mục cuối các trang trước) được lưu trong session_state theo
+        `key`; chỉ page_size + 1 bản ghi được đọc để biết còn trang sau hay không.
+        """
+        cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+        items = list(fetch(after_id=cursors[-1], limit=page_size + 1))
+        return items[:page_size], len(items) > page_size
+    
+    @staticmethod
+    def page_controls(key: str, items: List[Tuple[str, Dict]], has_next: bool,
+                      cursor: Callable[[Tuple[str, Dict]], Any] = lambda item: item[0]):
+        """
+        Hiển thị nút chuyển trang cho danh sách đã lấy bằng fetch_page.
+        
+        `cursor` tính con trỏ của trang sau từ mục cuối (mặc định: ID).
+        """
+        cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+        if len(cursors) == 1 and not has_next:
+            return
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if len(cursors) > 1 and st.button("← Trang trước", key=f"{key}_prev"):
+                cursors.pop()
+                st.rerun()
+        with col2:
+            if has_next and items and st.button("Trang sau →", key=f"{key}_next"):
+                cursors.append(cursor(items[-1]))
+                st.rerun()
+    
     @staticmethod
     def get_image_base64(image_raw: Image.Image) -> str:
         """Chuyển đổi hình ảnh sang base64"""
@@ -110,12 +146,12 @@ class UIComponents:
         
         # Xem và chỉnh sửa thành viên gia đình
         with st.expander("👥 Thành viên gia đình"):
-            family_data = db_manager.get_all_family_members()
+            members_page, has_next = UIComponents.fetch_page("members", db_manager.iter_family_members)
             
-            if not family_data:
+            if not members_page:
                 st.write("Chưa có thành viên nào trong gia đình")
             else:
-                for member_id, member in family_data.items():
+                for member_id, member in members_page:
                     # Hiển thị thông tin thành viên
                     st.markdown(f"""
                     <div class="member-card">
@@ -141,6 +177,8 @@ class UIComponents:
                     if st.button(f"Chỉnh sửa {member['name']}", key=f"edit_{member_id}"):
                         st.session_state.editing_member = member_id
                         st.rerun()
+                
+                UIComponents.page_controls("members", members_page, has_next)
         
         # Form chỉnh sửa thành viên (xuất hiện khi đang chỉnh sửa)
         if "editing_member" in st.session_state and st.session_state.editing_member:
@@ -201,9 +239,8 @@ class UIComponents:
                 event_time = st.time_input("Giờ")
                 event_desc = st.text_area("Mô tả")
                 
-                # Multi-select cho người tham gia
-                family_data = db_manager.get_all_family_members()
-                member_names = [member.get("name", "") for member_id, member in family_data.items()]
+                # Multi-select cho người tham gia (chỉ đọc cột tên)
+                member_names = [member.get("name", "") for member_id, member in db_manager.iter_family_members(columns=["name"])]
                 participants = st.multiselect("Người tham gia", member_names)
                 
                 add_event_submitted = st.form_submit_button("Thêm sự kiện")
@@ -231,42 +268,25 @@ class UIComponents:
                 disabled=not current_member
             )
             
-            # Lấy tất cả sự kiện và lọc theo chế độ
-            events_data = db_manager.get_all_events()
-            display_events = {}
-            
-            if current_member:
-                member = db_manager.get_family_member(current_member)
-                current_member_name = member.get("name", "") if member else ""
-                
-                if mode == "Sự kiện của tôi":
-                    display_events = {
-                        event_id: event for event_id, event in events_data.items()
-                        if event.get("created_by") == current_member
-                    }
-                elif mode == "Sự kiện tôi tham gia" and current_member_name:
-                    display_events = {
-                        event_id: event for event_id, event in events_data.items()
-                        if current_member_name in event.get("participants", [])
-                    }
-                else:
-                    display_events = events_data
-            else:
-                display_events = events_data
+            # Chỉ lấy trang sự kiện đang hiển thị, lọc theo chế độ ngay trong truy vấn
+            filters = {}
+            if current_member and mode == "Sự kiện của tôi":
+                filters["created_by"] = current_member
+            elif current_member and mode == "Sự kiện tôi tham gia":
+                filters["participant"] = current_member
             
-            # Sắp xếp sự kiện theo ngày
-            try:
-                sorted_events = sorted(
-                    display_events.items(),
-                    key=lambda x: (x[1].get("date", ""), x[1].get("time", ""))
-                )
-            except Exception as e:
-                st.error(f"Lỗi khi sắp xếp sự kiện: {e}")
-                sorted_events = []
+            # Phân trang theo (ngày, giờ, ID) nên thứ tự ngày đúng trên mọi trang
+            page_key = f"events_{mode}_{current_member}"
+            sorted_events, has_next = UIComponents.fetch_page(
+                page_key, lambda after_id, limit: db_manager.iter_events_by_date(after=after_id, limit=limit, **filters)
+            )
             
             if not sorted_events:
                 st.write("Không có sự kiện nào")
             
+            # Tên người tạo của cả trang được lấy trong một lần đọc
+            creator_names = db_manager.get_member_names(event.get('created_by') for _, event in sorted_events)
+            
             for event_id, event in sorted_events:
                 # Định dạng ngày giờ
                 event_date = event.get('date', 'Chưa đặt ngày')
@@ -307,8 +327,7 @@ class UIComponents:
                 
                 # Hiển thị người tạo
                 if event.get('created_by'):
-                    creator = db_manager.get_family_member(event.get('created_by'))
-                    creator_name = creator.get("name", "") if creator else ""
+                    creator_name = creator_names.get(str(event.get('created_by')), "")
                     if creator_name:
                         st.markdown(f"""
                         <div class="event-creator">👤 Tạo bởi: {creator_name}</div>
@@ -330,6 +349,11 @@ class UIComponents:
                             st.rerun()
                         else:
                             st.error("Không thể xóa sự kiện.")
+            
+            UIComponents.page_controls(
+                page_key, sorted_events, has_next,
+                cursor=lambda item: (item[1].get("date") or "", item[1].get("time") or "", item[0])
+            )
         
         # Form chỉnh sửa sự kiện (xuất hiện khi đang chỉnh sửa)
         if "editing_event" in st.session_state and st.session_state.editing_event:
@@ -360,9 +384,8 @@ class UIComponents:
                     new_time = st.time_input("Giờ", event_time_obj)
                     new_desc = st.text_area("Mô tả", event["description"])
                     
-                    # Multi-select cho người tham gia
-                    family_data = db_manager.get_all_family_members()
-                    member_names = [member.get("name", "") for member_id, member in family_data.items()]
+                    # Multi-select cho người tham gia (chỉ đọc cột tên)
+                    member_names = [member.get("name", "") for member_id, member in db_manager.iter_family_members(columns=["name"])]
                     new_participants = st.multiselect("Người tham gia", member_names, default=event.get("participants", []))
                     
                     save_event_edits = st.form_submit_button("Lưu")
@@ -419,22 +442,17 @@ class UIComponents:
         
         # Xem ghi chú
         with st.expander("📋 Danh sách ghi chú"):
-            # Lấy tất cả ghi chú
-            notes_data = db_manager.get_all_notes()
-            
-            # Lọc ghi chú theo người dùng hiện tại
-            if current_member:
-                filtered_notes = {
-                    note_id: note for note_id, note in notes_data.items()
-                    if note.get("created_by") == current_member
-                }
-            else:
-                filtered_notes = notes_data
+            # Chỉ lấy trang ghi chú đang hiển thị (mới nhất trước), lọc theo người dùng hiện tại
+            page_key = f"notes_{current_member}"
+            notes_page, has_next = UIComponents.fetch_page(
+                page_key,
+                lambda **page: db_manager.iter_notes(**page, created_by=current_member, descending=True)
+            )
             
-            # Sắp xếp ghi chú theo ngày tạo
+            # Sắp xếp ghi chú của trang theo ngày tạo
             try:
                 sorted_notes = sorted(
-                    filtered_notes.items(),
+                    notes_page,
                     key=lambda x: x[1].get("created_on", ""),
                     reverse=True
                 )
@@ -445,6 +463,9 @@ class UIComponents:
             if not sorted_notes:
                 st.write("Không có ghi chú nào")
             
+            # Tên người tạo của cả trang được lấy trong một lần đọc
+            creator_names = db_manager.get_member_names(note.get('created_by') for _, note in sorted_notes)
+            
             for note_id, note in sorted_notes:
                 # Hiển thị thông tin ghi chú
                 st.markdown(f"""
@@ -469,8 +490,7 @@ class UIComponents:
                 
                 # Hiển thị người tạo
                 if note.get('created_by'):
-                    creator = db_manager.get_family_member(note.get('created_by'))
-                    creator_name = creator.get("name", "") if creator else ""
+                    creator_name = creator_names.get(str(note.get('created_by')), "")
                     if creator_name:
                         st.markdown(f"""
                         <div class="note-creator">👤 Tạo bởi: {creator_name}</div>
@@ -486,6 +506,8 @@ class UIComponents:
                         st.rerun()
                     else:
                         st.error("Không thể xóa ghi chú.")
+            
+            UIComponents.page_controls(page_key, notes_page, has_next)
     
     @staticmethod
     def fallback_suggested_questions(member_id: Optional[str] = None, max_questions: int = 5) -> List[str]:
@@ -74,11 +74,22 @@ class DateUtils:
             return date_str
     
     @staticmethod
-    def get_upcoming_events(events_data: Dict[str, Dict], days_ahead: int = 14) -> List[Dict]:
-        """Lọc và trả về các sự kiện sắp diễn ra trong khoảng thời gian cụ thể"""
+    def get_upcoming_events(events_data: Any, days_ahead: int = 14, member_id: Optional[str] = None) -> List[Dict]:
+        """
+        Lọc và trả về các sự kiện sắp diễn ra trong khoảng thời gian cụ thể
+        
+        events_data có thể là từ điển sự kiện hoặc một backend lưu trữ; với
+        backend, chỉ các sự kiện trong khoảng ngày được truy vấn (đã sắp xếp)
+        và có thể lọc theo member_id.
+        """
         today = datetime.datetime.now().date()
         upcoming = []
         
+        if hasattr(events_data, "get_events_between"):
+            events_data = events_data.get_events_between(
+                today, today + datetime.timedelta(days=days_ahead), member_id
+            )
+        
         for event_id, event in events_data.items():
             try:
                 event_date = datetime.datetime.strptime(event.get("date", ""), "%Y-%m-%d").date()
@@ -183,6 +194,18 @@ class ConfigManager:
             
             if "database" in streamlit_secrets:
                 secrets["db_path"] = streamlit_secrets["database"].get("path", "family_assistant.db")
+                secrets["storage_backend"] = streamlit_secrets["database"].get("backend", "")
+                secrets["data_dir"] = streamlit_secrets["database"].get("data_dir", "")
+                secrets["db_synchronous"] = streamlit_secrets["database"].get("synchronous", "")
+                secrets["db_slow_query_ms"] = streamlit_secrets["database"].get("slow_query_ms", "")
+                secrets["db_compression"] = streamlit_secrets["database"].get("compression", "")
+                secrets["db_backup_dir"] = streamlit_secrets["database"].get("backup_dir", "")
+                secrets["db_backup_interval_hours"] = streamlit_secrets["database"].get("backup_interval_hours", "")
+                secrets["db_backup_keep"] = streamlit_secrets["database"].get("backup_keep", "")
+                secrets["db_maintenance_interval_hours"] = streamlit_secrets["database"].get("maintenance_interval_hours", "")
+                secrets["db_chat_retention_days"] = streamlit_secrets["database"].get("chat_retention_days", "")
+                secrets["db_event_retention_days"] = streamlit_secrets["database"].get("event_retention_days", "")
+                secrets["db_changes_retention_days"] = streamlit_secrets["database"].get("changes_retention_days", "")
         
         # Thử lấy từ biến môi trường nếu chưa có
         if "openai_api_key" not in secrets or not secrets["openai_api_key"]:
@@ -194,6 +217,50 @@ class ConfigManager:
         if "db_path" not in secrets:
             secrets["db_path"] = os.environ.get("DB_PATH", "family_assistant.db")
         
+        # Backend lưu trữ: "json" (mặc định), "sqlite" hoặc "memory"
+        if not secrets.get("storage_backend"):
+            secrets["storage_backend"] = os.environ.get("STORAGE_BACKEND", "json")
+        
+        if not secrets.get("data_dir"):
+            secrets["data_dir"] = os.environ.get("DATA_DIR", ".")
+        
+        # Mức PRAGMA synchronous của SQLite (NORMAL là an toàn với chế độ WAL)
+        if not secrets.get("db_synchronous"):
+            secrets["db_synchronous"] = os.environ.get("DB_SYNCHRONOUS", "NORMAL")
+        
+        # Cách nén nội dung tin nhắn trong SQLite: "zlib" (mặc định), "lzma" hoặc "none"
+        if not secrets.get("db_compression"):
+            secrets["db_compression"] = os.environ.get("DB_COMPRESSION", "zlib")
+        
+        # Ngưỡng (ms) ghi log truy vấn chậm; để trống thì tắt đo hiệu năng database
+        if not secrets.get("db_slow_query_ms"):
+            secrets["db_slow_query_ms"] = os.environ.get("DB_SLOW_QUERY_MS", "")
+        
+        # Sao lưu định kỳ database SQLite; để trống thư mục thì không sao lưu
+        if not secrets.get("db_backup_dir"):
+            secrets["db_backup_dir"] = os.environ.get("DB_BACKUP_DIR", "")
+        
+        if not secrets.get("db_backup_interval_hours"):
+            secrets["db_backup_interval_hours"] = os.environ.get("DB_BACKUP_INTERVAL_HOURS", "24")
+        
+        if not secrets.get("db_backup_keep"):
+            secrets["db_backup_keep"] = os.environ.get("DB_BACKUP_KEEP", "7")
+        
+        # Bảo trì định kỳ database SQLite (incremental vacuum, PRAGMA optimize); mặc định "0" là tắt
+        if not secrets.get("db_maintenance_interval_hours"):
+            secrets["db_maintenance_interval_hours"] = os.environ.get("DB_MAINTENANCE_INTERVAL_HOURS", "0")
+        
+        # Thời gian lưu lịch sử chat / sự kiện đã qua (ngày); để trống thì giữ lại tất cả
+        if not secrets.get("db_chat_retention_days"):
+            secrets["db_chat_retention_days"] = os.environ.get("DB_CHAT_RETENTION_DAYS", "")
+        
+        if not secrets.get("db_event_retention_days"):
+            secrets["db_event_retention_days"] = os.environ.get("DB_EVENT_RETENTION_DAYS", "")
+        
+        # Số ngày giữ nhật ký thay đổi (bảng changes) cho các subscriber
+        if not secrets.get("db_changes_retention_days"):
+            secrets["db_changes_retention_days"] = os.environ.get("DB_CHANGES_RETENTION_DAYS", "7")
+        
         return secrets
     
     @staticmethod